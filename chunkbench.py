@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+""" httpclient.utils.ChunkedIter benchmark """
+import argparse
+import io
+import os
+import time
+
+from httpclient import utils
+
+
+class OldChunkedIter:
+    """BytesIO based implementation, for comparison."""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size
+
+    def write(self, stream):
+        if isinstance(stream, bytes):
+            stream = (stream,)
+        stream = iter(stream)
+
+        buf = io.BytesIO()
+        while True:
+            while buf.tell() < self.chunk_size:
+                try:
+                    data = next(stream)
+                    buf.write(data)
+                except StopIteration:
+                    yield buf.getvalue()
+                    return
+
+            data = buf.getvalue()
+            chunk, rest = data[:self.chunk_size], data[self.chunk_size:]
+            buf = io.BytesIO()
+            buf.write(rest)
+
+            yield chunk
+
+
+def pieces(total, piece):
+    data = os.urandom(piece)
+    for _ in range(total // piece):
+        yield data
+
+
+def bench(name, chunker, stream, total):
+    start = time.perf_counter()
+    size = 0
+    for chunk in chunker.write(stream):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    assert size == total, (size, total)
+    print('%-8s %12.1f MB/s %8.2f s' % (
+        name, total / elapsed / (1 << 20), elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--total', type=int, default=1 << 30,
+        help='bytes of input in small pieces (default 1 GB)')
+    parser.add_argument(
+        '--piece', type=int, default=4096,
+        help='size of input piece (default 4096)')
+    parser.add_argument(
+        '--single', type=int, default=64 << 20,
+        help='size of input given as one piece (default 64 MB)')
+    parser.add_argument(
+        'chunk_sizes', nargs='*', type=int,
+        default=[1024, 8192, 65536, 1 << 20])
+    args = parser.parse_args()
+
+    for chunk_size in args.chunk_sizes:
+        print('chunk size %d, %d bytes in %d byte pieces' % (
+            chunk_size, args.total, args.piece))
+        for name, cls in (('old', OldChunkedIter),
+                          ('new', utils.ChunkedIter)):
+            bench(name, cls(chunk_size),
+                  pieces(args.total, args.piece), args.total)
+
+        print('chunk size %d, %d bytes in one piece' % (
+            chunk_size, args.single))
+        data = os.urandom(args.single)
+        # old implementation copies rest of input for every chunk
+        if args.single // chunk_size <= 1024:
+            bench('old', OldChunkedIter(chunk_size), data, args.single)
+        else:
+            print('old      skipped, %d chunks of quadratic copying' % (
+                args.single // chunk_size))
+        bench('new', utils.ChunkedIter(chunk_size), data, args.single)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,365 @@
 #!/usr/bin/env python3
 
+import argparse
+import codecs
+import collections
 import logging
+import os
 import re
 import signal
-import sys
+import tempfile
+import time
 import urllib.parse
 
 import tulip
 import httpclient
 
+import crawlstore
+
 END = '\n'
 MAXTASKS = 100
+MAXPERHOST = 10
+CHUNK_SIZE = 64 * 1024
+FRONTIER_WINDOW = 10000  # urls loaded from frontier file to memory
+CHECKPOINT_INTERVAL = 10.0
+
+
+class LinkExtractor:
+    """Incremental href extractor, takes body chunks as they arrive.
+
+    Text is scanned up to the last '<', the possibly incomplete tag is
+    kept for the next chunk. Links are resolved against <base href>
+    when document has one and reported once per document.
+    """
+
+    HREF = re.compile(r'(?i)href=["\']?([^\s"\'<>]+)')
+    BASE = re.compile(r'(?i)<base\s[^>]*?href=["\']?([^\s"\'<>]+)')
+    CHARSET = re.compile(r'(?i)charset=["\']?([-\w.:]+)')
+    MAXTAIL = 64 * 1024
+
+    def __init__(self, url, content_type=''):
+        self.base = url
+        self.seen = set()
+        self._tail = ''
+
+        charset = self.CHARSET.search(content_type)
+        try:
+            decoder = codecs.getincrementaldecoder(
+                charset.group(1) if charset else 'utf-8')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')
+        self._decoder = decoder('replace')
+
+    def feed(self, data):
+        """Returns list of new links found in data."""
+        text = self._tail + self._decoder.decode(data)
+
+        pos = text.rfind('<')
+        if pos < 0:
+            self._tail = ''
+        else:
+            text, self._tail = text[:pos], text[pos:]
+            if len(self._tail) > self.MAXTAIL:
+                self._tail = ''
+
+        return self._scan(text)
+
+    def close(self):
+        """Returns links found in rest of document."""
+        text = self._tail + self._decoder.decode(b'', True)
+        self._tail = ''
+        return self._scan(text)
+
+    def _scan(self, text):
+        links = []
+        if not text:
+            return links
+
+        base = self.BASE.search(text)
+        if base is not None:
+            self.base = urllib.parse.urljoin(self.base, base.group(1))
+
+        for link in self.HREF.findall(text):
+            link, frag = urllib.parse.urldefrag(
+                urllib.parse.urljoin(self.base, link))
+            if link not in self.seen:
+                self.seen.add(link)
+                links.append(link)
+
+        return links
+
+
+class HostScheduler:
+    """Work queue that hands out urls round-robin across hosts.
+
+    At most per_host items of a host are in work at the same time and
+    consecutive items of a host are started at least delay seconds apart.
+    Workers are never blocked by a slow host while other hosts have work.
+    """
+
+    def __init__(self, per_host=MAXPERHOST, delay=0.0):
+        self.per_host = per_host
+        self.delay = delay
+
+        self._pending = {}
+        self._hosts = collections.deque()  # hosts with pending items
+        self._active = collections.Counter()
+        self._next_start = {}  # entries in the past are pruned
+        self._prune_size = 1024
+        self._size = 0
+        self._unfinished = 0
+        self._waiters = []
+        self._joiners = []
+
+    def qsize(self):
+        return self._size
+
+    def put(self, host, item):
+        items = self._pending.get(host)
+        if items is None:
+            items = self._pending[host] = collections.deque()
+            self._hosts.append(host)
+
+        items.append(item)
+        self._size += 1
+        self._unfinished += 1
+        self._wakeup()
+
+    def _get_ready(self, now):
+        """Returns (host, item) of next ready host or earliest time
+        some host will be ready."""
+        earliest = None
+
+        for _ in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+
+            if self._active[host] >= self.per_host:
+                continue
+
+            start = self._next_start.get(host, 0)
+            if start > now:
+                if earliest is None or start < earliest:
+                    earliest = start
+                continue
+
+            items = self._pending[host]
+            item = items.popleft()
+            self._size -= 1
+            if not items:
+                del self._pending[host]
+                self._hosts.pop()
+
+            self._active[host] += 1
+            self._next_start[host] = now + self.delay
+            return (host, item), None
+
+        return None, earliest
+
+    @tulip.coroutine
+    def get(self):
+        event_loop = tulip.get_event_loop()
+
+        while True:
+            now = time.monotonic()
+            ready, earliest = self._get_ready(now)
+            if ready is not None:
+                return ready
+
+            waiter = tulip.Future()
+            self._waiters.append(waiter)
+
+            timer = None
+            if earliest is not None:
+                timer = event_loop.call_later(earliest - now, self._wakeup)
+            try:
+                yield from waiter
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def task_done(self, host):
+        self._active[host] -= 1
+        if not self._active[host]:
+            del self._active[host]
+
+        # start time of idle host is kept until delay passes
+        if len(self._next_start) > self._prune_size:
+            now = time.monotonic()
+            self._next_start = dict(
+                (other, start) for other, start in self._next_start.items()
+                if start > now)
+            self._prune_size = max(1024, 2 * len(self._next_start))
+
+        self._unfinished -= 1
+        if not self._unfinished:
+            joiners, self._joiners = self._joiners, []
+            for fut in joiners:
+                if not fut.done():
+                    fut.set_result(None)
+
+        self._wakeup()
+
+    @tulip.coroutine
+    def join(self):
+        if self._unfinished:
+            fut = tulip.Future()
+            self._joiners.append(fut)
+            yield from fut
+
+    def _wakeup(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
 
 
 class Crawler:
 
-    def __init__(self, rooturl):
+    def __init__(self, rooturl, *, concurrency=MAXTASKS,
+                 max_depth=None, max_pages=None,
+                 per_host=MAXPERHOST, delay=0.0,
+                 seen=None, frontier=None, window=FRONTIER_WINDOW,
+                 spill_dir=None,
+                 checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL):
         self.rooturl = rooturl
-        self.busy = set()
-        self.done = {}
-        self.tasks = set()
-        self.sem = tulip.Semaphore(MAXTASKS)
-        self.addurls(((rooturl, ''),))  # Set initial work.
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.busy = 0
+        self.done = 0
+        self.ok = 0
+        self.scheduled = 0
+        self.workers = set()
+        self.scheduler = HostScheduler(per_host, delay)
+
+        # seen urls, see crawlstore.seen_set()
+        if seen is None:
+            seen = crawlstore.seen_set('hash')
+        self.seen = seen
+
+        # optional crawlstore.FileFrontier, keeps pending urls on disk,
+        # without it urls over window are spilled to temporary
+        # frontier file in spill_dir
+        self.frontier = frontier
+        self.window = window
+        self.spill_dir = spill_dir
+        self._spill_path = None
+
+        # optional crawlstore.Checkpoint, log of added and completed urls
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+
+        self.addurls(((rooturl, ''),), 0)  # Set initial work.
+
+    def resume(self, pending, done, ok):
+        """Continue crawl restored from checkpoint, see
+        crawlstore.Checkpoint.load()."""
+        self.done = done
+        self.ok = ok
+        self.scheduled = done
+        for url, depth in pending:
+            self.busy += 1
+            self.scheduled += 1
+            self.enqueue(url, depth)
+
+        self.refill()
+
+    def addurls(self, urls, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            return
 
-    @tulip.task
-    def addurls(self, urls):
         for url, parenturl in urls:
+            if (self.max_pages is not None and
+                    self.scheduled >= self.max_pages):
+                return
+
             url = urllib.parse.urljoin(parenturl, url)
             url, frag = urllib.parse.urldefrag(url)
-            if (url.startswith(self.rooturl) and
-                    url not in self.busy and url not in self.done):
-                yield from self.sem.acquire()
-                task = self.process(url)
-                task.add_done_callback(lambda t: self.sem.release())
-                task.add_done_callback(self.tasks.remove)
-                self.tasks.add(task)
+            if url.startswith(self.rooturl) and self.seen.add(url):
+                self.busy += 1
+                self.scheduled += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.added(url, depth)
+                self.enqueue(url, depth)
+
+        self.refill()
+
+    def enqueue(self, url, depth):
+        """Queue url in memory while scheduler holds less than window
+        urls, in frontier file otherwise."""
+        if (self.frontier is None and
+                self.scheduler.qsize() >= self.window):
+            fd, self._spill_path = tempfile.mkstemp(
+                prefix='crawl-', suffix='.frontier', dir=self.spill_dir)
+            os.close(fd)
+            self.frontier = crawlstore.FileFrontier(self._spill_path)
+
+        if self.frontier is not None:
+            self.frontier.put(url, depth)
+        else:
+            self.schedule(url, depth)
+
+    def schedule(self, url, depth):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        self.scheduler.put(host, (url, depth))
+
+    def refill(self):
+        """Load pending urls from frontier file."""
+        if self.frontier is not None:
+            size = self.window - self.scheduler.qsize()
+            if size > 0 and len(self.frontier):
+                for url, depth in self.frontier.get_batch(size):
+                    self.schedule(url, depth)
+
+    def close(self):
+        """Remove temporary frontier file."""
+        if self._spill_path is not None:
+            self.frontier.close()
+            os.unlink(self._spill_path)
+            self.frontier = None
+            self._spill_path = None
 
     @tulip.task
     def run(self):
-        yield from tulip.sleep(1)
+        for _ in range(self.concurrency):
+            self.workers.add(self.work())
 
-        while self.busy:
-            yield from tulip.sleep(0.3)
-            print(len(self.done), 'completed tasks,', len(self.tasks),
-                  'still pending   ', end=END)
+        saver = None
+        if self.checkpoint is not None:
+            saver = self.save_checkpoints()
+
+        yield from self.scheduler.join()
+
+        for worker in self.workers:
+            worker.cancel()
+        if saver is not None:
+            saver.cancel()
 
         tulip.get_event_loop().stop()
 
     @tulip.task
-    def process(self, url):
+    def save_checkpoints(self):
+        while True:
+            yield from tulip.sleep(self.checkpoint_interval)
+            self.checkpoint.flush()
+
+    @tulip.task
+    def work(self):
+        while True:
+            host, (url, depth) = yield from self.scheduler.get()
+            try:
+                yield from self.process(url, depth)
+            except Exception as exc:
+                print('...', url, 'has error', repr(str(exc)), end=END)
+            finally:
+                self.refill()
+                self.scheduler.task_done(host)
+
+    @tulip.coroutine
+    def process(self, url, depth):
         ok = False
         response = None
-        self.busy.add(url)
 
         try:
             print('processing:', url, end=END)
@@ -59,7 +367,8 @@ class Crawler:
             delay = 1
             while True:
                 try:
-                    response = yield from httpclient.request('get', url)
+                    response = yield from httpclient.request(
+                        'get', url, stream=True)
                     break
                 except Exception as exc:
                     if delay >= 60:
@@ -69,26 +378,118 @@ class Crawler:
                     yield from tulip.sleep(delay)
                     delay *= 2
 
+            # non-html body is not downloaded, response.close()
+            # drops connection
             if response.status == 200:
                 ctype = response.headers.get_content_type()
                 if ctype == 'text/html':
-                    data = response.content.decode('utf-8', 'replace')
-                    urls = re.findall(r'(?i)href=["\']?([^\s"\'<>]+)', data)
-                    self.addurls([(u, url) for u in urls])
+                    extractor = LinkExtractor(
+                        url, response.headers.get('content-type', ''))
+
+                    for chunk in response.iter_chunks(CHUNK_SIZE):
+                        data = yield from chunk
+                        if data:
+                            urls = extractor.feed(data)
+                        else:
+                            urls = extractor.close()
+                        if urls:
+                            self.addurls([(u, url) for u in urls], depth + 1)
 
             ok = True
         finally:
             if response is not None:
                 response.close()
 
-            self.done[url] = ok
-            if url in self.busy:
-                self.busy.remove(url)
+            self.done += 1
+            self.ok += ok
+            self.busy -= 1
+            if self.checkpoint is not None:
+                self.checkpoint.done(url, ok)
+
+            print(self.done, 'completed tasks,', self.busy,
+                  'still pending   ', end=END)
 
 
 def main():
-    rooturl = sys.argv[1]
-    c = Crawler(rooturl)
+    parser = argparse.ArgumentParser(description='Simple web crawler.')
+    parser.add_argument('rooturl', help='crawl urls starting with rooturl')
+    parser.add_argument(
+        '--concurrency', type=int, default=MAXTASKS,
+        help='number of concurrent workers (default: %(default)s)')
+    parser.add_argument(
+        '--max-depth', type=int, default=None,
+        help='do not follow links deeper than this')
+    parser.add_argument(
+        '--max-pages', type=int, default=None,
+        help='stop after this number of pages')
+    parser.add_argument(
+        '--per-host', type=int, default=MAXPERHOST,
+        help='concurrent requests per host (default: %(default)s)')
+    parser.add_argument(
+        '--delay', type=float, default=0.0,
+        help='seconds between requests to same host (default: %(default)s)')
+    parser.add_argument(
+        '--seen', choices=sorted(crawlstore.SEEN_BACKENDS), default='hash',
+        help='seen urls storage: exact set, 64-bit hash table or '
+             'bloom filter (default: %(default)s)')
+    parser.add_argument(
+        '--bloom-capacity', type=int, default=10000000,
+        help='expected number of urls for bloom filter')
+    parser.add_argument(
+        '--bloom-error', type=float, default=0.001,
+        help='false positive rate of bloom filter')
+    parser.add_argument(
+        '--frontier', metavar='FILE', default=None,
+        help='keep pending urls in FILE instead of memory, by default '
+             'urls over %d are kept in temporary file' % FRONTIER_WINDOW)
+    parser.add_argument(
+        '--checkpoint', metavar='FILE', default=None,
+        help='log crawl progress to FILE')
+    parser.add_argument(
+        '--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+        help='seconds between checkpoint flushes (default: %(default)s)')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='continue crawl saved in --checkpoint FILE')
+    parser.add_argument(
+        '--iocp', action='store_true', help='use IOCP event loop')
+    args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
+
+    if args.iocp:
+        from tulip import events, windows_events
+        logging.info('using iocp')
+        el = windows_events.ProactorEventLoop()
+        events.set_event_loop(el)
+
+    if args.seen == 'bloom':
+        seen = crawlstore.seen_set(
+            'bloom', capacity=args.bloom_capacity,
+            error_rate=args.bloom_error)
+    else:
+        seen = crawlstore.seen_set(args.seen)
+
+    frontier = None
+    if args.frontier:
+        frontier = crawlstore.FileFrontier(args.frontier)
+
+    checkpoint = state = None
+    if args.checkpoint:
+        if args.resume:
+            state = crawlstore.Checkpoint.load(args.checkpoint, seen)
+            print('resuming:', len(state[0]), 'pending,',
+                  state[1], 'completed tasks')
+        checkpoint = crawlstore.Checkpoint(args.checkpoint, args.resume)
+
+    c = Crawler(args.rooturl, concurrency=args.concurrency,
+                max_depth=args.max_depth, max_pages=args.max_pages,
+                per_host=args.per_host, delay=args.delay,
+                seen=seen, frontier=frontier,
+                checkpoint=checkpoint,
+                checkpoint_interval=args.checkpoint_interval)
+    if state is not None:
+        c.resume(*state)
     c.run()
 
     loop = tulip.get_event_loop()
@@ -97,16 +498,17 @@ def main():
     except RuntimeError:
         pass
     loop.run_forever()
-    print('busy:', len(c.busy))
-    print('done:', len(c.done), '; ok:', sum(c.done.values()))
-    print('tasks:', len(c.tasks))
+    print('busy:', c.busy)
+    print('done:', c.done, '; ok:', c.ok)
+    print('seen:', len(c.seen))
+    print('workers:', len(c.workers))
+
+    c.close()
+    if frontier is not None:
+        frontier.close()
+    if checkpoint is not None:
+        checkpoint.close()
 
 
 if __name__ == '__main__':
-    if '--iocp' in sys.argv:
-        from tulip import events, windows_events
-        sys.argv.remove('--iocp')
-        logging.info('using iocp')
-        el = windows_events.ProactorEventLoop()
-        events.set_event_loop(el)
     main()
@@ -0,0 +1,240 @@
+"""Tests for crawl.py"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import tulip
+from tulip import tasks
+
+import crawlstore
+from crawl import Crawler, HostScheduler, LinkExtractor
+
+
+class HostSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def get(self, scheduler):
+        return self.event_loop.run_until_complete(
+            tasks.Task(scheduler.get()))
+
+    def test_round_robin(self):
+        scheduler = HostScheduler()
+        for host, item in [('a', 1), ('a', 2), ('a', 3), ('b', 1),
+                           ('c', 1), ('b', 2)]:
+            scheduler.put(host, item)
+        self.assertEqual(6, scheduler.qsize())
+
+        order = [self.get(scheduler) for _ in range(6)]
+        self.assertEqual([('a', 1), ('b', 1), ('c', 1),
+                          ('a', 2), ('b', 2), ('a', 3)], order)
+        self.assertEqual(0, scheduler.qsize())
+
+    def test_per_host_limit(self):
+        scheduler = HostScheduler(per_host=1)
+        scheduler.put('a', 1)
+        scheduler.put('a', 2)
+        scheduler.put('b', 1)
+
+        self.assertEqual(('a', 1), self.get(scheduler))
+        self.assertEqual(('b', 1), self.get(scheduler))
+
+        task = tasks.Task(scheduler.get())
+        self.event_loop.run_once()
+        self.assertFalse(task.done())
+
+        scheduler.task_done('a')
+        self.assertEqual(('a', 2), self.event_loop.run_until_complete(task))
+
+    def test_delay(self):
+        scheduler = HostScheduler(delay=0.05)
+        scheduler.put('a', 1)
+        scheduler.put('a', 2)
+        scheduler.put('b', 1)
+
+        started = time.monotonic()
+        self.assertEqual(('a', 1), self.get(scheduler))
+        # other host is not delayed
+        self.assertEqual(('b', 1), self.get(scheduler))
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        self.assertEqual(('a', 2), self.get(scheduler))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_delay_after_host_idle(self):
+        scheduler = HostScheduler(delay=0.05)
+        scheduler.put('a', 1)
+
+        started = time.monotonic()
+        self.assertEqual(('a', 1), self.get(scheduler))
+        scheduler.task_done('a')
+
+        # url of idle host queued within delay waits for it
+        scheduler.put('a', 2)
+        ready, earliest = scheduler._get_ready(time.monotonic())
+        self.assertIsNone(ready)
+        self.assertIsNotNone(earliest)
+
+        self.assertEqual(('a', 2), self.get(scheduler))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_prune_start_times(self):
+        scheduler = HostScheduler()
+        scheduler._prune_size = 5
+        for i in range(10):
+            scheduler.put(str(i), i)
+            host, item = self.get(scheduler)
+            scheduler.task_done(host)
+
+        # start times in the past are dropped
+        self.assertLess(len(scheduler._next_start), 10)
+
+    def test_join(self):
+        scheduler = HostScheduler()
+        scheduler.put('a', 1)
+        scheduler.put('b', 1)
+
+        join = tasks.Task(scheduler.join())
+        self.event_loop.run_once()
+        self.assertFalse(join.done())
+
+        self.get(scheduler)
+        self.get(scheduler)
+        scheduler.task_done('a')
+        self.event_loop.run_once()
+        self.assertFalse(join.done())
+
+        scheduler.task_done('b')
+        self.event_loop.run_until_complete(join)
+        self.assertTrue(join.done())
+
+    def test_join_empty(self):
+        self.event_loop.run_until_complete(
+            tasks.Task(HostScheduler().join()))
+
+
+class LinkExtractorTests(unittest.TestCase):
+
+    def test_links(self):
+        extractor = LinkExtractor('http://a/dir/page')
+        self.assertEqual(
+            ['http://a/dir/x', 'http://a/y', 'http://b/z'],
+            extractor.feed(b'<a href="x">1</a> <a href=\'/y\'>2</a> '
+                           b'<a href=http://b/z>3</a> end'))
+        self.assertEqual([], extractor.close())
+
+    def test_tag_split_across_chunks(self):
+        extractor = LinkExtractor('http://a/')
+        self.assertEqual([], extractor.feed(b'<p>text</p><a hr'))
+        self.assertEqual([], extractor.feed(b'ef="/long/pa'))
+        self.assertEqual(['http://a/long/path'],
+                         extractor.feed(b'th">link</a>'))
+
+    def test_link_at_end_of_document(self):
+        extractor = LinkExtractor('http://a/')
+        self.assertEqual([], extractor.feed(b'<a href="/last"'))
+        self.assertEqual(['http://a/last'], extractor.close())
+
+    def test_base_href(self):
+        extractor = LinkExtractor('http://a/dir/page')
+        self.assertEqual(
+            ['http://b/base/', 'http://b/base/x'],
+            extractor.feed(b'<head><base href="http://b/base/"></head>'
+                           b'<a href="x"><p>'))
+        self.assertEqual(['http://b/base/y'],
+                         extractor.feed(b'<a href=y><p>'))
+
+    def test_dedup(self):
+        extractor = LinkExtractor('http://a/')
+        self.assertEqual(['http://a/x'], extractor.feed(
+            b'<a href="/x"><a href="/x#frag"><a href="x"><p>'))
+        self.assertEqual([], extractor.feed(b'<a href="/x"><p>'))
+        self.assertEqual(['http://a/y'],
+                         extractor.feed(b'<a href="/y"><a href="/x">'))
+        self.assertEqual([], extractor.close())
+
+    def test_charset(self):
+        extractor = LinkExtractor('http://a/', 'text/html; charset=cp1251')
+        data = '<a href="/\u0436">'.encode('cp1251')
+        self.assertEqual([], extractor.feed(data))
+        self.assertEqual(['http://a/\u0436'], extractor.close())
+
+    def test_multibyte_split_across_chunks(self):
+        extractor = LinkExtractor('http://a/', 'text/html; charset=utf-8')
+        data = '<a href="/\u0436"><p>'.encode('utf-8')
+        self.assertEqual([], extractor.feed(data[:11]))
+        self.assertEqual(['http://a/\u0436'], extractor.feed(data[11:]))
+
+    def test_unknown_charset(self):
+        extractor = LinkExtractor('http://a/', 'text/html; charset=x-bad')
+        self.assertEqual(['http://a/x'],
+                         extractor.feed(b'<a href="/x"><p>'))
+
+    def test_max_tail(self):
+        extractor = LinkExtractor('http://a/')
+        extractor.MAXTAIL = 10
+        self.assertEqual([], extractor.feed(b'<a title="' + b'x' * 20))
+        self.assertEqual('', extractor._tail)
+
+        # next tags are found after long tag is dropped
+        self.assertEqual(['http://a/y'],
+                         extractor.feed(b'x">text <a href="/y"><p>'))
+        self.assertLessEqual(len(extractor._tail), 10)
+
+
+class CrawlerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_spill_over_window(self):
+        crawler = Crawler('http://a/', window=3, spill_dir=self.dir)
+        crawler.addurls([('http://a/%d' % i, '') for i in range(10)], 1)
+
+        self.assertEqual(3, crawler.scheduler.qsize())
+        self.assertEqual(8, len(crawler.frontier))
+        self.assertEqual(1, len(os.listdir(self.dir)))
+
+        # memory window is refilled from frontier file in order
+        ready, _ = crawler.scheduler._get_ready(time.monotonic())
+        self.assertEqual(('a', ('http://a/', 0)), ready)
+        crawler.refill()
+        self.assertEqual(3, crawler.scheduler.qsize())
+        self.assertEqual(7, len(crawler.frontier))
+
+        crawler.close()
+        self.assertIsNone(crawler.frontier)
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_no_spill_under_window(self):
+        crawler = Crawler('http://a/', window=20, spill_dir=self.dir)
+        crawler.addurls([('http://a/%d' % i, '') for i in range(10)], 1)
+
+        self.assertEqual(11, crawler.scheduler.qsize())
+        self.assertIsNone(crawler.frontier)
+        self.assertEqual([], os.listdir(self.dir))
+        crawler.close()
+
+    def test_given_frontier_not_removed(self):
+        path = os.path.join(self.dir, 'frontier')
+        frontier = crawlstore.FileFrontier(path)
+        self.addCleanup(frontier.close)
+
+        crawler = Crawler('http://a/', window=1, frontier=frontier)
+        crawler.addurls([('http://a/1', '')], 1)
+        crawler.close()
+        self.assertIs(frontier, crawler.frontier)
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
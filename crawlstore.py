@@ -0,0 +1,299 @@
+""" compact url sets and file backed frontier for crawl.py """
+import array
+import hashlib
+import math
+import os
+
+
+def url_hash(url):
+    """128-bit digest of url as two 64-bit ints."""
+    digest = hashlib.md5(url.encode('utf-8', 'surrogateescape')).digest()
+    return (int.from_bytes(digest[:8], 'little'),
+            int.from_bytes(digest[8:], 'little'))
+
+
+class UrlSet:
+    """Exact set of urls, keeps full strings."""
+
+    def __init__(self):
+        self._urls = set()
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def add(self, url):
+        """Add url, returns False if url was in set already."""
+        if url in self._urls:
+            return False
+        self._urls.add(url)
+        return True
+
+
+class HashSet:
+    """Set of 64-bit url hashes in open addressing table.
+
+    Takes 16 to 32 bytes per url, collisions of 64-bit hashes
+    are ignored.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+
+        self._table = array.array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @staticmethod
+    def _hash(url):
+        return url_hash(url)[0] or 1  # 0 marks empty slot
+
+    def _slot(self, h):
+        table = self._table
+        mask = self._mask
+        i = h & mask
+        perturb = h
+        while table[i] and table[i] != h:
+            perturb >>= 5
+            i = (i * 5 + perturb + 1) & mask
+        return i
+
+    def __contains__(self, url):
+        h = self._hash(url)
+        return self._table[self._slot(h)] == h
+
+    def add(self, url):
+        """Add url, returns False if url was in set already."""
+        h = self._hash(url)
+        i = self._slot(h)
+        if self._table[i] == h:
+            return False
+
+        self._table[i] = h
+        self._len += 1
+        if self._len * 2 > len(self._table):
+            self._resize()
+        return True
+
+    def _resize(self):
+        old = self._table
+        self._table = array.array('Q', bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        for h in old:
+            if h:
+                self._table[self._slot(h)] = h
+
+
+class BloomFilter:
+    """Bloom filter of urls, sized for capacity urls with
+    error_rate probability of false positive."""
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nbits = max(8, int(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+
+        self._bits = bytearray((self.nbits + 7) // 8)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _indexes(self, url):
+        h1, h2 = url_hash(url)
+        nbits = self.nbits
+        for i in range(self.nhashes):
+            yield (h1 + i * h2) % nbits
+
+    def __contains__(self, url):
+        bits = self._bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(url))
+
+    def add(self, url):
+        """Add url, returns False if url was (probably) in set already."""
+        bits = self._bits
+        new = False
+        for i in self._indexes(url):
+            mask = 1 << (i & 7)
+            if not bits[i >> 3] & mask:
+                bits[i >> 3] |= mask
+                new = True
+
+        if new:
+            self._len += 1
+        return new
+
+
+SEEN_BACKENDS = {
+    'set': UrlSet,
+    'hash': HashSet,
+    'bloom': BloomFilter,
+}
+
+
+def seen_set(backend='hash', **kwargs):
+    """Create url set, backend is one of 'set', 'hash', 'bloom'."""
+    try:
+        factory = SEEN_BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Unknown seen-set backend: %r' % backend) from None
+    return factory(**kwargs)
+
+
+class FileFrontier:
+    """Append-only file of (url, depth) records.
+
+    Records are written at the end of file and read back in batches
+    from read offset, so only a window of pending urls is kept in memory.
+    Existing file is truncated unless offset to continue from is given.
+    """
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        if offset is None:
+            offset = 0
+            open(path, 'wb').close()
+
+        self._wfile = open(path, 'ab')
+        self._rfile = open(path, 'rb')
+        self._rfile.seek(offset)
+        self._pending = self._count(offset)
+
+    def _count(self, offset):
+        self._wfile.flush()
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+    def __len__(self):
+        return self._pending
+
+    @property
+    def offset(self):
+        """Read offset of first pending record."""
+        return self._rfile.tell()
+
+    def put(self, url, depth):
+        if '\n' in url or '\r' in url:
+            return
+        self._wfile.write(
+            ('%d\t%s\n' % (depth, url)).encode('utf-8', 'surrogateescape'))
+        self._pending += 1
+
+    def get_batch(self, size):
+        """Read up to size pending records."""
+        self._wfile.flush()
+
+        records = []
+        while len(records) < size:
+            line = self._rfile.readline()
+            if not line.endswith(b'\n'):
+                # partial record is not written yet
+                self._rfile.seek(-len(line), os.SEEK_CUR)
+                break
+
+            depth, url = line[:-1].decode(
+                'utf-8', 'surrogateescape').split('\t', 1)
+            records.append((url, int(depth)))
+
+        self._pending -= len(records)
+        return records
+
+    def flush(self):
+        self._wfile.flush()
+        os.fsync(self._wfile.fileno())
+
+    def close(self):
+        self._wfile.close()
+        self._rfile.close()
+
+
+class Checkpoint:
+    """Append-only crawl log.
+
+    Records are 'A<tab>depth<tab>url' for added urls and 'D<tab>ok<tab>url'
+    for completed urls. Records are buffered and written out by flush().
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        if resume:
+            self._file = open(path, 'r+b')
+            self._truncate_partial()
+        else:
+            self._file = open(path, 'wb')
+
+    def _truncate_partial(self):
+        # drop record interrupted in the middle of write
+        f = self._file
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            nl = f.read(step).rfind(b'\n')
+            if nl >= 0:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+
+        if pos != size:
+            f.truncate(pos)
+        f.seek(pos)
+
+    def added(self, url, depth):
+        self._write('A\t%d\t%s\n' % (depth, url))
+
+    def done(self, url, ok):
+        self._write('D\t%d\t%s\n' % (ok, url))
+
+    def _write(self, record):
+        self._file.write(record.encode('utf-8', 'surrogateescape'))
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    @staticmethod
+    def _records(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # interrupted write
+                kind, value, url = line[:-1].decode(
+                    'utf-8', 'surrogateescape').split('\t', 2)
+                yield kind, int(value), url
+
+    @classmethod
+    def load(cls, path, seen):
+        """Replay log, adds all known urls to seen set.
+        Returns (pending, done, ok), pending is list of (url, depth)
+        of urls that were not completed."""
+        done = HashSet()
+        ok = 0
+        for kind, value, url in cls._records(path):
+            if kind == 'D' and done.add(url):
+                ok += value
+
+        pending = []
+        for kind, value, url in cls._records(path):
+            if kind == 'A' and seen.add(url) and url not in done:
+                pending.append((url, value))
+
+        return pending, len(done), ok
@@ -0,0 +1,232 @@
+"""Tests for crawlstore.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawlstore import BloomFilter, Checkpoint, FileFrontier, HashSet
+from crawlstore import UrlSet
+from crawlstore import seen_set
+
+
+def urls(count, prefix='http://python.org/'):
+    return ['%s%d' % (prefix, i) for i in range(count)]
+
+
+class HashSetTests(unittest.TestCase):
+
+    def test_add(self):
+        seen = HashSet()
+        self.assertTrue(seen.add('http://python.org/'))
+        self.assertFalse(seen.add('http://python.org/'))
+        self.assertIn('http://python.org/', seen)
+        self.assertNotIn('http://python.org/about', seen)
+        self.assertEqual(1, len(seen))
+
+    def test_resize(self):
+        seen = HashSet(capacity=4)
+        for url in urls(1000):
+            self.assertTrue(seen.add(url))
+
+        self.assertEqual(1000, len(seen))
+        self.assertTrue(all(url in seen for url in urls(1000)))
+        self.assertFalse(any(url in seen for url in urls(1000, 'x')))
+        self.assertFalse(any(seen.add(url) for url in urls(1000)))
+        self.assertEqual(1000, len(seen))
+
+    def test_same_as_url_set(self):
+        exact, seen = UrlSet(), HashSet(capacity=16)
+        for url in urls(300) + urls(200) + urls(100, 'x'):
+            self.assertEqual(exact.add(url), seen.add(url))
+        self.assertEqual(len(exact), len(seen))
+
+
+class BloomFilterTests(unittest.TestCase):
+
+    def test_add(self):
+        seen = BloomFilter(capacity=100)
+        self.assertTrue(seen.add('http://python.org/'))
+        self.assertFalse(seen.add('http://python.org/'))
+        self.assertIn('http://python.org/', seen)
+        self.assertEqual(1, len(seen))
+
+    def test_no_false_negatives(self):
+        seen = BloomFilter(capacity=1000, error_rate=0.01)
+        for url in urls(1000):
+            seen.add(url)
+        self.assertTrue(all(url in seen for url in urls(1000)))
+
+    def test_false_positive_rate(self):
+        seen = BloomFilter(capacity=10000, error_rate=0.01)
+        for url in urls(10000):
+            seen.add(url)
+
+        false_positives = sum(
+            1 for url in urls(10000, 'http://example.com/') if url in seen)
+        self.assertLess(false_positives, 10000 * 0.01 * 2)
+
+    def test_error_rate(self):
+        self.assertRaises(ValueError, BloomFilter, error_rate=0)
+        self.assertRaises(ValueError, BloomFilter, error_rate=1)
+
+
+class SeenSetTests(unittest.TestCase):
+
+    def test_backends(self):
+        self.assertIsInstance(seen_set('set'), UrlSet)
+        self.assertIsInstance(seen_set(), HashSet)
+        self.assertIsInstance(seen_set('bloom', capacity=10), BloomFilter)
+        self.assertRaises(ValueError, seen_set, 'unknown')
+
+
+class FileFrontierTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'frontier')
+        self.frontier = FileFrontier(self.path)
+        self.addCleanup(self.frontier.close)
+
+    def test_batches(self):
+        for i, url in enumerate(urls(10)):
+            self.frontier.put(url, i)
+        self.assertEqual(10, len(self.frontier))
+
+        batch = self.frontier.get_batch(4)
+        self.assertEqual(list(zip(urls(4), range(4))), batch)
+        self.assertEqual(6, len(self.frontier))
+
+        self.frontier.put('http://python.org/late', 1)
+        self.assertEqual(4, len(self.frontier.get_batch(4)))
+        self.assertEqual(
+            [('http://python.org/8', 8), ('http://python.org/9', 9),
+             ('http://python.org/late', 1)], self.frontier.get_batch(4))
+        self.assertEqual([], self.frontier.get_batch(4))
+        self.assertEqual(0, len(self.frontier))
+
+    def test_skip_newline(self):
+        self.frontier.put('http://python.org/\nx', 0)
+        self.frontier.put('http://python.org/\rx', 0)
+        self.assertEqual(0, len(self.frontier))
+        self.assertEqual([], self.frontier.get_batch(10))
+
+    def test_partial_record(self):
+        self.frontier.put('http://python.org/', 0)
+        self.frontier.flush()
+        with open(self.path, 'ab') as f:
+            f.write(b'1\thttp://python')
+
+        self.assertEqual([('http://python.org/', 0)],
+                         self.frontier.get_batch(10))
+        self.assertEqual([], self.frontier.get_batch(10))
+
+        with open(self.path, 'ab') as f:
+            f.write(b'.org/about\n')
+        self.assertEqual([('http://python.org/about', 1)],
+                         self.frontier.get_batch(10))
+
+    def test_resume_offset(self):
+        for url in urls(5):
+            self.frontier.put(url, 0)
+        self.frontier.get_batch(2)
+        offset = self.frontier.offset
+        self.frontier.close()
+
+        frontier = FileFrontier(self.path, offset)
+        self.addCleanup(frontier.close)
+        self.assertEqual(3, len(frontier))
+        self.assertEqual([url for url, _ in frontier.get_batch(10)],
+                         urls(5)[2:])
+
+    def test_truncate(self):
+        self.frontier.put('http://python.org/', 0)
+        self.frontier.close()
+
+        frontier = FileFrontier(self.path)
+        self.addCleanup(frontier.close)
+        self.assertEqual(0, len(frontier))
+        self.assertEqual([], frontier.get_batch(10))
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'checkpoint')
+
+    def write_log(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.added('http://python.org/', 0)
+        checkpoint.added('http://python.org/a', 1)
+        checkpoint.added('http://python.org/b', 1)
+        checkpoint.done('http://python.org/', True)
+        checkpoint.added('http://python.org/c', 2)
+        checkpoint.done('http://python.org/b', False)
+        checkpoint.close()
+
+    def test_load(self):
+        self.write_log()
+
+        seen = HashSet()
+        pending, done, ok = Checkpoint.load(self.path, seen)
+        self.assertEqual(
+            [('http://python.org/a', 1), ('http://python.org/c', 2)],
+            pending)
+        self.assertEqual(2, done)
+        self.assertEqual(1, ok)
+        self.assertEqual(4, len(seen))
+        self.assertIn('http://python.org/b', seen)
+
+    def test_load_truncated_record(self):
+        self.write_log()
+        with open(self.path, 'ab') as f:
+            f.write(b'D\t1\thttp://python.org/a')
+
+        pending, done, ok = Checkpoint.load(self.path, HashSet())
+        self.assertEqual(
+            [('http://python.org/a', 1), ('http://python.org/c', 2)],
+            pending)
+        self.assertEqual(2, done)
+
+    def test_resume_truncates_partial(self):
+        self.write_log()
+        with open(self.path, 'ab') as f:
+            f.write(b'A\t3\thttp://python.org/d' * 1000)
+
+        checkpoint = Checkpoint(self.path, resume=True)
+        checkpoint.done('http://python.org/a', True)
+        checkpoint.close()
+
+        with open(self.path, 'rb') as f:
+            self.assertTrue(f.read().endswith(
+                b'\nD\t1\thttp://python.org/a\n'))
+
+        pending, done, ok = Checkpoint.load(self.path, HashSet())
+        self.assertEqual([('http://python.org/c', 2)], pending)
+        self.assertEqual(3, done)
+        self.assertEqual(2, ok)
+
+    def test_resume_complete_log(self):
+        self.write_log()
+        size = os.path.getsize(self.path)
+
+        Checkpoint(self.path, resume=True).close()
+        self.assertEqual(size, os.path.getsize(self.path))
+
+    def test_resume_no_complete_record(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'A\t0\thttp://python.org/')
+
+        checkpoint = Checkpoint(self.path, resume=True)
+        checkpoint.added('http://python.org/a', 1)
+        checkpoint.close()
+
+        pending, done, ok = Checkpoint.load(self.path, HashSet())
+        self.assertEqual([('http://python.org/a', 1)], pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,18 @@
 """HTTP Client for Tulip."""
 
 from .api import *
+from .cache import *
+from .cookies import *
+from .pool import *
 from .protocol import *
+from .resolver import *
+from .timeouts import *
 
 
 __all__ = (api.__all__ +
-           protocol.__all__)
+           cache.__all__ +
+           cookies.__all__ +
+           pool.__all__ +
+           protocol.__all__ +
+           resolver.__all__ +
+           timeouts.__all__)
@@ -1,15 +1,20 @@
 """public api"""
 
-__all__ = ['stream', 'request']
+__all__ = ['stream', 'request', 'pipeline', 'Session']
 
+import collections
+import time
 import urllib.parse
-from tulip import events
 from tulip import futures
 from tulip import tasks
 
-from .request import HttpRequest
+from .cookies import CookieJar
+from .request import HttpRequest, auth_header
 from .response import HttpResponse
 from .protocol import HttpProtocol
+from .pool import ConnectionPool, default_pool
+from .timeouts import RequestTimer, Timeout, timeout_error
+from .utils import DecompressionError, MAX_DECOMPRESSION_RATIO
 
 
 @tasks.coroutine
@@ -17,7 +22,10 @@ def request(method, url, *,
             params=None, data=None, headers=None, cookies=None,
             files=None, auth=None, allow_redirects=True, max_redirects=25,
             encoding='utf-8', version='1.1', timeout=None,
-            compress=None, chunked=None):
+            compress=None, chunked=None, stream=False,
+            pool=None, session=None, cache=None,
+            max_decompression_ratio=MAX_DECOMPRESSION_RATIO,
+            offload_size=None, executor=None, read_limit=None):
     """Constructs and sends a request. Returns response object
 
     method: http method
@@ -25,19 +33,43 @@ def request(method, url, *,
     params: (optional) Dictionary or bytes to be sent in the query string
       of the new request
     data: (optional) Dictionary, bytes, or file-like object to
-      send in the body of the request
+      send in the body of the request, or iterator of bytes or of
+      coroutines returning bytes to stream body with flow control
     headers: (optional) Dictionary of HTTP Headers to send with the request
     cookies: (optional) Dict object to send with the request
     files: (optional) Dictionary of 'name': file-like-objects
        for multipart encoding upload
     auth: (optional) Auth tuple to enable Basic HTTP Auth
-    timeout: (optional) Float describing the timeout of the request
+    timeout: (optional) Float, total timeout of the request including
+       redirects and reading of body, or timeouts.Timeout with
+       separate connect, first byte and read (between two received
+       chunks) timeouts. TimeoutError is raised when any of them expires
     allow_redirects: (optional) Boolean. Set to True if POST/PUT/DELETE
        redirect following is allowed.
     compress: Boolean. Set to True if request has to be compressed
-       with deflate encoding
+       with deflate encoding, 'gzip' or 'deflate' to select encoding,
+       or utils.DeflateIter with compression level, coalescing
+       and executor offload settings
     chunked: Boolean or Integer. Set to chunk size for chunked
        transfer encoding
+    stream: Boolean. Set to True to not read response body,
+       use response.iter_chunks() or response.read_into() to read it
+    pool: (optional) ConnectionPool for keep-alive connections,
+       shared pool of current event loop is used by default
+    session: (optional) Session, its pool, cookies, default headers,
+       auth, timeout and cache are used for request
+    cache: (optional) HttpCache, fresh responses are served from cache,
+       stale ones are revalidated with conditional request.
+       Streamed responses bypass cache.
+    max_decompression_ratio: (optional) Integer. Limit of decompressed
+       to compressed body size ratio, None disables the limit
+    offload_size: (optional) Integer. Form data, multipart and deflate
+       encoding of bodies of this size or larger runs in executor
+    executor: (optional) Executor for offloaded encoding, default
+       executor of event loop is used by default
+    read_limit: (optional) Integer. Bytes of response buffered before
+       reading from connection is paused, reading resumes when
+       buffer is read down to quarter of limit
 
     Usage:
 
@@ -47,26 +79,69 @@ def request(method, url, *,
       <HttpResponse [200]>
 
     """
-    event_loop = events.get_event_loop()
+    if session is not None:
+        pool = session.pool
+        if timeout is None:
+            timeout = session.timeout
+        if cache is None:
+            cache = session.cache
+        if offload_size is None:
+            offload_size = session.offload_size
+        if executor is None:
+            executor = session.executor
+        if read_limit is None:
+            read_limit = session.read_limit
+    elif pool is None:
+        pool = default_pool()
 
+    if stream:
+        cache = None
+
+    timeout = Timeout.coerce(timeout)
+    timer = RequestTimer(timeout) if timeout else None
     redirects = 0
 
     while True:
+        if session is not None:
+            hdrs = session.prepare_headers(headers, auth, url)
+        else:
+            hdrs = headers
+
         request = HttpRequest(
-            method, url, params=params, headers=headers, data=data,
+            method, url, params=params, headers=hdrs, data=data,
             cookies=cookies, files=files, auth=auth, encoding=encoding,
-            version=version, compress=compress, chunked=chunked)
-        response = HttpResponse(request.method, request.path)
+            version=version, compress=compress, chunked=chunked,
+            offload_size=offload_size, executor=executor)
 
-        conn = event_loop.create_connection(
-            HttpProtocol, request.host, request.port, ssl=request.ssl)
+        cached = None
+        if cache is not None:
+            cached = cache.lookup(request)
 
-        # connection timeout
-        try:
-            transport, protocol = yield from tasks.Task(
-                start(conn, request, response), timeout=timeout)
-        except futures.CancelledError:
-            raise futures.TimeoutError
+        if cached is not None and cached.is_fresh(request):
+            response = cached.make_response(request)
+        else:
+            if cached is not None:
+                cached.add_validators(request)
+
+            response = HttpResponse(
+                request.method, request.path,
+                max_decompression_ratio=max_decompression_ratio,
+                read_limit=read_limit)
+            request_time = time.time()
+
+            try:
+                yield from start(pool, request, response, not stream, timer)
+            except:
+                if timer is not None:
+                    timer.cancel()
+                raise
+
+            if session is not None:
+                session.update_cookies(response.headers, url)
+
+            if cache is not None:
+                response = cache.update(
+                    request, response, cached, request_time, time.time())
 
         # redirects
         if response.status in (301, 302) and allow_redirects:
@@ -84,50 +159,354 @@ def request(method, url, *,
                 url = r_url
 
             if url:
+                if stream:
+                    yield from response.read()
                 response.close()
                 continue
 
         break
 
+    if timer is not None:
+        if stream and response.connection is not None:
+            # read deadlines apply to streamed body
+            response.timer = timer
+        else:
+            timer.cancel()
+
     return response
 
 
 @tasks.coroutine
-def start(conn, request, response):
-    transport, protocol = yield from conn
+def pipeline(method, urls, *,
+             params=None, headers=None, cookies=None, auth=None,
+             encoding='utf-8', timeout=None, depth=4,
+             pool=None, session=None):
+    """Sends requests to one origin with http/1.1 pipelining.
+    Returns list of response objects in order of urls.
+
+    method: idempotent http method
+    urls: list of urls, all urls must have same scheme, host and port
+    depth: number of requests sent ahead of received responses,
+       at least 1
+    timeout: (optional) Float, total timeout of the pipeline, or
+       timeouts.Timeout, first byte and read timeouts apply to each
+       response
+
+    Redirects are not followed. If server closes connection in the middle
+    of pipeline, unanswered requests are sent again over new connection
+    without pipelining (depth 1).
+
+    Usage:
+
+      >>> import httpclient
+      >>> resps = yield from httpclient.pipeline(
+      ...     'GET', ['http://python.org/', 'http://python.org/about/'])
+      >>> resps
+      [<HttpResponse [200]>, <HttpResponse [200]>]
+
+    """
+    method = method.upper()
+    if method not in HttpRequest.IDEMPOTENT_METHODS:
+        raise ValueError('Only idempotent requests can be pipelined.')
+    if depth < 1:
+        raise ValueError('Pipeline depth must be at least 1.')
+
+    if session is not None:
+        pool = session.pool
+        if timeout is None:
+            timeout = session.timeout
+    elif pool is None:
+        pool = default_pool()
+
+    def make_request(url):
+        hdrs = headers
+        if session is not None:
+            hdrs = session.prepare_headers(headers, auth, url)
+        return HttpRequest(
+            method, url, params=params, headers=hdrs, cookies=cookies,
+            auth=auth, encoding=encoding)
+
+    urls = list(urls)
+    if not urls:
+        return []
+
+    origins = set()
+    for url in urls:
+        request = make_request(url)
+        origins.add((request.host, request.port, request.ssl))
+    if len(origins) != 1:
+        raise ValueError('Pipelined requests must have same origin.')
+
+    host, port, ssl = origins.pop()
+
+    timeout = Timeout.coerce(timeout)
+    timer = RequestTimer(timeout) if timeout else None
+    try:
+        return (yield from _pipeline(
+            pool, host, port, ssl, method, urls, make_request,
+            depth, session, timer))
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+@tasks.coroutine
+def _pipeline(pool, host, port, ssl, method, urls, make_request,
+              depth, session, timer):
+    responses = [None] * len(urls)
+    pending = collections.deque(range(len(urls)))
+
+    while pending:
+        conn = yield from pool.acquire(
+            host, port, ssl,
+            timeout=None if timer is None else timer.remaining('connect'))
+        if timer is not None:
+            timer.attach(conn.protocol)
+        # pipeline reads conn.stream, nothing reports consumed data
+        conn.protocol.set_read_limit(0)
+        sent = collections.deque()
+        received = 0
+
+        try:
+            while pending or sent:
+                while pending and len(sent) < depth:
+                    idx = pending.popleft()
+                    request = make_request(urls[idx])
+                    yield from request.start(conn.transport, conn.protocol)
+                    sent.append(idx)
+
+                response = HttpResponse(method, urls[sent[0]])
+                if timer is not None:
+                    timer.start('first_byte')
+                yield from response.start(conn.stream, conn.transport, True)
+                if timer is not None:
+                    timer.stop()
+
+                # connection is owned by pipeline
+                response.transport = None
+                responses[sent.popleft()] = response
+                received += 1
+
+                if session is not None:
+                    session.update_cookies(response.headers, response.url)
+
+                if response.will_close:
+                    break
+        except futures.TimeoutError:
+            conn.close()
+            raise
+        except Exception:
+            conn.close()
+            if timer is not None and timer.expired:
+                raise timeout_error(timer.expired)
+            if not received and depth == 1:
+                raise
+        else:
+            if response.will_close:
+                conn.close()
+            else:
+                conn.release()
+        finally:
+            if timer is not None:
+                timer.detach()
+
+        # server closed connection, resend unanswered requests
+        # one at a time
+        if sent:
+            pending.extendleft(reversed(sent))
+            depth = 1
+
+    return responses
+
+
+class Session:
+    """Keeps state shared between requests: connection pool, cookies
+    received from server, default headers, auth, timeout,
+    (optional) HttpCache, body encoding offload settings and
+    response read_limit.
+
+    Usage:
+
+      >>> import httpclient
+      >>> session = httpclient.Session(headers={'User-Agent': 'crawler'})
+      >>> resp = yield from session.get('http://python.org/')
+      >>> resp
+      <HttpResponse [200]>
+      >>> session.close()
+
+    """
+
+    def __init__(self, *, headers=None, cookies=None, auth=None,
+                 timeout=None, pool=None, cache=None,
+                 offload_size=None, executor=None, read_limit=None):
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+        self.timeout = timeout
+        self.cache = cache
+        self.offload_size = offload_size
+        self.executor = executor
+        self.read_limit = read_limit
+
+        self.cookies = CookieJar(cookies)
+
+        # precomputed header block
+        hdrs = dict((hdr.lower(), (hdr, val)) for hdr, val in
+                    HttpRequest.DEFAULT_HEADERS.items())
+        if headers:
+            if isinstance(headers, dict):
+                headers = headers.items()
+            for hdr, val in headers:
+                hdrs[hdr.lower()] = (hdr, val)
+        if auth:
+            hdrs['authorization'] = ('Authorization', auth_header(auth))
+
+        self._headers = hdrs
+
+    def prepare_headers(self, headers=None, auth=None, url=None):
+        """Merge request headers with session headers, add Cookie
+        header with session cookies matching url."""
+        if not headers and not auth:
+            result = list(self._headers.values())
+        else:
+            hdrs = self._headers.copy()
+            if auth:
+                hdrs.pop('authorization', None)
+            if headers:
+                if isinstance(headers, dict):
+                    headers = headers.items()
+                for hdr, val in headers:
+                    hdrs[hdr.lower()] = (hdr, val)
+            result = list(hdrs.values())
+            if 'cookie' in hdrs:
+                return result
+
+        if url is not None:
+            cookie = self.cookies.header(url)
+            if cookie is not None:
+                result.append(('Cookie', cookie))
+        return result
+
+    def update_cookies(self, headers, url):
+        """Store cookies from Set-Cookie response headers of url."""
+        self.cookies.update(headers, url)
+
+    @tasks.coroutine
+    def request(self, method, url, **kwargs):
+        """Send request with session state, see httpclient.request()."""
+        return (yield from request(method, url, session=self, **kwargs))
+
+    @tasks.coroutine
+    def get(self, url, **kwargs):
+        return (yield from request('GET', url, session=self, **kwargs))
+
+    @tasks.coroutine
+    def post(self, url, **kwargs):
+        return (yield from request('POST', url, session=self, **kwargs))
+
+    @tasks.coroutine
+    def pipeline(self, method, urls, **kwargs):
+        """Send pipelined requests, see httpclient.pipeline()."""
+        return (yield from pipeline(method, urls, session=self, **kwargs))
+
+    def close(self):
+        """Close all pooled connections."""
+        self.pool.close()
+
+
+@tasks.coroutine
+def start(pool, request, response, readbody=True, timer=None, reuse=True):
+    conn = yield from pool.acquire(
+        request.host, request.port, request.ssl,
+        timeout=None if timer is None else timer.remaining('connect'),
+        reuse=reuse)
+    received = conn.protocol.bytes_received
 
     try:
-        yield from request.start(transport)
-        yield from response.start(protocol.stream, transport, True)
+        if timer is not None:
+            timer.attach(conn.protocol)
+        yield from request.start(conn.transport, conn.protocol)
+        if timer is not None:
+            timer.start('first_byte')
+        yield from response.start(
+            conn.stream, conn.transport, readbody, conn)
+    except (futures.CancelledError, DecompressionError):
+        response.connection = None
+        conn.close()
+        raise
     except:
+        response.connection = None
+        conn.close()
+        if timer is not None and timer.expired:
+            raise timeout_error(timer.expired)
+
+        # server closed idle keep-alive connection, send again
+        # over new connection
+        if (conn.reused and request.can_retry() and
+                conn.protocol.bytes_received == received):
+            response.stream = None
+            return (yield from start(
+                pool, request, response, readbody, timer, reuse=False))
+
         import traceback
         traceback.print_exc()
 
-    return transport, protocol
+    return conn
 
 
 @tasks.coroutine
 def stream(method, url, *,
            params=None, headers=None, cookies=None,
-           auth=None, encoding='utf-8', version='1.1', timeout=None):
+           auth=None, encoding='utf-8', version='1.1', timeout=None,
+           body_timeout=False):
     """Constructs a request, sends request headers.
     Returns write stream and response coroutine.
 
+    timeout: (optional) Float or timeouts.Timeout, see request(),
+       it covers connect and response headers only
+    body_timeout: Boolean. Set to True to apply read and total
+       deadlines of timeout to response body too, connection stays
+       open without deadline otherwise (e.g. websocket)
     """
-    event_loop = events.get_event_loop()
-
     request = HttpRequest(
         method, url, params=params, headers=headers,
         cookies=cookies, auth=auth, encoding=encoding, version=version)
     response = HttpResponse(request.method, request.path)
 
-    conn = event_loop.create_connection(
-        HttpProtocol, request.host, request.port, ssl=request.ssl)
+    timeout = Timeout.coerce(timeout)
+    timer = RequestTimer(timeout) if timeout else None
 
+    transport, protocol = yield from default_pool().resolver.connect(
+        HttpProtocol, request.host, request.port, request.ssl,
+        timeout=None if timer is None else timer.remaining('connect'))
+
+    if timer is None:
+        yield from request.start(transport, protocol)
+        return protocol.stream, response.start(protocol.stream, transport)
+
+    timer.attach(protocol)
     try:
-        transport, protocol = yield from tasks.Task(conn, timeout=timeout)
-    except futures.CancelledError:
-        raise futures.TimeoutError
+        yield from request.start(transport, protocol)
+    except:
+        timer.cancel()
+        raise
+    timer.start('first_byte')
+    return protocol.stream, _start_stream(
+        response, protocol.stream, transport, timer, body_timeout)
 
-    request.start(transport)
-    return protocol.stream, response.start(protocol.stream, transport)
+
+@tasks.coroutine
+def _start_stream(response, stream, transport, timer, body_timeout):
+    try:
+        yield from response.start(stream, transport)
+    except:
+        timer.cancel()
+        if timer.expired:
+            raise timeout_error(timer.expired)
+        raise
+
+    if body_timeout:
+        response.timer = timer
+    else:
+        timer.cancel()
+    return response
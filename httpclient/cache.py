@@ -0,0 +1,363 @@
+"""http cache with conditional requests (RFC 7234)"""
+
+__all__ = ['HttpCache']
+
+import collections
+import email.utils
+import hashlib
+import json
+import os
+import time
+
+from .headers import Headers
+from .response import HttpResponse
+
+
+CACHEABLE_METHODS = {'GET', 'HEAD'}
+
+# status codes cacheable by default, RFC 7231 section 6.1
+CACHEABLE_STATUSES = {200, 203, 204, 300, 301, 404, 405, 410, 414, 501}
+
+# hop-by-hop headers are not stored, RFC 7230 section 6.1
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate',
+              'proxy-authorization', 'te', 'trailer', 'transfer-encoding',
+              'upgrade'}
+
+# describe stored body, not replaced by headers of 304 response
+REPRESENTATION = {'content-encoding', 'content-length'}
+
+
+def parse_cache_control(value):
+    """Cache-Control header to {directive: value} dict."""
+    directives = {}
+    for item in (value or '').split(','):
+        name, sep, val = item.strip().partition('=')
+        if name:
+            directives[name.strip().lower()] = (
+                val.strip().strip('"') if sep else None)
+    return directives
+
+
+def parse_date(value):
+    """Http date to timestamp, None for invalid date."""
+    if not value:
+        return None
+    try:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is not None:
+            return email.utils.mktime_tz(parsed)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return None
+
+
+def _seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry:
+    """Stored response with validators and freshness information."""
+
+    def __init__(self, method, url, version, status, reason, headers,
+                 content, request_time, response_time, vary=()):
+        self.method = method
+        self.url = url
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.request_time = request_time
+        self.response_time = response_time
+        self.vary = vary  # ((header, request value), ...)
+
+    @property
+    def etag(self):
+        return self.headers.get('etag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('last-modified')
+
+    def freshness_lifetime(self):
+        """RFC 7234 section 4.2.1"""
+        cc = parse_cache_control(self.headers.get('cache-control'))
+
+        max_age = _seconds(cc.get('max-age'))
+        if max_age is not None:
+            return max_age
+
+        date = parse_date(self.headers.get('date'))
+        if date is None:
+            date = self.response_time
+
+        if 'expires' in self.headers:
+            expires = parse_date(self.headers['expires'])
+            if expires is None:
+                return 0  # invalid date means already expired
+            return max(0, expires - date)
+
+        # heuristic freshness, 10% of time since last modification
+        last_modified = parse_date(self.last_modified)
+        if last_modified is not None and self.status in CACHEABLE_STATUSES:
+            return max(0, (date - last_modified) / 10)
+
+        return 0
+
+    def current_age(self, now=None):
+        """RFC 7234 section 4.2.3"""
+        if now is None:
+            now = time.time()
+
+        date = parse_date(self.headers.get('date')) or self.response_time
+        apparent_age = max(0, self.response_time - date)
+        age_value = _seconds(self.headers.get('age')) or 0
+        response_delay = self.response_time - self.request_time
+        corrected_age_value = age_value + response_delay
+        corrected_initial_age = max(apparent_age, corrected_age_value)
+        resident_time = now - self.response_time
+        return corrected_initial_age + resident_time
+
+    def is_fresh(self, request, now=None):
+        """Entry can be used without validation."""
+        cc = parse_cache_control(self.headers.get('cache-control'))
+        if 'no-cache' in cc:
+            return False
+
+        req_cc = parse_cache_control(request.headers.get('cache-control'))
+        if 'no-cache' in req_cc or 'no-cache' in (
+                request.headers.get('pragma') or '').lower():
+            return False
+
+        lifetime = self.freshness_lifetime()
+        max_age = _seconds(req_cc.get('max-age'))
+        if max_age is not None:
+            lifetime = min(lifetime, max_age)
+
+        age = self.current_age(now)
+        min_fresh = _seconds(req_cc.get('min-fresh'))
+        if min_fresh is not None:
+            age += min_fresh
+
+        return lifetime > age
+
+    def matches(self, request):
+        """Request has same values of Vary headers."""
+        for hdr, value in self.vary:
+            if request.headers.get(hdr) != value:
+                return False
+        return True
+
+    def add_validators(self, request):
+        """Make request conditional."""
+        if self.etag and 'if-none-match' not in request.headers:
+            request.headers['If-None-Match'] = self.etag
+        if (self.last_modified and
+                'if-modified-since' not in request.headers):
+            request.headers['If-Modified-Since'] = self.last_modified
+
+    def refresh(self, response, request_time, response_time):
+        """Update stored headers from 304 response, RFC 7234 4.3.4"""
+        for hdr, val in response.headers.items():
+            lhdr = hdr.lower()
+            if lhdr not in HOP_BY_HOP and lhdr not in REPRESENTATION:
+                self.headers[hdr] = val
+
+        self.request_time = request_time
+        self.response_time = response_time
+
+    def make_response(self, request):
+        response = HttpResponse(request.method, request.path)
+        response.version = self.version
+        response.status = self.status
+        response.reason = self.reason
+        response.headers = self.headers.copy()
+        response.content = self.content if request.method != 'HEAD' else b''
+        response.will_close = False
+        response.from_cache = True
+        return response
+
+    def dumps(self):
+        meta = {
+            'method': self.method,
+            'url': self.url,
+            'version': list(self.version),
+            'status': self.status,
+            'reason': self.reason,
+            'headers': self.headers.items(),
+            'request_time': self.request_time,
+            'response_time': self.response_time,
+            'vary': self.vary,
+        }
+        return json.dumps(meta).encode('utf-8') + b'\n' + self.content
+
+    @classmethod
+    def loads(cls, data):
+        meta, content = data.split(b'\n', 1)
+        meta = json.loads(meta.decode('utf-8'))
+        return cls(meta['method'], meta['url'], tuple(meta['version']),
+                   meta['status'], meta['reason'], Headers(meta['headers']),
+                   content, meta['request_time'], meta['response_time'],
+                   tuple(tuple(v) for v in meta['vary']))
+
+
+class HttpCache:
+    """Private http cache, in-memory LRU with optional on-disk store.
+
+    max_entries: number of responses kept in memory
+    max_size: limit of body size of stored response
+    path: (optional) directory for on-disk store
+
+    Fresh responses are returned without request, stale responses
+    with ETag or Last-Modified are revalidated with conditional request
+    and served from cache on 304 Not Modified.
+    """
+
+    def __init__(self, max_entries=1000, max_size=10 * 1024 * 1024,
+                 path=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.path = path
+        self._entries = collections.OrderedDict()
+
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(request):
+        return '%s://%s:%s%s' % ('https' if request.ssl else 'http',
+                                 request.host, request.port, request.path)
+
+    def _filename(self, key):
+        return os.path.join(
+            self.path, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def lookup(self, request):
+        """Stored response for request or None."""
+        if request.method not in CACHEABLE_METHODS:
+            return None
+
+        req_cc = parse_cache_control(request.headers.get('cache-control'))
+        if 'no-store' in req_cc:
+            return None
+
+        key = self.key(request)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.path is not None:
+            try:
+                with open(self._filename(key), 'rb') as f:
+                    entry = CacheEntry.loads(f.read())
+            except (OSError, ValueError, KeyError):
+                return None
+            self._remember(key, entry)
+
+        if entry is not None and entry.matches(request):
+            return entry
+        return None
+
+    def update(self, request, response, entry,
+               request_time, response_time):
+        """Process response of network request. Returns response
+        to use, cached one for 304 Not Modified."""
+        if request.method not in CACHEABLE_METHODS:
+            # unsafe methods invalidate stored response
+            if 200 <= (response.status or 0) < 400:
+                self.invalidate(request)
+            return response
+
+        if response.status == 304 and entry is not None:
+            entry.refresh(response, request_time, response_time)
+            self._store(request, entry)
+            return entry.make_response(request)
+
+        if self._is_storable(request, response):
+            vary = response.headers.get('vary', '')
+            entry = CacheEntry(
+                request.method, self.key(request), response.version,
+                response.status, response.reason,
+                self._stored_headers(response),
+                response.content, request_time, response_time,
+                tuple((hdr.strip(), request.headers.get(hdr.strip()))
+                      for hdr in vary.split(',') if hdr.strip()))
+            self._store(request, entry)
+
+        return response
+
+    @staticmethod
+    def _stored_headers(response):
+        """Response headers without hop-by-hop headers. Content is
+        stored decoded, so Content-Encoding is removed and
+        Content-Length is set to size of decoded content."""
+        decoded = response.decoder is not None
+        headers = Headers()
+        for hdr, val in response.headers.items():
+            lhdr = hdr.lower()
+            if lhdr in HOP_BY_HOP:
+                continue
+            if decoded and lhdr in REPRESENTATION:
+                continue
+            headers.add(hdr, val)
+
+        if decoded:
+            headers['Content-Length'] = str(len(response.content))
+        return headers
+
+    def _is_storable(self, request, response):
+        """RFC 7234 section 3, private cache may store responses
+        with Cache-Control: private and responses to requests
+        with Authorization header."""
+        if response.status not in CACHEABLE_STATUSES:
+            return False
+        if response.content is None or len(response.content) > self.max_size:
+            return False
+        if request.method != 'GET':
+            return False
+        if response.headers.get('vary', '').strip() == '*':
+            return False
+
+        req_cc = parse_cache_control(request.headers.get('cache-control'))
+        cc = parse_cache_control(response.headers.get('cache-control'))
+        if 'no-store' in req_cc or 'no-store' in cc:
+            return False
+
+        return ('max-age' in cc or 'public' in cc or
+                'expires' in response.headers or
+                'etag' in response.headers or
+                'last-modified' in response.headers)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, request, entry):
+        key = self.key(request)
+        self._remember(key, entry)
+
+        if self.path is not None:
+            filename = self._filename(key)
+            tmp = filename + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(entry.dumps())
+            os.replace(tmp, filename)
+
+    def invalidate(self, request):
+        key = self.key(request)
+        self._entries.pop(key, None)
+        if self.path is not None:
+            try:
+                os.unlink(self._filename(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        self._entries.clear()
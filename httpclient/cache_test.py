@@ -0,0 +1,209 @@
+"""Tests for cache.py"""
+
+import email.utils
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .cache import HttpCache
+from .headers import Headers
+from .request import HttpRequest
+from .response import HttpResponse
+from .utils import ContentDecoder
+
+
+class HttpCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = HttpCache(max_entries=2)
+
+    def make_response(self, status=200, headers=(), content=b'data'):
+        response = HttpResponse('GET', '/')
+        response.version = (1, 1)
+        response.status = status
+        response.reason = 'OK'
+        response.headers = Headers(headers)
+        response.content = content
+        return response
+
+    def store(self, headers, url='http://python.org/', content=b'data'):
+        request = HttpRequest('get', url)
+        now = time.time()
+        self.cache.update(request, self.make_response(
+            headers=headers, content=content), None, now, now)
+        return request
+
+    def test_fresh_max_age(self):
+        request = self.store([('Cache-Control', 'max-age=60')])
+
+        entry = self.cache.lookup(request)
+        self.assertTrue(entry.is_fresh(request))
+
+        response = entry.make_response(request)
+        self.assertTrue(response.from_cache)
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'data', response.content)
+
+    def test_stale(self):
+        request = self.store([('Cache-Control', 'max-age=60'),
+                              ('Age', '120')])
+
+        entry = self.cache.lookup(request)
+        self.assertFalse(entry.is_fresh(request))
+
+    def test_expires(self):
+        now = time.time()
+        request = self.store(
+            [('Date', email.utils.formatdate(now, usegmt=True)),
+             ('Expires', email.utils.formatdate(now + 60, usegmt=True))])
+        self.assertTrue(self.cache.lookup(request).is_fresh(request))
+
+        request = self.store([('Expires', '0')])
+        self.assertFalse(self.cache.lookup(request).is_fresh(request))
+
+    def test_heuristic_freshness(self):
+        now = time.time()
+        request = self.store(
+            [('Date', email.utils.formatdate(now, usegmt=True)),
+             ('Last-Modified',
+              email.utils.formatdate(now - 1000, usegmt=True))])
+
+        entry = self.cache.lookup(request)
+        self.assertEqual(100, entry.freshness_lifetime())
+        self.assertTrue(entry.is_fresh(request))
+
+    def test_request_no_cache(self):
+        self.store([('Cache-Control', 'max-age=60')])
+        request = HttpRequest('get', 'http://python.org/',
+                              headers={'Cache-Control': 'no-cache'})
+
+        self.assertFalse(self.cache.lookup(request).is_fresh(request))
+
+    def test_not_storable(self):
+        request = self.store([('Cache-Control', 'no-store, max-age=60')])
+        self.assertIsNone(self.cache.lookup(request))
+
+        request = self.store([('Content-Type', 'text/plain')])
+        self.assertIsNone(self.cache.lookup(request))
+
+    def test_private_cache(self):
+        request = self.store([('Cache-Control', 'private, max-age=60')])
+        self.assertTrue(self.cache.lookup(request).is_fresh(request))
+
+        request = HttpRequest('get', 'http://python.org/auth',
+                              headers={'Authorization': 'Basic eDp5'})
+        now = time.time()
+        self.cache.update(request, self.make_response(
+            headers=[('Cache-Control', 'max-age=60')]), None, now, now)
+        self.assertIsNotNone(self.cache.lookup(request))
+
+    def test_decoded_content(self):
+        request = HttpRequest('get', 'http://python.org/')
+        response = self.make_response(
+            headers=[('Content-Encoding', 'gzip'),
+                     ('Content-Length', '10'),
+                     ('Cache-Control', 'max-age=60')],
+            content=b'decoded data')
+        response.decoder = ContentDecoder('gzip')
+        now = time.time()
+        self.cache.update(request, response, None, now, now)
+
+        cached = self.cache.lookup(request).make_response(request)
+        self.assertNotIn('content-encoding', cached.headers)
+        self.assertEqual('12', cached.headers['content-length'])
+        self.assertEqual(b'decoded data', cached.content)
+
+        # 304 response does not change stored representation
+        entry = self.cache.lookup(request)
+        cached = self.cache.update(request, self.make_response(
+            304, [('Content-Encoding', 'gzip'),
+                  ('Content-Length', '10')], b''), entry, now, now)
+        self.assertNotIn('content-encoding', cached.headers)
+        self.assertEqual('12', cached.headers['content-length'])
+
+    def test_not_decoded_content(self):
+        request = self.store([('Content-Encoding', 'x-unknown'),
+                              ('Content-Length', '4'),
+                              ('Cache-Control', 'max-age=60')])
+        headers = self.cache.lookup(request).headers
+        self.assertEqual('x-unknown', headers['content-encoding'])
+        self.assertEqual('4', headers['content-length'])
+
+    def test_validators(self):
+        request = self.store([('ETag', '"abc"'),
+                              ('Last-Modified', 'Mon, 01 Jan 2001 '
+                                                '00:00:00 GMT'),
+                              ('Cache-Control', 'no-cache')])
+        entry = self.cache.lookup(request)
+        self.assertFalse(entry.is_fresh(request))
+
+        entry.add_validators(request)
+        self.assertEqual('"abc"', request.headers['If-None-Match'])
+        self.assertEqual('Mon, 01 Jan 2001 00:00:00 GMT',
+                         request.headers['If-Modified-Since'])
+
+    def test_not_modified(self):
+        request = self.store([('ETag', '"abc"'),
+                              ('Cache-Control', 'max-age=0')])
+        entry = self.cache.lookup(request)
+
+        now = time.time()
+        response = self.cache.update(
+            request, self.make_response(
+                304, [('Cache-Control', 'max-age=60')], b''),
+            entry, now, now)
+
+        self.assertTrue(response.from_cache)
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'data', response.content)
+        self.assertEqual('max-age=60', response.headers['cache-control'])
+        self.assertTrue(entry.is_fresh(request))
+
+    def test_vary(self):
+        self.store([('Cache-Control', 'max-age=60'),
+                    ('Vary', 'Accept-Encoding')])
+
+        request = HttpRequest('get', 'http://python.org/',
+                              headers={'Accept-Encoding': 'identity'})
+        self.assertIsNone(self.cache.lookup(request))
+
+    def test_lru(self):
+        self.store([('Cache-Control', 'max-age=60')], 'http://python.org/1')
+        request = self.store([('Cache-Control', 'max-age=60')],
+                             'http://python.org/2')
+        self.cache.lookup(request)
+        self.store([('Cache-Control', 'max-age=60')], 'http://python.org/3')
+
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.lookup(
+            HttpRequest('get', 'http://python.org/1')))
+        self.assertIsNotNone(self.cache.lookup(request))
+
+    def test_invalidate_unsafe(self):
+        request = self.store([('Cache-Control', 'max-age=60')])
+
+        now = time.time()
+        self.cache.update(HttpRequest('post', 'http://python.org/'),
+                          self.make_response(), None, now, now)
+        self.assertIsNone(self.cache.lookup(request))
+
+    def test_disk_store(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        self.cache = HttpCache(path=path)
+        request = self.store([('Cache-Control', 'max-age=60')],
+                             content=b'line\nline')
+        self.assertEqual(1, len(os.listdir(path)))
+
+        cache = HttpCache(path=path)
+        entry = cache.lookup(request)
+        self.assertEqual(b'line\nline', entry.content)
+        self.assertEqual('max-age=60', entry.headers['cache-control'])
+        self.assertTrue(entry.is_fresh(request))
+
+
+if __name__ == '__main__':
+    unittest.main()
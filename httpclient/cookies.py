@@ -0,0 +1,188 @@
+"""cookie jar scoped by domain and path (RFC 6265)"""
+
+__all__ = ['CookieJar']
+
+import email.utils
+import http.cookies
+import ipaddress
+import time
+import urllib.parse
+
+
+def domain_match(host, domain):
+    if host == domain:
+        return True
+    if not host.endswith('.' + domain):
+        return False
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return True
+    return False
+
+
+def path_match(path, cookie_path):
+    if path == cookie_path:
+        return True
+    return path.startswith(cookie_path) and (
+        cookie_path.endswith('/') or path[len(cookie_path)] == '/')
+
+
+def default_path(path):
+    if not path.startswith('/') or path.count('/') == 1:
+        return '/'
+    return path[:path.rindex('/')]
+
+
+class Cookie:
+
+    __slots__ = ('name', 'value', 'domain', 'path',
+                 'host_only', 'secure', 'expires')
+
+    def __init__(self, name, value, domain=None, path='/',
+                 host_only=False, secure=False, expires=None):
+        self.name = name
+        self.value = value
+        self.domain = domain  # None matches any host
+        self.path = path
+        self.host_only = host_only
+        self.secure = secure
+        self.expires = expires  # unix time, None for session cookie
+
+    def __repr__(self):
+        return '<Cookie %s=%s for %s%s>' % (
+            self.name, self.value, self.domain or '*', self.path)
+
+    def matches(self, host, path, secure):
+        if self.secure and not secure:
+            return False
+        if self.domain is not None:
+            if self.host_only:
+                if host != self.domain:
+                    return False
+            elif not domain_match(host, self.domain):
+                return False
+        return path_match(path, self.path)
+
+
+class CookieJar:
+    """Cookies received from servers, scoped by domain and path.
+
+    Cookie without Domain attribute is sent to its origin host only,
+    cookie with Domain that does not match origin host is ignored.
+    Expired cookies and cookies set with Max-Age=0 or past Expires
+    are removed. Cookies given to load() are sent to every host.
+    """
+
+    def __init__(self, cookies=None):
+        self._cookies = {}  # key: (domain, path, name)
+        if cookies:
+            self.load(cookies)
+
+    def __len__(self):
+        return len(self._cookies)
+
+    def __iter__(self):
+        return iter(list(self._cookies.values()))
+
+    def get(self, name, default=None):
+        """Value of cookie with name, any domain and path."""
+        for cookie in self._cookies.values():
+            if cookie.name == name:
+                return cookie.value
+        return default
+
+    def clear(self):
+        self._cookies.clear()
+
+    def load(self, cookies):
+        """Add unscoped cookies from dict or cookie string."""
+        jar = http.cookies.SimpleCookie()
+        jar.load(cookies)
+        for name, morsel in jar.items():
+            self._cookies[(None, '/', name)] = Cookie(
+                name, morsel.coded_value)
+
+    def update(self, headers, url):
+        """Store cookies from Set-Cookie response headers of url."""
+        if headers is None:
+            return
+
+        values = headers.get_all('set-cookie')
+        if not values:
+            return
+
+        url = urllib.parse.urlsplit(url)
+        host = (url.hostname or '').lower()
+        for val in values:
+            jar = http.cookies.SimpleCookie()
+            try:
+                jar.load(val)
+            except http.cookies.CookieError:
+                continue
+
+            for name, morsel in jar.items():
+                self._set(name, morsel, host, url.path)
+
+    def _set(self, name, morsel, host, request_path):
+        domain = morsel['domain'].lower().lstrip('.')
+        if domain:
+            if not domain_match(host, domain):
+                return
+            host_only = False
+        else:
+            domain, host_only = host, True
+
+        path = morsel['path']
+        if not path.startswith('/'):
+            path = default_path(request_path)
+
+        key = (domain, path, name)
+        expires = self._expires(morsel)
+        if expires is not None and expires <= time.time():
+            self._cookies.pop(key, None)
+            return
+
+        self._cookies[key] = Cookie(
+            name, morsel.coded_value, domain, path,
+            host_only, bool(morsel['secure']), expires)
+
+    @staticmethod
+    def _expires(morsel):
+        max_age = morsel['max-age']
+        if max_age:
+            try:
+                return time.time() + int(max_age)
+            except ValueError:
+                pass
+
+        if morsel['expires']:
+            parsed = email.utils.parsedate_tz(morsel['expires'])
+            if parsed is not None:
+                return email.utils.mktime_tz(parsed)
+
+        return None
+
+    def header(self, url):
+        """Cookie header value for request to url, None if no cookie
+        matches. Expired cookies are removed."""
+        url = urllib.parse.urlsplit(url)
+        host = (url.hostname or '').lower()
+        path = url.path or '/'
+        secure = url.scheme == 'https'
+
+        now = time.time()
+        matched = []
+        for key, cookie in list(self._cookies.items()):
+            if cookie.expires is not None and cookie.expires <= now:
+                del self._cookies[key]
+            elif cookie.matches(host, path, secure):
+                matched.append(cookie)
+
+        if not matched:
+            return None
+
+        # more specific path first
+        matched.sort(key=lambda cookie: -len(cookie.path))
+        return '; '.join(
+            '%s=%s' % (cookie.name, cookie.value) for cookie in matched)
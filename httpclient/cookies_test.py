@@ -0,0 +1,81 @@
+"""Tests for cookies.py"""
+
+import unittest
+
+from .cookies import CookieJar
+from .headers import Headers
+
+
+def set_cookie(*values):
+    return Headers([('Set-Cookie', val) for val in values])
+
+
+class CookieJarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.jar = CookieJar()
+
+    def test_host_only(self):
+        self.jar.update(set_cookie('a=1'), 'http://python.org/')
+        self.assertEqual('a=1', self.jar.header('http://python.org/about'))
+        self.assertIsNone(self.jar.header('http://www.python.org/'))
+        self.assertIsNone(self.jar.header('http://example.com/'))
+
+    def test_domain(self):
+        self.jar.update(set_cookie('a=1; Domain=.python.org'),
+                        'http://www.python.org/')
+        self.assertEqual('a=1', self.jar.header('http://python.org/'))
+        self.assertEqual('a=1', self.jar.header('http://docs.python.org/'))
+        self.assertIsNone(self.jar.header('http://notpython.org/'))
+
+    def test_foreign_domain(self):
+        self.jar.update(set_cookie('a=1; Domain=example.com'),
+                        'http://python.org/')
+        self.assertEqual(0, len(self.jar))
+
+    def test_path(self):
+        self.jar.update(set_cookie('a=1; Path=/docs', 'b=2; Path=/'),
+                        'http://python.org/')
+        self.assertEqual('a=1; b=2',
+                         self.jar.header('http://python.org/docs/3/'))
+        self.assertEqual('b=2', self.jar.header('http://python.org/docsx'))
+
+    def test_default_path(self):
+        self.jar.update(set_cookie('a=1'), 'http://python.org/docs/index')
+        self.assertEqual('a=1', self.jar.header('http://python.org/docs/x'))
+        self.assertIsNone(self.jar.header('http://python.org/'))
+
+    def test_secure(self):
+        self.jar.update(set_cookie('a=1; Secure'), 'https://python.org/')
+        self.assertIsNone(self.jar.header('http://python.org/'))
+        self.assertEqual('a=1', self.jar.header('https://python.org/'))
+
+    def test_max_age_zero(self):
+        self.jar.update(set_cookie('a=1'), 'http://python.org/')
+        self.jar.update(set_cookie('a=1; Max-Age=0'), 'http://python.org/')
+        self.assertEqual(0, len(self.jar))
+
+    def test_expired(self):
+        self.jar.update(
+            set_cookie('a=1; Expires=Wed, 21 Oct 2015 07:28:00 GMT'),
+            'http://python.org/')
+        self.assertEqual(0, len(self.jar))
+
+    def test_expires_later(self):
+        self.jar.update(set_cookie('a=1; Max-Age=60'), 'http://python.org/')
+        self.assertEqual('a=1', self.jar.header('http://python.org/'))
+
+        for cookie in self.jar:
+            cookie.expires -= 120
+        self.assertIsNone(self.jar.header('http://python.org/'))
+        self.assertEqual(0, len(self.jar))
+
+    def test_load(self):
+        jar = CookieJar({'a': '1'})
+        self.assertEqual('1', jar.get('a'))
+        self.assertEqual('a=1', jar.header('http://python.org/'))
+        self.assertEqual('a=1', jar.header('http://example.com/'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,7 +8,9 @@ import tulip
 import tulip.http
 from tulip import tasks
 
-from . import api, protocol, utils
+from . import api, pool, protocol, utils
+from .cache import HttpCache
+from .request import HttpRequest
 from .test_utils import Router, HttpServer
 
 
@@ -147,6 +149,28 @@ class FunctionalTests(unittest.TestCase):
                 f.read(), content['multipart-data'][0]['data'])
             self.assertEqual(r.status, 200)
 
+    def test_POST_FILES_BINARY(self):
+        url = self.server.url('method', 'post')
+
+        with open(__file__, 'rb') as f:
+            r = self.event_loop.run_until_complete(tasks.Task(
+                api.request('post', url, files={'some': f})))
+
+            content = self.event_loop.run_until_complete(
+                tasks.Task(r.read(True)))
+
+            f.seek(0)
+            filename = os.path.split(f.name)[-1]
+
+            self.assertNotIn('Transfer-Encoding', content['headers'])
+            self.assertIn('Content-Length', content['headers'])
+            self.assertEqual(1, len(content['multipart-data']))
+            self.assertEqual(
+                filename, content['multipart-data'][0]['filename'])
+            self.assertEqual(
+                f.read().decode(), content['multipart-data'][0]['data'])
+            self.assertEqual(r.status, 200)
+
     def test_POST_FILES_STR(self):
         url = self.server.url('method', 'post')
 
@@ -290,6 +314,13 @@ class FunctionalTests(unittest.TestCase):
             api.request('get', self.server.url('encoding', 'gzip'))))
         self.assertEqual(r.status, 200)
 
+    def test_broken_encoding(self):
+        self.assertRaises(
+            utils.DecompressionError,
+            self.event_loop.run_until_complete,
+            tasks.Task(
+                api.request('get', self.server.url('encoding', 'broken'))))
+
     def test_chunked(self):
         r = self.event_loop.run_until_complete(tasks.Task(
             api.request('get', self.server.url('chunked'))))
@@ -298,13 +329,51 @@ class FunctionalTests(unittest.TestCase):
         content = self.event_loop.run_until_complete(tasks.Task(r.read(True)))
         self.assertEqual(content['path'], '/chunked')
 
+    def test_stream_iter_chunks(self):
+        r = self.event_loop.run_until_complete(tasks.Task(
+            api.request('get', self.server.url('chunked'), stream=True)))
+        self.assertEqual(r.status, 200)
+        self.assertIsNone(r.content)
+
+        @tasks.coroutine
+        def read():
+            chunks = []
+            for coro in r.iter_chunks(10):
+                chunk = yield from coro
+                self.assertLessEqual(len(chunk), 10)
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+        content = self.event_loop.run_until_complete(tasks.Task(read()))
+        self.assertIn(b'"path": "/chunked"', content)
+        self.assertTrue(r.isclosed())
+
+    def test_stream_read_into(self):
+        r = self.event_loop.run_until_complete(tasks.Task(
+            api.request('get', self.server.url('method', 'get'),
+                        stream=True)))
+
+        @tasks.coroutine
+        def read():
+            buf = bytearray(16)
+            data = bytearray()
+            while True:
+                size = yield from r.read_into(buf)
+                if not size:
+                    break
+                data.extend(buf[:size])
+            return bytes(data)
+
+        content = self.event_loop.run_until_complete(tasks.Task(read()))
+        self.assertIn(b'"method": "GET"', content)
+
     def _test_timeout(self):
         self.server.noresponse = True
         self.assertRaises(
-            tulip.futures.CancelledError,
+            tulip.futures.TimeoutError,
             self.event_loop.run_until_complete,
             api.request('get', self.server.url('method', 'get'),
-                        timeout=0.1))
+                        timeout=api.Timeout(first_byte=0.1)))
 
     def test_request_conn_error(self):
         self.assertRaises(
@@ -313,6 +382,38 @@ class FunctionalTests(unittest.TestCase):
             tasks.Task(
                 api.request('get', 'http://0.0.0.0:9989', timeout=0.1)))
 
+    def test_stale_keep_alive_connection(self):
+        connections = []
+
+        class Server(tulip.Protocol):
+
+            def connection_made(self, transport):
+                self.transport = transport
+                connections.append(self)
+
+            def data_received(self, data):
+                if self is connections[0]:
+                    # server closed idle keep-alive connection
+                    self.transport.close()
+                else:
+                    self.transport.write(
+                        b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+
+        self.event_loop.start_serving(Server, '127.0.0.1', 9997)
+        conn_pool = pool.ConnectionPool()
+
+        conn = self.event_loop.run_until_complete(tasks.Task(
+            conn_pool.acquire('127.0.0.1', 9997)))
+        conn.release()
+
+        r = self.event_loop.run_until_complete(tasks.Task(
+            api.request('get', 'http://127.0.0.1:9997/', pool=conn_pool)))
+        self.assertEqual(r.status, 200)
+        self.assertEqual(b'ok', r.content)
+        self.assertEqual(2, len(connections))
+
+        conn_pool.close()
+
     def test_stream(self):
         wstream, response_fut = self.event_loop.run_until_complete(
             tasks.Task(
@@ -327,6 +428,122 @@ class FunctionalTests(unittest.TestCase):
         self.assertEqual(r.status, 200)
         self.assertIn('"method": "GET"', content)
 
+    def test_session(self):
+        session = api.Session(headers={'X-Test': 'session'})
+
+        r = self.event_loop.run_until_complete(tasks.Task(
+            session.get(self.server.url('cookies'))))
+        self.assertEqual(r.status, 200)
+        self.assertEqual('val1', session.cookies.get('c1'))
+
+        r = self.event_loop.run_until_complete(tasks.Task(
+            session.get(self.server.url('method', 'get'),
+                        headers={'X-Other': 'request'})))
+        content = self.event_loop.run_until_complete(tasks.Task(r.read(True)))
+        self.assertEqual('session', content['headers']['X-Test'])
+        self.assertEqual('request', content['headers']['X-Other'])
+        self.assertEqual('c1=val1', content['headers']['Cookie'])
+
+        session.close()
+
+    def test_session_cookies_cross_host_redirect(self):
+        session = api.Session()
+
+        # cookie of 127.0.0.1 is not sent to localhost
+        r = self.event_loop.run_until_complete(tasks.Task(
+            session.get(self.server.url('redirect_host', 'localhost'))))
+        content = self.event_loop.run_until_complete(tasks.Task(r.read(True)))
+        self.assertEqual(r.status, 200)
+        self.assertEqual('val1', session.cookies.get('c1'))
+        self.assertNotIn('Cookie', content['headers'])
+
+        r = self.event_loop.run_until_complete(tasks.Task(
+            session.get(self.server.url('method', 'get'))))
+        content = self.event_loop.run_until_complete(tasks.Task(r.read(True)))
+        self.assertEqual('c1=val1', content['headers']['Cookie'])
+
+        session.close()
+
+    def test_cache_revalidate(self):
+        cache = HttpCache()
+        url = self.server.url('etag')
+
+        r1 = self.event_loop.run_until_complete(tasks.Task(
+            api.request('get', url, cache=cache)))
+        self.assertEqual(r1.status, 200)
+        self.assertFalse(r1.from_cache)
+
+        r2 = self.event_loop.run_until_complete(tasks.Task(
+            api.request('get', url, cache=cache)))
+        self.assertEqual(r2.status, 200)
+        self.assertTrue(r2.from_cache)
+        self.assertEqual(r1.content, r2.content)
+
+        # fresh after 304 refreshed Cache-Control
+        entry = cache.lookup(HttpRequest('get', url))
+        self.assertTrue(entry.is_fresh(HttpRequest('get', url)))
+
+    def test_pipeline(self):
+        urls = [self.server.url('method', 'get')] * 3
+        responses = self.event_loop.run_until_complete(tasks.Task(
+            api.pipeline('get', urls, depth=2)))
+
+        self.assertEqual(3, len(responses))
+        for r in responses:
+            self.assertEqual(r.status, 200)
+            self.assertIn('"method": "GET"', r.content.decode())
+
+    def test_pipeline_large_bodies(self):
+        # more than default read limit through real transport,
+        # nothing reports consumed data to protocol in pipeline
+        size = protocol.DEFAULT_READ_LIMIT
+        urls = [self.server.url('large', size)] * 3
+        responses = self.event_loop.run_until_complete(tasks.Task(
+            api.pipeline('get', urls, depth=3, timeout=10)))
+
+        self.assertEqual(3, len(responses))
+        for r in responses:
+            self.assertEqual(r.status, 200)
+            self.assertGreater(len(r.content), size)
+
+    def test_stream_large_body(self):
+        size = protocol.DEFAULT_READ_LIMIT * 2
+        wstream, response_fut = self.event_loop.run_until_complete(
+            tasks.Task(api.stream('get', self.server.url('large', size))))
+
+        r = self.event_loop.run_until_complete(tasks.Task(response_fut))
+        content = self.event_loop.run_until_complete(
+            tasks.Task(r.read(), timeout=10))
+        self.assertGreater(len(content), size)
+
+    def test_stream_open_past_timeout(self):
+        wstream, response_fut = self.event_loop.run_until_complete(
+            tasks.Task(api.stream(
+                'get', self.server.url('method', 'get'), timeout=0.2)))
+        r = self.event_loop.run_until_complete(tasks.Task(response_fut))
+
+        # timeout covers response headers only
+        self.event_loop.run_until_complete(tasks.Task(tulip.sleep(0.5)))
+        content = self.event_loop.run_until_complete(tasks.Task(r.read()))
+        self.assertEqual(r.status, 200)
+        self.assertIn(b'"method": "GET"', content)
+        self.assertIsNone(r.timer)
+
+    def test_pipeline_not_idempotent(self):
+        self.assertRaises(
+            ValueError,
+            self.event_loop.run_until_complete,
+            tasks.Task(api.pipeline('post', [self.server.url('method')])))
+
+    def test_pipeline_depth(self):
+        for depth in (0, -1):
+            self.assertRaises(
+                ValueError,
+                self.event_loop.run_until_complete,
+                tasks.Task(api.pipeline(
+                    'get', [self.server.url('method', 'get')],
+                    depth=depth)))
+
     def _test_stream_conn_error(self):
         self.assertRaises(
             ValueError,
@@ -358,6 +575,35 @@ class HttpClientFunctional(Router):
                 self._start_response(302),
                 headers={'Location': self._path})
 
+    @Router.define('/redirect_host/([a-z0-9.]+)$')
+    def redirect_host(self, match):
+        self._response(
+            self._start_response(302),
+            headers={'Location': 'http://%s:%s/method/get' % (
+                match.group(1), self._server.port),
+                'Set-Cookie': 'c1=val1; Path=/'})
+
+    @Router.define('/cookies$')
+    def cookies(self, match):
+        self._response(
+            self._start_response(200),
+            headers={'Set-Cookie': 'c1=val1; Path=/'})
+
+    @Router.define('/large/([0-9]+)$')
+    def large(self, match):
+        self._response(self._start_response(200),
+                       body='x' * int(match.group(1)))
+
+    @Router.define('/etag$')
+    def etag(self, match):
+        if self._headers.get('if-none-match') == '"v1"':
+            self._response(self._start_response(304),
+                           headers={'Cache-Control': 'max-age=60'})
+        else:
+            self._response(self._start_response(200),
+                           headers={'ETag': '"v1"',
+                                    'Cache-Control': 'no-cache'})
+
     @Router.define('/encoding/(gzip|deflate)$')
     def encoding(self, match):
         mode = match.group(1)
@@ -367,6 +613,11 @@ class HttpClientFunctional(Router):
         resp.add_chunking_filter(100)
         self._response(resp, headers={'Content-encoding': mode}, chunked=True)
 
+    @Router.define('/encoding/broken$')
+    def encoding_broken(self, match):
+        self._response(self._start_response(200),
+                       headers={'Content-Encoding': 'gzip'})
+
     @Router.define('/chunked$')
     def chunked(self, match):
         resp = self._start_response(200)
@@ -0,0 +1,110 @@
+"""http headers"""
+
+
+class Headers:
+    """Case-insensitive multidict for http headers.
+
+    Keeps headers in insertion order with original name case,
+    lookups go through index of lowercased names.
+    """
+
+    __slots__ = ('_items', '_index')
+
+    def __init__(self, headers=None):
+        self._items = []
+        self._index = {}
+
+        if headers:
+            if isinstance(headers, (dict, Headers)):
+                headers = headers.items()
+            for name, value in headers:
+                self.add(name, value)
+
+    def __repr__(self):
+        return '<Headers %r>' % (self._items,)
+
+    def __str__(self):
+        return ''.join('%s: %s\n' % item for item in self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, name):
+        return name.lower() in self._index
+
+    def __getitem__(self, name):
+        return self._index[name.lower()][0]
+
+    def __setitem__(self, name, value):
+        """Replace all values of header."""
+        if name.lower() in self._index:
+            del self[name]
+        self.add(name, value)
+
+    def __delitem__(self, name):
+        """Remove all values of header, missing header is ignored."""
+        lname = name.lower()
+        if self._index.pop(lname, None) is not None:
+            self._items = [item for item in self._items
+                           if item[0].lower() != lname]
+
+    def add(self, name, value):
+        """Add header value, keep existing values."""
+        self._items.append((name, value))
+
+        lname = name.lower()
+        values = self._index.get(lname)
+        if values is None:
+            self._index[lname] = [value]
+        else:
+            values.append(value)
+
+    def get(self, name, default=None):
+        values = self._index.get(name.lower())
+        if values is None:
+            return default
+        return values[0]
+
+    def get_all(self, name, default=None):
+        values = self._index.get(name.lower())
+        if values is None:
+            return default
+        return list(values)
+
+    def setdefault(self, name, default):
+        values = self._index.get(name.lower())
+        if values is None:
+            self.add(name, default)
+            return default
+        return values[0]
+
+    def keys(self):
+        return [name for name, value in self._items]
+
+    def values(self):
+        return [value for name, value in self._items]
+
+    def items(self):
+        return list(self._items)
+
+    def copy(self):
+        headers = Headers()
+        headers._items = list(self._items)
+        headers._index = {name: list(values)
+                          for name, values in self._index.items()}
+        return headers
+
+    def get_content_type(self):
+        """Lowercased maintype/subtype of Content-Type header."""
+        ctype = self.get('content-type', '').split(';', 1)[0].strip().lower()
+        if ctype.count('/') != 1:
+            return 'text/plain'
+        return ctype
+
+    def tobytes(self, encoding='latin1'):
+        """Serialize headers block, without terminating empty line."""
+        return ''.join(
+            '%s: %s\r\n' % item for item in self._items).encode(encoding)
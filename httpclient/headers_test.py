@@ -0,0 +1,69 @@
+"""Tests for headers.py"""
+
+import unittest
+
+from .headers import Headers
+
+
+class HeadersTests(unittest.TestCase):
+
+    def test_case_insensitive(self):
+        headers = Headers({'Content-Type': 'text/html'})
+        self.assertIn('content-type', headers)
+        self.assertIn('CONTENT-TYPE', headers)
+        self.assertEqual('text/html', headers['content-type'])
+        self.assertEqual('text/html', headers.get('Content-type'))
+        self.assertEqual(['Content-Type'], headers.keys())
+
+    def test_missing(self):
+        headers = Headers()
+        self.assertNotIn('host', headers)
+        self.assertIsNone(headers.get('host'))
+        self.assertEqual('', headers.get('host', ''))
+        self.assertIsNone(headers.get_all('host'))
+        self.assertRaises(KeyError, headers.__getitem__, 'host')
+
+    def test_multi(self):
+        headers = Headers([('Set-Cookie', 'a=1'), ('set-cookie', 'b=2')])
+        self.assertEqual(2, len(headers))
+        self.assertEqual('a=1', headers['set-cookie'])
+        self.assertEqual(['a=1', 'b=2'], headers.get_all('SET-COOKIE'))
+
+    def test_setitem_replaces(self):
+        headers = Headers([('Accept', 'a'), ('accept', 'b'), ('Host', 'h')])
+        headers['ACCEPT'] = 'c'
+        self.assertEqual([('Host', 'h'), ('ACCEPT', 'c')], headers.items())
+
+    def test_delitem(self):
+        headers = Headers([('Accept', 'a'), ('Host', 'h'), ('accept', 'b')])
+        del headers['accept']
+        del headers['missing']
+        self.assertEqual([('Host', 'h')], headers.items())
+        self.assertNotIn('accept', headers)
+
+    def test_setdefault(self):
+        headers = Headers({'Accept': 'a'})
+        self.assertEqual('a', headers.setdefault('accept', 'b'))
+        self.assertEqual('b', headers.setdefault('Host', 'b'))
+        self.assertEqual([('Accept', 'a'), ('Host', 'b')], headers.items())
+
+    def test_copy(self):
+        headers = Headers({'Accept': 'a'})
+        copy = headers.copy()
+        copy.add('accept', 'b')
+        self.assertEqual(['a'], headers.get_all('accept'))
+        self.assertEqual(['a', 'b'], copy.get_all('accept'))
+
+    def test_content_type(self):
+        headers = Headers({'Content-Type': 'Text/HTML; charset=utf-8'})
+        self.assertEqual('text/html', headers.get_content_type())
+        self.assertEqual('text/plain', Headers().get_content_type())
+
+    def test_tobytes(self):
+        headers = Headers([('Host', 'python.org'), ('Content-Length', 10)])
+        self.assertEqual(
+            b'Host: python.org\r\nContent-Length: 10\r\n', headers.tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
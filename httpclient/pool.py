@@ -0,0 +1,289 @@
+"""keep-alive connection pool"""
+
+__all__ = ['ConnectionPool', 'default_pool']
+
+import collections
+import time
+import weakref
+
+from tulip import events
+from tulip import futures
+from tulip import tasks
+
+from .protocol import HttpProtocol
+from .resolver import Resolver
+
+
+class Connection:
+    """Pooled connection, wraps transport and protocol."""
+
+    def __init__(self, pool, key, transport, protocol):
+        self.pool = pool
+        self.key = key
+        self.transport = transport
+        self.protocol = protocol
+        self.idle_since = None
+        self.reused = False  # was idle in pool before
+
+    def __repr__(self):
+        return '<Connection %s:%s ssl=%s>' % self.key
+
+    @property
+    def stream(self):
+        return self.protocol.stream
+
+    def is_connected(self):
+        return self.transport is not None and self.protocol.connected
+
+    def release(self):
+        """Return connection to the pool."""
+        if self.pool is not None:
+            self.pool.release(self)
+
+    def close(self):
+        """Close transport and free pool slot."""
+        if self.pool is not None:
+            self.pool.discard(self)
+        elif self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class ConnectionPool:
+    """Pool of idle http/1.1 connections per (host, port, ssl).
+
+    max_connections: limit of open connections (busy and idle)
+    max_per_host: limit of open connections per (host, port, ssl)
+    idle_timeout: seconds an idle connection is kept open
+    resolver: (optional) Resolver, caches dns lookups and races
+      connections to addresses of host
+    """
+
+    def __init__(self, *, max_connections=100, max_per_host=10,
+                 idle_timeout=30.0, protocol_factory=HttpProtocol,
+                 resolver=None):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.protocol_factory = protocol_factory
+        self.resolver = resolver if resolver is not None else Resolver()
+
+        self._idle = {}
+        self._counts = collections.Counter()
+        self._total = 0
+        self._waiters = collections.deque()  # (key, future)
+        self._cleanup_handle = None
+        self._closed = False
+
+    def __repr__(self):
+        return '<ConnectionPool total=%s idle=%s>' % (
+            self._total, sum(len(c) for c in self._idle.values()))
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @tasks.coroutine
+    def acquire(self, host, port, ssl=False, timeout=None, reuse=True):
+        """Check out connection to host, open new one if none is idle.
+
+        TimeoutError is raised if waiting for free connection slot and
+        connecting take more than timeout seconds. With reuse=False
+        idle connections to host are closed and new one is opened.
+        """
+        if self._closed:
+            raise RuntimeError('Connection pool is closed.')
+
+        key = (host, port, ssl)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        if not reuse:
+            for conn in self._idle.get(key, ())[:]:
+                self.discard(conn)
+
+        while True:
+            conn = self._get_idle(key)
+            if conn is not None:
+                return conn
+
+            if self._has_capacity(key):
+                break
+
+            waiter = futures.Future()
+            self._waiters.append((key, waiter))
+            if deadline is None:
+                yield from waiter
+            else:
+                handle = events.get_event_loop().call_later(
+                    deadline - time.monotonic(), _expire, waiter)
+                try:
+                    yield from waiter
+                finally:
+                    handle.cancel()
+
+            if self._closed:
+                raise RuntimeError('Connection pool is closed.')
+
+        self._total += 1
+        self._counts[key] += 1
+        try:
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+            transport, protocol = yield from self._connect(
+                host, port, ssl, timeout)
+        except:
+            self._total -= 1
+            self._counts[key] -= 1
+            self._wakeup()
+            raise
+
+        return Connection(self, key, transport, protocol)
+
+    def _connect(self, host, port, ssl, timeout=None):
+        return self.resolver.connect(
+            self.protocol_factory, host, port, ssl, timeout)
+
+    def release(self, conn):
+        """Put connection to idle list."""
+        if conn.pool is not self:
+            return
+
+        if self._closed or not conn.is_connected():
+            self.discard(conn)
+            return
+
+        conn.idle_since = time.monotonic()
+        conn.reused = True
+        self._idle.setdefault(conn.key, []).append(conn)
+        self._schedule_cleanup()
+        self._wakeup()
+
+    def discard(self, conn):
+        """Close connection and forget about it."""
+        if conn.pool is not self:
+            return
+
+        idle = self._idle.get(conn.key)
+        if idle and conn in idle:
+            idle.remove(conn)
+            if not idle:
+                del self._idle[conn.key]
+
+        conn.pool = None
+        if conn.transport is not None:
+            conn.transport.close()
+            conn.transport = None
+
+        self._total -= 1
+        self._counts[conn.key] -= 1
+        if not self._counts[conn.key]:
+            del self._counts[conn.key]
+
+        self._wakeup()
+
+    def close(self):
+        """Close all idle connections, refuse new checkouts.
+
+        Busy connections are closed when they get released."""
+        self._closed = True
+
+        for conns in list(self._idle.values()):
+            for conn in list(conns):
+                self.discard(conn)
+
+        if self._cleanup_handle is not None:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
+
+        while self._waiters:
+            key, waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _get_idle(self, key):
+        conns = self._idle.get(key)
+        while conns:
+            conn = conns[-1]  # most recently used first
+            if conn.is_connected():
+                conns.pop()
+                if not conns:
+                    del self._idle[key]
+                conn.idle_since = None
+                return conn
+
+            self.discard(conn)
+            conns = self._idle.get(key)
+
+    def _has_capacity(self, key):
+        if self._total < self.max_connections:
+            if self._counts[key] < self.max_per_host:
+                return True
+
+        # free slot by closing idle connection of other host
+        if self._counts[key] < self.max_per_host:
+            for other, conns in list(self._idle.items()):
+                if other != key and conns:
+                    self.discard(conns[0])
+                    return True
+
+        return False
+
+    def _can_acquire(self, key):
+        """Same check as _get_idle() and _has_capacity(), without
+        taking or closing connections."""
+        if self._idle.get(key):
+            return True
+        if self._counts[key] >= self.max_per_host:
+            return False
+        return self._total < self.max_connections or any(
+            conns for other, conns in self._idle.items() if other != key)
+
+    def _wakeup(self):
+        """Wake oldest waiter that can check out connection now,
+        waiters for hosts at their limit keep their place."""
+        waiters = collections.deque()
+        woken = False
+        for key, waiter in self._waiters:
+            if waiter.done():
+                continue
+            if not woken and self._can_acquire(key):
+                waiter.set_result(None)
+                woken = True
+            else:
+                waiters.append((key, waiter))
+        self._waiters = waiters
+
+    def _schedule_cleanup(self):
+        if self._cleanup_handle is None and self.idle_timeout is not None:
+            self._cleanup_handle = events.get_event_loop().call_later(
+                self.idle_timeout, self._cleanup)
+
+    def _cleanup(self):
+        self._cleanup_handle = None
+
+        deadline = time.monotonic() - self.idle_timeout
+        for conns in list(self._idle.values()):
+            for conn in list(conns):
+                if conn.idle_since <= deadline or not conn.is_connected():
+                    self.discard(conn)
+
+        if self._idle:
+            self._schedule_cleanup()
+
+
+def _expire(waiter):
+    if not waiter.done():
+        waiter.set_exception(
+            futures.TimeoutError('Timed out waiting for connection'))
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def default_pool():
+    """Return connection pool shared by requests of current event loop."""
+    event_loop = events.get_event_loop()
+    pool = _pools.get(event_loop)
+    if pool is None or pool.closed:
+        pool = _pools[event_loop] = ConnectionPool()
+    return pool
@@ -0,0 +1,154 @@
+"""Tests for pool.py"""
+
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import futures
+from tulip import tasks
+
+from .pool import ConnectionPool
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+        self.pool = ConnectionPool(max_connections=2, max_per_host=1)
+        self.pool._connect = self._connect
+
+    def tearDown(self):
+        self.pool.close()
+        self.event_loop.close()
+
+    @tasks.coroutine
+    def _connect(self, host, port, ssl, timeout=None):
+        protocol = unittest.mock.Mock()
+        protocol.connected = True
+        return unittest.mock.Mock(), protocol
+
+    def acquire(self, host='python.org', port=80, ssl=False, reuse=True):
+        return self.event_loop.run_until_complete(
+            tasks.Task(self.pool.acquire(host, port, ssl, reuse=reuse)))
+
+    def test_reuse(self):
+        conn = self.acquire()
+        conn.release()
+
+        self.assertIs(conn, self.acquire())
+
+    def test_reused_flag(self):
+        conn = self.acquire()
+        self.assertFalse(conn.reused)
+        conn.release()
+        self.assertTrue(self.acquire().reused)
+
+    def test_acquire_no_reuse(self):
+        conn = self.acquire()
+        transport = conn.transport
+        conn.release()
+
+        new_conn = self.acquire(reuse=False)
+        self.assertIsNot(conn, new_conn)
+        self.assertFalse(new_conn.reused)
+        self.assertTrue(transport.close.called)
+        self.assertEqual(1, self.pool._total)
+
+    def test_no_reuse_disconnected(self):
+        conn = self.acquire()
+        transport = conn.transport
+        conn.protocol.connected = False
+        conn.release()
+
+        self.assertTrue(transport.close.called)
+        self.assertIsNot(conn, self.acquire())
+
+    def test_key(self):
+        conn = self.acquire()
+        conn.release()
+
+        self.assertIsNot(conn, self.acquire(ssl=True))
+
+    def test_close_discard(self):
+        conn = self.acquire()
+        transport = conn.transport
+        conn.close()
+
+        self.assertTrue(transport.close.called)
+        self.assertEqual(0, self.pool._total)
+
+    def test_per_host_limit(self):
+        conn = self.acquire()
+
+        task = tasks.Task(self.pool.acquire('python.org', 80, False))
+        self.event_loop.run_once()
+        self.assertFalse(task.done())
+
+        conn.release()
+        self.assertIs(conn, self.event_loop.run_until_complete(task))
+
+    def test_wakeup_waiter_of_released_host(self):
+        conn_a = self.acquire('a')
+        conn_b = self.acquire('b')
+
+        task_a = tasks.Task(self.pool.acquire('a', 80, False))
+        task_b = tasks.Task(self.pool.acquire('b', 80, False))
+        self.event_loop.run_once()
+
+        # waiter of 'a' is older, but 'a' is still at its limit
+        conn_b.release()
+        self.assertIs(conn_b, self.event_loop.run_until_complete(
+            task_b, timeout=0.2))
+        self.assertFalse(task_a.done())
+
+        conn_a.release()
+        self.assertIs(conn_a, self.event_loop.run_until_complete(task_a))
+
+    def test_acquire_timeout(self):
+        conn = self.acquire()
+
+        task = tasks.Task(
+            self.pool.acquire('python.org', 80, False, timeout=0.01))
+        self.assertRaises(
+            futures.TimeoutError, self.event_loop.run_until_complete, task)
+
+        # slot of timed out waiter is not lost
+        conn.release()
+        self.assertIs(conn, self.acquire())
+
+    def test_total_limit_closes_idle(self):
+        conn1 = self.acquire('python.org')
+        conn2 = self.acquire('example.com')
+        conn1.release()
+
+        conn3 = self.acquire('example.org')
+        self.assertTrue(conn1.transport is None)
+        self.assertEqual(2, self.pool._total)
+
+        conn2.close()
+        conn3.close()
+
+    def test_close(self):
+        conn = self.acquire()
+        transport = conn.transport
+        conn.release()
+
+        self.pool.close()
+        self.assertTrue(transport.close.called)
+        self.assertRaises(RuntimeError, self.acquire)
+
+    def test_idle_timeout(self):
+        self.pool.idle_timeout = 0.0
+        conn = self.acquire()
+        transport = conn.transport
+        conn.release()
+
+        self.pool._cleanup()
+        self.assertTrue(transport.close.called)
+        self.assertEqual(0, self.pool._total)
+
+
+if __name__ == '__main__':
+    unittest.main()
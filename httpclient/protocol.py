@@ -2,22 +2,147 @@
 __all__ = ['HttpProtocol']
 
 import tulip
+from tulip import futures
+from tulip import tasks
+
+DEFAULT_READ_LIMIT = 256 * 1024
 
 
 class HttpProtocol(tulip.Protocol):
+    """Http client protocol with flow control.
+
+    Reading from transport is paused when stream and current response
+    payload buffer more than read_limit bytes, and resumed when
+    consumer reads buffered data down to quarter of read_limit.
+    Limit is off until set_read_limit() is called by response that
+    reports consumed data, other readers of stream (pipeline, stream())
+    never resume reading. Transports without pause_reading() are
+    not paused. Received data moves read deadline of attached timer.
+    """
 
     stream = None
     transport = None
+    connected = False
+    paused_writing = False
+
+    read_limit = None  # flow control is off
+    paused_reading = False
+    payload = None  # payload stream of current response
+    timer = None  # timeouts.RequestTimer of current request
+    exception = None  # set by abort()
+    bytes_received = 0
+
+    _drain_waiter = None
 
     def connection_made(self, transport):
         self.transport = transport
         self.stream = tulip.http.HttpStreamReader()
+        self.connected = True
 
     def data_received(self, data):
+        self.bytes_received += len(data)
         self.stream.feed_data(data)
+        if self.timer is not None:
+            self.timer.data_received()
+
+        if (not self.paused_reading and self.read_limit and
+                self.buffer_size() > self.read_limit):
+            pause_reading = getattr(self.transport, 'pause_reading', None)
+            if pause_reading is not None:
+                self.paused_reading = True
+                pause_reading()
+                # consumer is slow, not the server
+                if self.timer is not None:
+                    self.timer.suspend()
+
+    def buffer_size(self):
+        """Bytes received but not read by consumer yet."""
+        size = getattr(self.stream, 'byte_count', 0)
+        if self.payload is not None:
+            size += getattr(self.payload, 'byte_count', 0)
+        return size
+
+    def set_read_limit(self, limit=None):
+        """Set read_limit, DEFAULT_READ_LIMIT is used for None,
+        0 turns flow control off."""
+        if limit is None:
+            limit = DEFAULT_READ_LIMIT
+        self.read_limit = limit
+        self.data_consumed()
+
+    def data_consumed(self):
+        """Consumer read buffered data, resume reading if buffer
+        is drained below low-water mark."""
+        if self.paused_reading and (
+                not self.read_limit or
+                self.buffer_size() <= self.read_limit // 4):
+            self.paused_reading = False
+            resume_reading = getattr(self.transport, 'resume_reading', None)
+            if self.connected and resume_reading is not None:
+                resume_reading()
+            if self.timer is not None:
+                self.timer.data_received()
 
     def eof_received(self):
+        self.connected = False
         self.stream.feed_eof()
 
     def connection_lost(self, exc):
-        pass
+        self.connected = False
+        self._wakeup_drain(exc or ConnectionResetError('Connection lost'))
+
+    def abort(self, exc):
+        """Fail pending reads and drain() with exc, close transport."""
+        self.exception = exc
+        self._wakeup_drain(exc)
+        for stream in (self.stream, self.payload):
+            if stream is not None:
+                _set_exception(stream, exc)
+        if self.transport is not None:
+            self.transport.close()
+
+    def pause_writing(self):
+        """Transport write buffer is over high-water mark."""
+        self.paused_writing = True
+
+    def resume_writing(self):
+        """Transport write buffer is drained below low-water mark."""
+        self.paused_writing = False
+        self._wakeup_drain()
+
+    def _wakeup_drain(self, exc=None):
+        waiter = self._drain_waiter
+        if waiter is not None:
+            self._drain_waiter = None
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+
+    @tasks.coroutine
+    def drain(self):
+        """Wait until transport accepts more data."""
+        if not self.paused_writing:
+            return
+
+        if not self.connected:
+            raise ConnectionResetError('Connection lost')
+
+        if self._drain_waiter is None:
+            self._drain_waiter = futures.Future()
+        yield from self._drain_waiter
+
+
+def _set_exception(stream, exc):
+    set_exception = getattr(stream, 'set_exception', None)
+    if set_exception is not None:
+        set_exception(exc)
+        return
+
+    # stream without set_exception(), wake pending read and make
+    # next reads hit eof, consumer checks protocol.exception
+    waiter = getattr(stream, 'waiter', None)
+    if waiter is not None and not waiter.done():
+        waiter.set_exception(exc)
+    stream.feed_eof()
@@ -0,0 +1,135 @@
+"""Tests for protocol.py"""
+
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import futures
+from tulip import tasks
+
+from .protocol import DEFAULT_READ_LIMIT, HttpProtocol
+
+
+class HttpProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+        self.protocol = HttpProtocol()
+        self.protocol.connection_made(unittest.mock.Mock())
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def test_drain_not_paused(self):
+        task = tasks.Task(self.protocol.drain())
+        self.event_loop.run_until_complete(task)
+        self.assertTrue(task.done())
+
+    def test_drain_paused(self):
+        self.protocol.pause_writing()
+
+        task = tasks.Task(self.protocol.drain())
+        self.event_loop.run_once()
+        self.assertFalse(task.done())
+
+        self.protocol.resume_writing()
+        self.event_loop.run_until_complete(task)
+        self.assertFalse(self.protocol.paused_writing)
+
+    def test_drain_connection_lost(self):
+        self.protocol.pause_writing()
+
+        task = tasks.Task(self.protocol.drain())
+        self.event_loop.run_once()
+        self.protocol.connection_lost(None)
+
+        self.assertRaises(
+            ConnectionResetError, self.event_loop.run_until_complete, task)
+
+    def test_pause_reading(self):
+        transport = self.protocol.transport
+        self.protocol.stream = unittest.mock.Mock(byte_count=0)
+        self.protocol.payload = unittest.mock.Mock(byte_count=0)
+        self.protocol.set_read_limit(100)
+
+        self.protocol.stream.byte_count = 50
+        self.protocol.data_received(b'x' * 50)
+        self.assertFalse(transport.pause_reading.called)
+
+        self.protocol.payload.byte_count = 60
+        self.protocol.data_received(b'x' * 60)
+        self.assertTrue(transport.pause_reading.called)
+        self.assertTrue(self.protocol.paused_reading)
+
+        self.protocol.stream.byte_count = 0
+        self.protocol.data_consumed()
+        self.assertFalse(transport.resume_reading.called)
+
+        self.protocol.payload.byte_count = 25
+        self.protocol.data_consumed()
+        self.assertTrue(transport.resume_reading.called)
+        self.assertFalse(self.protocol.paused_reading)
+
+    def test_read_limit_disabled(self):
+        transport = self.protocol.transport
+        self.protocol.stream = unittest.mock.Mock(byte_count=1000)
+        self.protocol.set_read_limit(100)
+        self.protocol.data_received(b'x')
+        self.assertTrue(self.protocol.paused_reading)
+
+        self.protocol.set_read_limit(0)
+        self.assertTrue(transport.resume_reading.called)
+
+        self.protocol.data_received(b'x')
+        self.assertFalse(self.protocol.paused_reading)
+
+        self.protocol.set_read_limit()
+        self.assertEqual(DEFAULT_READ_LIMIT, self.protocol.read_limit)
+
+    def test_read_limit_off_by_default(self):
+        self.protocol.stream = unittest.mock.Mock(byte_count=1 << 20)
+        self.protocol.data_received(b'x')
+        self.assertFalse(self.protocol.paused_reading)
+        self.assertFalse(self.protocol.transport.pause_reading.called)
+
+    def test_transport_without_pause_reading(self):
+        self.protocol.transport = unittest.mock.Mock(spec=['write', 'close'])
+        self.protocol.stream = unittest.mock.Mock(byte_count=1000)
+        self.protocol.set_read_limit(100)
+
+        self.protocol.data_received(b'x')
+        self.assertFalse(self.protocol.paused_reading)
+
+    def test_abort(self):
+        self.protocol.stream = unittest.mock.Mock()
+        self.protocol.pause_writing()
+
+        task = tasks.Task(self.protocol.drain())
+        self.event_loop.run_once()
+
+        exc = futures.TimeoutError()
+        self.protocol.abort(exc)
+        self.assertRaises(
+            futures.TimeoutError, self.event_loop.run_until_complete, task)
+        self.protocol.stream.set_exception.assert_called_with(exc)
+        self.assertTrue(self.protocol.transport.close.called)
+        self.assertIs(exc, self.protocol.exception)
+
+    def test_timer(self):
+        timer = self.protocol.timer = unittest.mock.Mock()
+        self.protocol.stream = unittest.mock.Mock(byte_count=1000)
+        self.protocol.set_read_limit(100)
+
+        self.protocol.data_received(b'x')
+        self.assertTrue(timer.data_received.called)
+        self.assertTrue(timer.suspend.called)
+
+        timer.reset_mock()
+        self.protocol.set_read_limit(0)
+        self.assertTrue(timer.data_received.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,18 +2,24 @@
 
 import base64
 import collections
-import email.message
+import collections.abc
 import http.client
 import http.cookies
 import io
 import itertools
 import mimetypes
 import os
+import stat
 import uuid
 import urllib.parse
 
 import tulip
 import tulip.http
+from tulip import events
+from tulip import tasks
+
+from .headers import Headers
+from .utils import ACCEPT_ENCODING, DeflateIter
 
 
 class HttpRequest:
@@ -21,10 +27,11 @@ class HttpRequest:
     GET_METHODS = {'DELETE', 'GET', 'HEAD', 'OPTIONS'}
     POST_METHODS = {'PATCH', 'POST', 'PUT', 'TRACE'}
     ALL_METHODS = GET_METHODS.union(POST_METHODS)
+    IDEMPOTENT_METHODS = {'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT', 'TRACE'}
 
     DEFAULT_HEADERS = {
         'Accept': '*/*',
-        'Accept-Encoding': 'gzip, deflate',
+        'Accept-Encoding': ACCEPT_ENCODING,
     }
 
     body = b''
@@ -39,9 +46,13 @@ class HttpRequest:
                  encoding='utf-8',
                  version=(1, 1),
                  compress=None,
-                 chunked=None):
+                 chunked=None,
+                 offload_size=None,
+                 executor=None):
         self.method = method.upper()
         self.encoding = encoding
+        self.offload_size = offload_size
+        self.executor = executor
 
         if isinstance(version, str):
             v = [l.strip() for l in version.split('.', 1)]
@@ -109,17 +120,10 @@ class HttpRequest:
         self.path = urllib.parse.urlunsplit(('', '', path, query, fragment))
 
         # headers
-        self.headers = email.message.Message()
-        if headers:
-            if isinstance(headers, dict):
-                headers = list(headers.items())
-
-            for key, value in headers:
-                self.headers[key] = value
+        self.headers = Headers(headers)
 
         for hdr, val in self.DEFAULT_HEADERS.items():
-            if hdr not in self.headers:
-                self.headers[hdr] = val
+            self.headers.setdefault(hdr, val)
 
         # host
         if 'host' not in self.headers:
@@ -142,45 +146,62 @@ class HttpRequest:
 
         # auth
         if auth:
-            if isinstance(auth, (tuple, list)) and len(auth) == 2:
-                # basic auth
-                self.headers['Authorization'] = 'Basic %s' % (
-                    base64.b64encode(
-                        ('%s:%s' % (auth[0], auth[1])).encode('latin1'))
-                    .strip().decode('latin1'))
-            else:
-                raise ValueError("Only basic auth is supported")
+            self.headers['Authorization'] = auth_header(auth)
 
         self._params = (chunked, compress, files, data, encoding)
 
-    def start(self, transport):
+    def can_retry(self):
+        """Request is idempotent and its body can be sent again."""
+        chunked, compress, files, data, encoding = self._params
+        return (self.method in self.IDEMPOTENT_METHODS and not files and
+                not isinstance(data, collections.abc.Iterator))
+
+    def start(self, transport, protocol=None):
+        """Send request. Writes wait for protocol.drain() when
+        protocol is given."""
         chunked, compress, files, data, encoding = self._params
+        length = None
 
         request = tulip.http.Request(
             transport, self.method, self.path, self.version)
 
         # Content-encoding
+        compressor = None
         enc = self.headers.get('Content-Encoding', '').lower()
         if enc:
             if not chunked:  # enable chunked, no need to deal with length
                 chunked = True
-            request.add_compression_filter(enc)
+            compressor = DeflateIter(enc)
         elif compress:
             if not chunked:  # enable chunked, no need to deal with length
                 chunked = True
-            compress = compress if isinstance(compress, str) else 'deflate'
-            self.headers['Content-Encoding'] = compress
-            request.add_compression_filter(compress)
+            if isinstance(compress, DeflateIter):
+                compressor = compress.copy()
+            else:
+                compressor = DeflateIter(
+                    compress if isinstance(compress, str) else 'deflate')
+            self.headers['Content-Encoding'] = compressor.encoding
+
+        if compressor is not None and compressor.offload_size is None:
+            compressor.offload_size = self.offload_size
+            compressor.executor = self.executor
 
         # form data (x-www-form-urlencoded)
         if isinstance(data, dict):
             data = list(data.items())
 
-        if data and not files:
-            if not isinstance(data, str):
-                data = urllib.parse.urlencode(data, doseq=True)
+        if not files and isinstance(data, collections.abc.Iterator):
+            # streamed body, iterator of bytes or of coroutines
+            # returning bytes (see HttpResponse.iter_chunks())
+            self.body = data
+            if 'content-length' in self.headers:
+                length = int(self.headers['content-length'])
+            elif not chunked:
+                chunked = True
 
-            self.body = data.encode(encoding)
+        elif data and not files:
+            self.body = yield from self._encode(
+                payload_size(data), encode_form, data, encoding)
             if 'content-type' not in self.headers:
                 self.headers['content-type'] = (
                     'application/x-www-form-urlencoded')
@@ -217,11 +238,22 @@ class HttpRequest:
                     fn = guess_filename(fp, k)
                     fields.append((k, fn, fp, ft))
 
-            chunked = chunked or 8192
             boundary = uuid.uuid4().hex
 
-            self.body = encode_multipart_data(
-                fields, bytes(boundary, 'latin1'))
+            # seekable files, send with known length
+            body = None
+            if not chunked:
+                body = yield from self._encode(
+                    payload_size(fields), MultipartBody.from_fields,
+                    fields, bytes(boundary, 'latin1'), encoding)
+
+            if body is not None:
+                self.body = body
+                length = len(body)
+            else:
+                chunked = chunked or 8192
+                self.body = encode_multipart_data(
+                    fields, bytes(boundary, 'latin1'), encoding)
 
             if 'content-type' not in self.headers:
                 self.headers['content-type'] = (
@@ -245,7 +277,8 @@ class HttpRequest:
                 request.add_chunking_filter(8196)
             else:
                 self.chunked = False
-                self.headers['content-length'] = len(self.body)
+                self.headers['content-length'] = (
+                    len(self.body) if length is None else length)
 
         request.add_headers(*self.headers.items())
         request.send_headers()
@@ -254,10 +287,140 @@ class HttpRequest:
             self.body = (self.body,)
 
         for chunk in self.body:
+            if isinstance(chunk, FileRegion):
+                sendfile = not (self.ssl or self.chunked)
+                yield from chunk.write(
+                    request, transport, sendfile, protocol=protocol)
+                continue
+
+            if not isinstance(chunk, (bytes, bytearray, memoryview, str)):
+                chunk = yield from chunk
+            if isinstance(chunk, str):
+                chunk = chunk.encode(encoding)
+            if compressor is not None and chunk:
+                chunk = yield from compressor.feed_async(chunk)
+            if not chunk:
+                continue
+
             request.write(chunk)
+            if protocol is not None:
+                yield from protocol.drain()
+
+        if compressor is not None:
+            chunk = compressor.flush()
+            if chunk:
+                request.write(chunk)
 
         request.write_eof()
-        return []
+
+    def _encode(self, size, func, *args):
+        """Run func(*args) in executor if size is over offload_size."""
+        if self.offload_size is not None and size >= self.offload_size:
+            return (yield from events.get_event_loop().run_in_executor(
+                self.executor, func, *args))
+        return func(*args)
+
+
+class FileRegion:
+    """Region of seekable file in request body.
+
+    Region of on-disk file is sent with sendfile() of event loop
+    when event loop supports it, otherwise file is read in chunks
+    and written to request.
+    """
+
+    def __init__(self, fp, offset, count, can_sendfile=True):
+        self.fp = fp
+        self.offset = offset
+        self.count = count
+        self.can_sendfile = can_sendfile
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def from_file(cls, fp):
+        """Region from current position to the end of file, None if
+        fp is not a seekable file opened in binary mode."""
+        if isinstance(fp, io.TextIOBase):
+            return None
+
+        try:
+            offset = fp.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+        try:
+            st = os.fstat(fp.fileno())
+        except (AttributeError, OSError, ValueError):
+            st = None
+
+        if st is not None and stat.S_ISREG(st.st_mode):
+            return cls(fp, offset, max(st.st_size - offset, 0))
+
+        # in-memory or other seekable stream
+        try:
+            if not fp.seekable():
+                return None
+            size = fp.seek(0, os.SEEK_END)
+            fp.seek(offset)
+        except (AttributeError, OSError, ValueError):
+            return None
+
+        return cls(fp, offset, max(size - offset, 0), can_sendfile=False)
+
+    def read(self):
+        """Read whole region."""
+        self.fp.seek(self.offset)
+        data = self.fp.read(self.count)
+        if len(data) != self.count:
+            raise OSError('File size changed during upload.')
+        return data
+
+    @tasks.coroutine
+    def write(self, request, transport, sendfile=True, chunk_size=65536,
+              protocol=None):
+        if (sendfile and self.can_sendfile and
+                (yield from self.sendfile(transport))):
+            return
+
+        self.fp.seek(self.offset)
+        count = self.count
+        while count:
+            chunk = self.fp.read(min(chunk_size, count))
+            if not chunk:
+                raise OSError('File size changed during upload.')
+            count -= len(chunk)
+            request.write(chunk)
+            if protocol is not None:
+                yield from protocol.drain()
+
+    @tasks.coroutine
+    def sendfile(self, transport):
+        """Send region with sendfile() of event loop, it waits for
+        pending data of transport and for writable socket itself.
+        Returns False if event loop has no sendfile()."""
+        sendfile = getattr(events.get_event_loop(), 'sendfile', None)
+        if sendfile is None:
+            return False
+
+        sent = yield from sendfile(
+            transport, self.fp, self.offset, self.count)
+        if sent != self.count:
+            raise OSError('File size changed during upload.')
+        return True
+
+
+def auth_header(auth):
+    """Authorization header value for (login, password) tuple."""
+    if isinstance(auth, (tuple, list)) and len(auth) == 2:
+        # basic auth
+        return 'Basic %s' % (
+            base64.b64encode(
+                ('%s:%s' % (auth[0], auth[1])).encode('latin1'))
+            .strip().decode('latin1'))
+    else:
+        raise ValueError("Only basic auth is supported")
 
 
 def str_to_bytes(s, encoding='utf-8'):
@@ -266,6 +429,22 @@ def str_to_bytes(s, encoding='utf-8'):
     return s
 
 
+def payload_size(data):
+    """Size of str and bytes values in form data or multipart fields."""
+    if isinstance(data, (str, bytes, bytearray)):
+        return len(data)
+    if isinstance(data, (list, tuple)):
+        return sum(payload_size(item) for item in data)
+    return 0
+
+
+def encode_form(data, encoding='utf-8'):
+    """Encode str or sequence of pairs as x-www-form-urlencoded body."""
+    if not isinstance(data, str):
+        data = urllib.parse.urlencode(data, doseq=True)
+    return data.encode(encoding)
+
+
 def guess_filename(obj, default=None):
     name = getattr(obj, 'name', None)
     if name and name[0] != '<' and name[-1] != '>':
@@ -273,6 +452,105 @@ def guess_filename(obj, default=None):
     return default
 
 
+class MultipartBody:
+    """Multipart/form-data body with length known in advance.
+
+    Part headers and values are joined into write buffers of up to
+    buffer_size bytes, larger values and on-disk files are kept
+    as separate bytes and FileRegion parts. Text files have no
+    known encoded length, bodies with them are sent chunked by
+    encode_multipart_data().
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.length = sum(len(part) for part in parts)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    @classmethod
+    def from_fields(cls, fields, boundary, encoding='utf-8',
+                    buffer_size=65536):
+        """Encode list of (name, value) or (name, filename, io) or
+        (name, filename, io, MIME type) field tuples. Returns None
+        if some of file objects is text file or is not seekable
+        binary file, before any file is read."""
+        fields = list(fields)
+
+        # regions of all files first, fallback streams files from
+        # current position
+        regions = {}
+        for idx, (field, *rec) in enumerate(fields):
+            if len(rec) > 1 and not isinstance(rec[1], (str, bytes)):
+                region = FileRegion.from_file(rec[1])
+                if region is None:
+                    return None
+                regions[idx] = region
+
+        parts = []
+        buf = bytearray()
+
+        def add(data):
+            if len(data) >= buffer_size:
+                flush()
+                parts.append(bytes(data))
+            else:
+                buf.extend(data)
+                if len(buf) >= buffer_size:
+                    flush()
+
+        def flush():
+            if buf:
+                parts.append(bytes(buf))
+                buf.clear()
+
+        for idx, (field, *rec) in enumerate(fields):
+            if len(rec) == 1:
+                buf.extend(
+                    b'--' + boundary + b'\r\n' +
+                    ('Content-Disposition: form-data; name="%s"\r\n\r\n' %
+                     (field,)).encode(encoding))
+                add(rec[0])
+                buf.extend(b'\r\n')
+                continue
+
+            if len(rec) == 3:
+                fn, fp, ct = rec
+            else:
+                fn, fp = rec
+                ct = (mimetypes.guess_type(fn)[0] or
+                      'application/octet-stream')
+
+            buf.extend(
+                b'--' + boundary + b'\r\n' +
+                ('Content-Disposition: form-data; name="%s"; '
+                 'filename="%s"\r\n' % (field, fn)).encode(encoding) +
+                ('Content-Type: %s\r\n\r\n' % (ct,)).encode(encoding))
+
+            if isinstance(fp, str):
+                fp = fp.encode(encoding)
+
+            if isinstance(fp, bytes):
+                add(fp)
+            else:
+                region = regions[idx]
+                if len(buf) + len(region) <= buffer_size:
+                    buf.extend(region.read())
+                else:
+                    flush()
+                    parts.append(region)
+
+            buf.extend(b'\r\n')
+
+        buf.extend(b'--' + boundary + b'--\r\n')
+        flush()
+        return cls(parts)
+
+
 def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
     """
     Encode a list of fields using the multipart/form-data MIME format.
@@ -282,15 +560,12 @@ def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
         (name, filename, io, MIME type) field tuples.
     """
     for rec in fields:
-        yield b'--' + boundary + b'\r\n'
-
         field, *rec = rec
 
         if len(rec) == 1:
-            data = rec[0]
-            yield (('Content-Disposition: form-data; name="%s"\r\n\r\n' %
-                    (field,)).encode(encoding))
-            yield data + b'\r\n'
+            yield (b'--' + boundary + b'\r\n' +
+                   ('Content-Disposition: form-data; name="%s"\r\n\r\n' %
+                    (field,)).encode(encoding) + rec[0] + b'\r\n')
 
         else:
             if len(rec) == 3:
@@ -300,9 +575,10 @@ def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
                 ct = (mimetypes.guess_type(fn)[0] or
                       'application/octet-stream')
 
-            yield ('Content-Disposition: form-data; name="%s"; '
-                   'filename="%s"\r\n' % (field, fn)).encode(encoding)
-            yield ('Content-Type: %s\r\n\r\n' % (ct,)).encode(encoding)
+            yield (b'--' + boundary + b'\r\n' +
+                   ('Content-Disposition: form-data; name="%s"; '
+                    'filename="%s"\r\n' % (field, fn)).encode(encoding) +
+                   ('Content-Type: %s\r\n\r\n' % (ct,)).encode(encoding))
 
             if isinstance(fp, str):
                 fp = fp.encode(encoding)
@@ -310,11 +586,14 @@ def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
             if isinstance(fp, bytes):
                 fp = io.BytesIO(fp)
 
+            # text files are encoded chunk by chunk
             while True:
                 chunk = fp.read(chunk_size)
                 if not chunk:
                     break
-                yield str_to_bytes(chunk)
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(encoding)
+                yield chunk
 
             yield b'\r\n'
 
@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
 """Tests for request.py"""
 
+import io
+import os
+import socket
+import tempfile
 import unittest
 import unittest.mock
 import urllib.parse
 
+import tulip
+from tulip import tasks
+
 from . import utils
-from .request import HttpRequest
+from .protocol import HttpProtocol
+from .request import HttpRequest, MultipartBody, FileRegion
+from .request import encode_multipart_data
 
 
 class HttpRequestTests(unittest.TestCase):
@@ -191,6 +200,187 @@ class HttpRequestTests(unittest.TestCase):
         self.assertTrue(req.chunked)
         self.assertNotIn('Content-Length', req.headers)
 
+    def test_offload_encoding(self):
+        event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(event_loop)
+        self.addCleanup(event_loop.close)
+
+        req = HttpRequest('post', 'http://python.org/',
+                          data={'a': 'x' * 1000}, offload_size=100)
+        with unittest.mock.patch.object(
+                event_loop, 'run_in_executor',
+                wraps=event_loop.run_in_executor) as run_in_executor:
+            event_loop.run_until_complete(
+                tasks.Task(req.start(unittest.mock.Mock())))
+
+        self.assertTrue(run_in_executor.called)
+        self.assertEqual((b'a=' + b'x' * 1000,), req.body)
+
+    def test_no_offload_small_body(self):
+        event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(event_loop)
+        self.addCleanup(event_loop.close)
+
+        req = HttpRequest('post', 'http://python.org/',
+                          data={'a': 'x'}, offload_size=100)
+        with unittest.mock.patch.object(
+                event_loop, 'run_in_executor') as run_in_executor:
+            event_loop.run_until_complete(
+                tasks.Task(req.start(unittest.mock.Mock())))
+
+        self.assertFalse(run_in_executor.called)
+        self.assertEqual((b'a=x',), req.body)
+
+    def test_stream_body(self):
+        event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(event_loop)
+        self.addCleanup(event_loop.close)
+
+        @tasks.coroutine
+        def read(data):
+            return data
+
+        def body():
+            yield b'one'
+            yield read(b'two')
+            yield read(b'')
+
+        drained = []
+
+        @tasks.coroutine
+        def drain():
+            drained.append(True)
+
+        protocol = unittest.mock.Mock()
+        protocol.drain = drain
+
+        req = HttpRequest('post', 'http://python.org/', data=body())
+        event_loop.run_until_complete(
+            tasks.Task(req.start(unittest.mock.Mock(), protocol)))
+
+        self.assertTrue(req.chunked)
+        self.assertEqual('chunked', req.headers['Transfer-encoding'])
+        self.assertEqual(2, len(drained))
+
+
+class MultipartBodyTests(unittest.TestCase):
+
+    def fields(self):
+        return [('a', b'value'),
+                ('f1', 'f1.txt', io.BytesIO(b'file data')),
+                ('f2', 'f2.txt', 'text data', 'text/plain'),
+                ('f3', 'f3.bin', b'bytes data')]
+
+    def body(self, parts):
+        return b''.join(part.read() if isinstance(part, FileRegion) else part
+                        for part in parts)
+
+    def test_same_as_stream_encoder(self):
+        body = MultipartBody.from_fields(self.fields(), b'xxx')
+        expected = b''.join(encode_multipart_data(self.fields(), b'xxx'))
+
+        self.assertEqual(expected, self.body(body))
+        self.assertEqual(len(expected), len(body))
+
+    def test_small_parts_joined(self):
+        body = MultipartBody.from_fields(self.fields(), b'xxx')
+        self.assertEqual(1, len(body.parts))
+
+    def test_large_parts(self):
+        fields = [('a', b'y' * 100), ('f', 'f.bin', io.BytesIO(b'x' * 100))]
+        body = MultipartBody.from_fields(fields, b'xxx', buffer_size=50)
+
+        self.assertEqual(b'y' * 100, body.parts[1])
+        self.assertIsInstance(body.parts[-2], FileRegion)
+        self.assertFalse(body.parts[-2].can_sendfile)
+        self.assertEqual(len(body), len(self.body(body)))
+
+        fields[1][2].seek(0)
+        self.assertEqual(
+            b''.join(encode_multipart_data(fields, b'xxx')),
+            self.body(body))
+
+    def test_not_seekable(self):
+        fp = unittest.mock.Mock()
+        fp.tell.side_effect = OSError
+        self.assertIsNone(
+            MultipartBody.from_fields([('f', 'f.bin', fp)], b'xxx'))
+
+    def test_not_seekable_mixed(self):
+        r, w = os.pipe()
+        os.write(w, b'PIPEDATA')
+        os.close(w)
+        pipe = open(r, 'rb')
+        self.addCleanup(pipe.close)
+
+        fields = [('f1', 'f1.bin', io.BytesIO(b'IMPORTANT')),
+                  ('f2', 'f2.txt', io.StringIO('TEXTDATA')),
+                  ('f3', 'f3.bin', pipe)]
+        self.assertIsNone(MultipartBody.from_fields(fields, b'xxx'))
+
+        # no file is consumed before fallback to stream encoder
+        body = b''.join(encode_multipart_data(fields, b'xxx'))
+        self.assertIn(b'\r\n\r\nIMPORTANT\r\n', body)
+        self.assertIn(b'\r\n\r\nTEXTDATA\r\n', body)
+        self.assertIn(b'\r\n\r\nPIPEDATA\r\n', body)
+
+    def test_text_file_streamed(self):
+        fields = [('f', 'f.txt', io.StringIO('\u00e9' * 10000))]
+        self.assertIsNone(MultipartBody.from_fields(fields, b'xxx'))
+
+        chunks = list(encode_multipart_data(
+            fields, b'xxx', 'utf-8', chunk_size=1000))
+        self.assertEqual(10, len([c for c in chunks if len(c) == 2000]))
+        self.assertIn(('\u00e9' * 10000).encode('utf-8'), b''.join(chunks))
+
+
+class FileRegionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def test_write_larger_than_socket_buffer(self):
+        data = os.urandom(256 * 1024) * 16
+        fp = tempfile.TemporaryFile()
+        self.addCleanup(fp.close)
+        fp.write(b'skip' + data)
+        fp.seek(4)
+        region = FileRegion.from_file(fp)
+        self.assertEqual(len(data), len(region))
+
+        wsock, rsock = socket.socketpair()
+        self.addCleanup(rsock.close)
+        wsock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        rsock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        rsock.setblocking(False)
+
+        transport, protocol = self.event_loop.run_until_complete(
+            tasks.Task(self.event_loop.create_connection(
+                HttpProtocol, sock=wsock)))
+        request = unittest.mock.Mock()
+        request.write.side_effect = transport.write
+
+        @tasks.coroutine
+        def slow_reader():
+            received = bytearray()
+            while len(received) < len(data):
+                chunk = yield from self.event_loop.sock_recv(rsock, 65536)
+                if not chunk:
+                    break
+                received.extend(chunk)
+                yield from tulip.sleep(0.001)
+            return bytes(received)
+
+        reader = tasks.Task(slow_reader())
+        self.event_loop.run_until_complete(tasks.Task(
+            region.write(request, transport, protocol=protocol)))
+        self.assertEqual(data, self.event_loop.run_until_complete(reader))
+        transport.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,205 @@
+"""dns cache and happy eyeballs connect (RFC 8305)"""
+
+__all__ = ['Resolver']
+
+import collections
+import ipaddress
+import socket
+import time
+
+from tulip import events
+from tulip import futures
+from tulip import tasks
+
+
+def interleave(infos):
+    """Order addresses alternating between address families,
+    starting with family of the first address."""
+    families = collections.OrderedDict()
+    for info in infos:
+        families.setdefault(info[0], collections.deque()).append(info)
+
+    queues = list(families.values())
+    result = []
+    while queues:
+        for queue in list(queues):
+            result.append(queue.popleft())
+            if not queue:
+                queues.remove(queue)
+    return result
+
+
+class Resolver:
+    """Caching resolver, connects to first responding address.
+
+    ttl: seconds resolved addresses are kept, getaddrinfo() does not
+      report dns ttl so it is same for all hosts
+    max_entries: number of hosts kept in cache, least recently
+      used host is evicted first
+    connect_delay: seconds to wait for connection before starting
+      attempt to next address, RFC 8305 "Connection Attempt Delay"
+    """
+
+    def __init__(self, *, ttl=60.0, max_entries=1024, connect_delay=0.25):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.connect_delay = connect_delay
+
+        self._cache = collections.OrderedDict()  # key: (expires, infos)
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def invalidate(self, host, port):
+        self._cache.pop((host, port), None)
+
+    @tasks.coroutine
+    def resolve(self, host, port):
+        """Returns list of (family, type, proto, canonname, sockaddr)
+        ordered for connection attempts."""
+        infos = self._get_cached(host, port)
+        if infos is not None:
+            return infos
+
+        return (yield from self._get_lookup(host, port))
+
+    def _get_cached(self, host, port):
+        try:
+            addr = ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            family = socket.AF_INET6 if addr.version == 6 else socket.AF_INET
+            return [(family, socket.SOCK_STREAM, 0, '', (host, port))]
+
+        key = (host, port)
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires, infos = entry
+            if expires > time.monotonic():
+                self._cache.move_to_end(key)
+                return infos
+            del self._cache[key]
+
+    def _get_lookup(self, host, port):
+        # concurrent lookups of same host share one getaddrinfo() call
+        key = (host, port)
+        lookup = self._pending.get(key)
+        if lookup is None:
+            lookup = self._pending[key] = tasks.Task(self._lookup(host, port))
+            lookup.add_done_callback(lambda _: self._pending.pop(key, None))
+        return lookup
+
+    @tasks.coroutine
+    def _lookup(self, host, port):
+        infos = yield from events.get_event_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM)
+        if not infos:
+            raise OSError('getaddrinfo() returned empty list')
+
+        infos = interleave(infos)
+        self._cache[(host, port)] = (time.monotonic() + self.ttl, infos)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return infos
+
+    @tasks.coroutine
+    def connect(self, protocol_factory, host, port, ssl=False, timeout=None):
+        """Connect to host, returns (transport, protocol).
+
+        Attempt to next address starts if previous one fails or does not
+        succeed within connect_delay, first established connection wins.
+        TimeoutError is raised if lookup and connect take more than
+        timeout seconds.
+        """
+        event_loop = events.get_event_loop()
+        waiter = futures.Future()
+        attempts = []
+        errors = []
+        infos = collections.deque()
+        timer = None
+        deadline = None
+
+        def start_next():
+            nonlocal timer
+            if timer is not None:
+                timer.cancel()
+                timer = None
+
+            if waiter.done():
+                return
+
+            if not infos:
+                if not attempts:
+                    waiter.set_exception(errors[-1])
+                return
+
+            family, _, _, _, address = infos.popleft()
+            # resolved address is used, keep host name for SNI and
+            # certificate check
+            kwargs = {'server_hostname': host} if ssl else {}
+            attempt = tasks.Task(event_loop.create_connection(
+                protocol_factory, address[0], address[1],
+                ssl=ssl, family=family, **kwargs))
+            attempt.add_done_callback(attempt_done)
+            attempts.append(attempt)
+
+            if infos:
+                timer = event_loop.call_later(self.connect_delay, start_next)
+
+        def attempt_done(attempt):
+            attempts.remove(attempt)
+            if attempt.cancelled():
+                return
+
+            exc = attempt.exception()
+            if exc is not None:
+                errors.append(exc)
+                start_next()
+            elif waiter.done():
+                attempt.result()[0].close()
+            else:
+                waiter.set_result(attempt.result())
+
+        def resolved(lookup):
+            if waiter.done() or lookup.cancelled():
+                return
+
+            exc = lookup.exception()
+            if exc is not None:
+                waiter.set_exception(exc)
+            else:
+                infos.extend(lookup.result())
+                start_next()
+
+        def expired():
+            if not waiter.done():
+                waiter.set_exception(futures.TimeoutError(
+                    'Connect to %s:%s timed out' % (host, port)))
+
+        if timeout is not None:
+            deadline = event_loop.call_later(timeout, expired)
+
+        cached = self._get_cached(host, port)
+        if cached is not None:
+            infos.extend(cached)
+            start_next()
+        else:
+            self._get_lookup(host, port).add_done_callback(resolved)
+
+        try:
+            return (yield from waiter)
+        except OSError:
+            self.invalidate(host, port)
+            raise
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+            if timer is not None:
+                timer.cancel()
+            for attempt in list(attempts):
+                attempt.cancel()
@@ -0,0 +1,125 @@
+"""Tests for resolver.py"""
+
+import socket
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import futures
+from tulip import tasks
+
+from .resolver import Resolver, interleave
+
+
+V4 = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))
+V4_2 = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.2', 80))
+V6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', 80, 0, 0))
+
+
+class ResolverTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+        self.infos = [V6, V4]
+        self.lookups = 0
+        self.event_loop.getaddrinfo = self.getaddrinfo
+        self.resolver = Resolver(connect_delay=0.01)
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def getaddrinfo(self, host, port, **kwargs):
+        self.lookups += 1
+        fut = futures.Future()
+        fut.set_result(list(self.infos))
+        return fut
+
+    def run_task(self, coro):
+        return self.event_loop.run_until_complete(tasks.Task(coro))
+
+    def test_interleave(self):
+        self.assertEqual([V4, V6, V4_2], interleave([V4, V4_2, V6]))
+        self.assertEqual([V6, V4, V4_2], interleave([V6, V4, V4_2]))
+
+    def test_cache(self):
+        self.assertEqual([V6, V4], self.run_task(
+            self.resolver.resolve('python.org', 80)))
+        self.run_task(self.resolver.resolve('python.org', 80))
+        self.assertEqual(1, self.lookups)
+
+    def test_ttl(self):
+        self.resolver.ttl = 0
+        self.run_task(self.resolver.resolve('python.org', 80))
+        self.run_task(self.resolver.resolve('python.org', 80))
+        self.assertEqual(2, self.lookups)
+
+    def test_max_entries(self):
+        self.resolver.max_entries = 1
+        self.run_task(self.resolver.resolve('python.org', 80))
+        self.run_task(self.resolver.resolve('example.com', 80))
+        self.run_task(self.resolver.resolve('python.org', 80))
+        self.assertEqual(3, self.lookups)
+        self.assertEqual(1, len(self.resolver))
+
+    def test_ip_address(self):
+        infos = self.run_task(self.resolver.resolve('::1', 80))
+        self.assertEqual(socket.AF_INET6, infos[0][0])
+        self.assertEqual(0, self.lookups)
+
+    def test_happy_eyeballs(self):
+        self.transport = unittest.mock.Mock()
+
+        @tasks.coroutine
+        def create_connection(factory, host, port, *, ssl, family):
+            if family == socket.AF_INET6:
+                yield from tulip.sleep(10)  # unreachable
+            return self.transport, factory()
+
+        self.event_loop.create_connection = create_connection
+        transport, protocol = self.run_task(
+            self.resolver.connect(object, 'python.org', 80))
+        self.assertIs(self.transport, transport)
+
+    def test_all_failed(self):
+        @tasks.coroutine
+        def create_connection(factory, host, port, *, ssl, family):
+            raise ConnectionRefusedError(host)
+
+        self.event_loop.create_connection = create_connection
+        self.assertRaises(
+            ConnectionRefusedError,
+            self.run_task, self.resolver.connect(object, 'python.org', 80))
+        self.assertEqual(0, len(self.resolver))
+
+    def test_ssl_server_hostname(self):
+        self.infos = [V4]
+        calls = []
+
+        @tasks.coroutine
+        def create_connection(factory, host, port, **kwargs):
+            calls.append((host, kwargs))
+            return unittest.mock.Mock(), factory()
+
+        self.event_loop.create_connection = create_connection
+        self.run_task(self.resolver.connect(object, 'python.org', 443, True))
+        self.assertEqual('127.0.0.1', calls[0][0])
+        self.assertEqual('python.org', calls[0][1]['server_hostname'])
+
+        self.run_task(self.resolver.connect(object, 'python.org', 80))
+        self.assertNotIn('server_hostname', calls[1][1])
+
+    def test_connect_timeout(self):
+        @tasks.coroutine
+        def create_connection(factory, host, port, *, ssl, family):
+            yield from tulip.sleep(10)  # unreachable
+
+        self.event_loop.create_connection = create_connection
+        self.assertRaises(
+            futures.TimeoutError, self.run_task,
+            self.resolver.connect(object, 'python.org', 80, timeout=0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
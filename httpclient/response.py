@@ -6,11 +6,16 @@ import json
 
 import tulip.http
 
+from .headers import Headers
+from .timeouts import timeout_error
+from .utils import ContentDecoder, MAX_DECOMPRESSION_RATIO
+
 
 class HttpResponse:
 
     stream = None
     transport = None
+    connection = None  # pooled connection, see pool.Connection
 
     # from the Status-Line of the response
     version = None  # HTTP-Version
@@ -20,10 +25,19 @@ class HttpResponse:
 
     content = None
     will_close = None  # conn will close at end of response
+    from_cache = False  # response is served by HttpCache
+    decoder = None  # ContentDecoder of compressed body
+    timer = None  # timeouts.RequestTimer of streamed response
 
-    def __init__(self, method, url):
+    def __init__(self, method, url, *,
+                 max_decompression_ratio=MAX_DECOMPRESSION_RATIO,
+                 read_limit=None):
         self.method = method
         self.url = url
+        self.max_decompression_ratio = max_decompression_ratio
+        self.read_limit = read_limit
+        self._protocol = None
+        self._eof = False
 
     def __repr__(self):
         out = io.StringIO()
@@ -31,12 +45,13 @@ class HttpResponse:
         print(self.headers, file=out)
         return out.getvalue()
 
-    def start(self, stream, transport, readbody=False):
+    def start(self, stream, transport, readbody=False, connection=None):
         if self.stream is not None:
             raise RuntimeError('Response is in process.')
 
         self.stream = stream
         self.transport = transport
+        self.connection = connection
 
         # read status
         self.version, self.status, self.reason = (
@@ -49,24 +64,75 @@ class HttpResponse:
                 100 <= self.status < 200 or self.method == "HEAD"):
             length = 0
 
-        # http message
-        message = yield from self.stream.read_message(length=length)
+        # http message, body is decompressed by read_chunk()
+        message = yield from self.stream.read_message(
+            length=length, compression=False)
+        self.will_close = message.should_close
 
         # headers
-        self.headers = http.client.HTTPMessage()
-        for hdr, val in message.headers:
-            self.headers.add_header(hdr, val)
+        self.headers = Headers(message.headers)
 
         # body
         self.body = message.payload
 
+        # flow control of pooled connection
+        if connection is not None:
+            self._protocol = connection.protocol
+            self._protocol.payload = message.payload
+            self._protocol.set_read_limit(self.read_limit)
+
+        encoding = self.headers.get('content-encoding', '')
+        if encoding and ContentDecoder.supported(encoding):
+            self.decoder = ContentDecoder(
+                encoding, self.max_decompression_ratio)
+
         if readbody:
-            self.content = yield from message.payload.read()
+            yield from self.read()
 
         return self
 
+    def _detach(self):
+        if self._protocol is not None:
+            self._protocol.payload = None
+            # next user of connection may not report consumed data
+            self._protocol.set_read_limit(0)
+            if self._protocol.timer is not None:
+                self._protocol.timer.detach()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _check_aborted(self):
+        # aborted connection may look like end of body
+        protocol = self._protocol
+        if protocol is not None and protocol.exception is not None:
+            raise protocol.exception
+        if self.timer is not None and self.timer.expired:
+            raise timeout_error(self.timer.expired)
+
+    def _release(self):
+        self._detach()
+        self._protocol = None
+
+        # body is fully read, connection can be reused
+        if self.connection is not None:
+            if self.will_close:
+                self.connection.close()
+            else:
+                self.connection.release()
+            self.connection = None
+            self.transport = None
+
     def close(self):
-        if self.transport:
+        self._detach()
+        self._protocol = None
+
+        if self.connection is not None:
+            # unread body, can't reuse connection
+            self.connection.close()
+            self.connection = None
+            self.transport = None
+        elif self.transport:
             self.transport.close()
             self.transport = None
 
@@ -75,7 +141,22 @@ class HttpResponse:
 
     def read(self, decode=False):
         if self.content is None:
-            self.content = yield from self.body.read()
+            if self.decoder is None:
+                # whole body is buffered anyway, no flow control
+                if self._protocol is not None:
+                    self._protocol.set_read_limit(0)
+                content = yield from self.body.read()
+                self._check_aborted()
+                self.content = content
+                self._release()
+            else:
+                chunks = []
+                while True:
+                    chunk = yield from self.read_chunk(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                self.content = b''.join(chunks)
 
         data = self.content
 
@@ -85,3 +166,63 @@ class HttpResponse:
                 data = json.loads(data.decode('utf-8'))
 
         return data
+
+    def read_chunk(self, size=8192):
+        """Read up to size bytes of body. Returns empty bytes
+        at the end of body."""
+        if self.content is not None:
+            raise RuntimeError('Response body is read already.')
+
+        decoder = self.decoder
+        if decoder is None:
+            chunk = yield from self.body.read(size)
+        else:
+            chunk = b''
+            while not chunk and not self._eof:
+                if decoder.pending:
+                    chunk = decoder.decompress(b'', size)
+                else:
+                    data = yield from self.body.read(size)
+                    if data:
+                        chunk = decoder.decompress(data, size)
+                    else:
+                        chunk = decoder.flush()
+                        self._eof = True
+
+        if not chunk:
+            self._check_aborted()
+            self._release()
+        elif self._protocol is not None:
+            self._protocol.data_consumed()
+
+        return chunk
+
+    def iter_chunks(self, size=8192):
+        """Iterate over body without buffering whole payload.
+        Yields coroutines, each returns next chunk of body,
+        the last one returns empty bytes.
+
+          >>> for coro in response.iter_chunks(65536):
+          ...     chunk = yield from coro
+          ...     f.write(chunk)
+
+        """
+        eof = False
+
+        def read():
+            nonlocal eof
+            chunk = yield from self.read_chunk(size)
+            eof = not chunk
+            return chunk
+
+        while not eof:
+            yield read()
+
+    def read_into(self, buffer):
+        """Read body data into writable buffer. Returns number of
+        bytes read, 0 at the end of body."""
+        view = memoryview(buffer)
+        chunk = yield from self.read_chunk(len(view))
+        size = len(chunk)
+        view[:size] = chunk
+        return size
@@ -0,0 +1,220 @@
+"""request timeouts"""
+
+__all__ = ['Timeout']
+
+import math
+import time
+import weakref
+
+from tulip import events
+from tulip import futures
+
+
+class Timeout:
+    """Timeouts of request phases in seconds, None means no limit.
+
+    connect: waiting for pooled connection, dns lookup and connect
+    first_byte: from end of sending request to first response data
+    read: between two reads of response data from connection
+    total: whole request, including redirects and response body
+    """
+
+    __slots__ = ('connect', 'first_byte', 'read', 'total')
+
+    def __init__(self, total=None, *, connect=None, first_byte=None,
+                 read=None):
+        self.total = total
+        self.connect = connect
+        self.first_byte = first_byte
+        self.read = read
+
+    def __repr__(self):
+        return '<Timeout total=%s connect=%s first_byte=%s read=%s>' % (
+            self.total, self.connect, self.first_byte, self.read)
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None
+                   for name in self.__slots__)
+
+    @classmethod
+    def coerce(cls, timeout):
+        """Timeout for Timeout, number of seconds (total) or None."""
+        if isinstance(timeout, cls):
+            return timeout
+        return cls(total=timeout)
+
+
+class TimerWheel:
+    """Coarse timer shared by deadlines of one event loop.
+
+    Deadlines are kept in buckets of resolution seconds and one loop
+    timer is scheduled for the nearest bucket. Moving deadline later,
+    e.g. on every received chunk, does not touch the loop, moved
+    deadline is put to its new bucket when old bucket expires.
+    """
+
+    def __init__(self, resolution=0.1):
+        self.resolution = resolution
+        self._buckets = {}
+        self._handle = None
+        self._handle_tick = None
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def add(self, timer):
+        tick = math.ceil(timer.deadline / self.resolution)
+        self._buckets.setdefault(tick, set()).add(timer)
+
+        if self._handle_tick is None or tick < self._handle_tick:
+            self._schedule()
+
+    def _schedule(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+            self._handle_tick = None
+
+        if self._buckets:
+            tick = min(self._buckets)
+            delay = max(0, tick * self.resolution - time.monotonic())
+            self._handle = events.get_event_loop().call_later(
+                delay, self._expire)
+            self._handle_tick = tick
+
+    def _expire(self):
+        self._handle = None
+        self._handle_tick = None
+
+        now = time.monotonic()
+        current = math.floor(now / self.resolution)
+        for tick in sorted(tick for tick in self._buckets if tick <= current):
+            for timer in self._buckets.pop(tick):
+                if timer.deadline is None:
+                    continue
+                if timer.deadline <= now:
+                    timer._expire(now)
+                else:
+                    self.add(timer)
+
+        if self._handle is None:
+            self._schedule()
+
+
+def timeout_error(phase):
+    return futures.TimeoutError('%s timeout expired' % phase)
+
+
+_wheels = weakref.WeakKeyDictionary()
+
+
+def timer_wheel():
+    """Return timer wheel of current event loop."""
+    event_loop = events.get_event_loop()
+    wheel = _wheels.get(event_loop)
+    if wheel is None:
+        wheel = _wheels[event_loop] = TimerWheel()
+    return wheel
+
+
+class RequestTimer:
+    """Deadlines of one request.
+
+    Total deadline runs from creation, phase deadline from start()
+    of phase. 'first_byte' phase turns into 'read' phase when first data
+    is received, 'read' deadline is moved by every received chunk.
+    Attached protocol is aborted with TimeoutError when deadline
+    expires.
+    """
+
+    def __init__(self, timeout, wheel=None):
+        self.timeout = timeout
+        self.wheel = wheel if wheel is not None else timer_wheel()
+        self.callback = None
+        self.expired = None  # phase of expired deadline
+        self._protocol = None
+
+        now = time.monotonic()
+        self.total_deadline = (
+            None if timeout.total is None else now + timeout.total)
+        self.phase = None
+        self.phase_deadline = None
+        self.deadline = None
+        self._update()
+
+    def attach(self, protocol):
+        """Abort protocol when deadline expires, received data moves
+        read deadline."""
+        self.detach()
+        self._protocol = protocol
+        protocol.timer = self
+        self.callback = lambda phase: protocol.abort(timeout_error(phase))
+        if self.expired:
+            self.callback(self.expired)
+
+    def detach(self):
+        """Stop phase deadline and detach protocol, total deadline
+        keeps running."""
+        if self._protocol is not None:
+            if self._protocol.timer is self:
+                self._protocol.timer = None
+            self._protocol = None
+        self.callback = None
+        self.stop()
+
+    def remaining(self, phase):
+        """Seconds to deadline of phase if it starts now, None for
+        no deadline."""
+        now = time.monotonic()
+        deadlines = [d for d in (self.total_deadline,) if d is not None]
+        delay = getattr(self.timeout, phase)
+        if delay is not None:
+            deadlines.append(now + delay)
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - now)
+
+    def start(self, phase):
+        self.phase = phase
+        delay = None if phase is None else getattr(self.timeout, phase)
+        self.phase_deadline = (
+            None if delay is None else time.monotonic() + delay)
+        self._update()
+
+    def stop(self):
+        self.start(None)
+
+    def suspend(self):
+        """Stop phase deadline, e.g. while consumer is slow."""
+        self.phase_deadline = None
+        self._update()
+
+    def data_received(self):
+        if self.phase in ('first_byte', 'read'):
+            self.start('read')
+
+    def cancel(self):
+        self.total_deadline = None
+        self.detach()
+
+    def _update(self):
+        deadlines = [d for d in (self.total_deadline, self.phase_deadline)
+                     if d is not None]
+        deadline = min(deadlines) if deadlines else None
+
+        old = self.deadline
+        self.deadline = deadline
+        if deadline is not None and (old is None or deadline < old):
+            self.wheel.add(self)
+
+    def _expire(self, now):
+        if (self.total_deadline is not None and
+                self.total_deadline <= now):
+            phase = 'total'
+        else:
+            phase = self.phase
+
+        self.expired = phase
+        self.deadline = None
+        if self.callback is not None:
+            self.callback(phase)
@@ -0,0 +1,121 @@
+"""Tests for timeouts.py"""
+
+import time
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import futures
+from tulip import tasks
+
+from .timeouts import RequestTimer, Timeout, TimerWheel
+
+
+class TimeoutTests(unittest.TestCase):
+
+    def test_coerce(self):
+        self.assertFalse(Timeout.coerce(None))
+        self.assertEqual(10, Timeout.coerce(10).total)
+
+        timeout = Timeout(read=1.0)
+        self.assertIs(timeout, Timeout.coerce(timeout))
+        self.assertTrue(timeout)
+
+
+class RequestTimerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+        self.wheel = TimerWheel(resolution=0.01)
+        self.expired = []
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def sleep(self, delay):
+        self.event_loop.run_until_complete(tasks.Task(tulip.sleep(delay)))
+
+    def timer(self, **kwargs):
+        timer = RequestTimer(Timeout(**kwargs), self.wheel)
+        timer.callback = self.expired.append
+        return timer
+
+    def test_total(self):
+        self.timer(total=0.02)
+        self.sleep(0.05)
+        self.assertEqual(['total'], self.expired)
+        self.assertEqual(0, len(self.wheel))
+
+    def test_read_moved_by_data(self):
+        timer = self.timer(read=0.05)
+        timer.start('first_byte')
+        for _ in range(5):
+            self.sleep(0.02)
+            timer.data_received()
+        self.assertEqual([], self.expired)
+        self.assertEqual('read', timer.phase)
+
+        self.sleep(0.1)
+        self.assertEqual(['read'], self.expired)
+
+    def test_first_byte(self):
+        timer = self.timer(first_byte=0.02, read=10)
+        timer.start('first_byte')
+        self.sleep(0.05)
+        self.assertEqual(['first_byte'], self.expired)
+
+    def test_suspend(self):
+        timer = self.timer(read=0.02)
+        timer.start('read')
+        timer.suspend()
+        self.sleep(0.05)
+        self.assertEqual([], self.expired)
+
+    def test_cancel(self):
+        timer = self.timer(total=0.02, read=0.02)
+        timer.start('read')
+        timer.cancel()
+        self.sleep(0.05)
+        self.assertEqual([], self.expired)
+
+    def test_remaining(self):
+        timer = self.timer(total=10, connect=1)
+        self.assertLessEqual(timer.remaining('connect'), 1)
+        self.assertIsNone(self.timer().remaining('connect'))
+
+    def test_attach(self):
+        protocol = unittest.mock.Mock()
+        timer = self.timer(first_byte=0.02)
+        timer.attach(protocol)
+        self.assertIs(timer, protocol.timer)
+
+        timer.start('first_byte')
+        self.sleep(0.05)
+        self.assertEqual('first_byte', timer.expired)
+        exc = protocol.abort.call_args[0][0]
+        self.assertIsInstance(exc, futures.TimeoutError)
+
+        timer.detach()
+        self.assertIsNone(protocol.timer)
+
+    def test_wheel_one_handle(self):
+        start = time.monotonic()
+        timers = [self.timer(read=0.05) for _ in range(100)]
+        for timer in timers:
+            timer.start('read')
+
+        # moving deadlines later does not touch the loop
+        self.assertIsNotNone(self.wheel._handle)
+        handle = self.wheel._handle
+        for timer in timers:
+            timer.data_received()
+        self.assertIs(handle, self.wheel._handle)
+
+        self.sleep(0.1)
+        self.assertEqual(100, len(self.expired))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
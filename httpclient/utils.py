@@ -1,51 +1,294 @@
 """stream utils"""
 
-import io
 import zlib
 
+from tulip import events
+from tulip import tasks
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CONTENT_ENCODINGS = ['gzip', 'deflate']
+if brotli is not None:
+    CONTENT_ENCODINGS.append('br')
+if zstandard is not None:
+    CONTENT_ENCODINGS.append('zstd')
+
+ACCEPT_ENCODING = ', '.join(CONTENT_ENCODINGS)
+
+MAX_DECOMPRESSION_RATIO = 100
+MIN_RATIO_CHECK_SIZE = 1024 * 1024
+DECODE_SLICE_SIZE = 4096
+
+_DECOMPRESS_ERRORS = (zlib.error,)
+if brotli is not None:
+    _DECOMPRESS_ERRORS += (brotli.error,)
+if zstandard is not None:
+    _DECOMPRESS_ERRORS += (zstandard.ZstdError,)
+
 
 class ChunkedIter:
+    """Splits stream of bytes-like objects into chunks of chunk_size
+    bytes, the last chunk may be shorter. Yields memoryviews, full
+    chunks of large input pieces are not copied."""
 
     def __init__(self, chunk_size=None):
         self.chunk_size = chunk_size
 
     def write(self, stream):
-        if isinstance(stream, bytes):
+        if isinstance(stream, (bytes, bytearray, memoryview)):
             stream = (stream,)
-        stream = iter(stream)
 
-        buf = io.BytesIO()
-        while True:
-            while buf.tell() < self.chunk_size:
-                try:
-                    data = next(stream)
-                    buf.write(data)
-                except StopIteration:
-                    yield buf.getvalue()
-                    return
+        size = self.chunk_size
+        buf = bytearray()
+
+        for data in stream:
+            if size and len(buf) + len(data) <= size:
+                buf += data
+                if len(buf) == size:
+                    yield memoryview(buf)
+                    buf = bytearray()
+                continue
+
+            view = memoryview(data).cast('B')
+            if not size:
+                if view:
+                    yield view
+                continue
 
-            data = buf.getvalue()
-            chunk, rest = data[:self.chunk_size], data[self.chunk_size:]
-            buf = io.BytesIO()
-            buf.write(rest)
+            # fill up partial chunk
+            if buf:
+                need = size - len(buf)
+                buf += view[:need]
+                view = view[need:]
+                if len(buf) < size:
+                    continue
+                yield memoryview(buf)
+                buf = bytearray()
 
-            yield chunk
+            end = len(view) - len(view) % size
+            for pos in range(0, end, size):
+                yield view[pos:pos + size]
+
+            if end < len(view):
+                buf += view[end:]
+
+        if buf:
+            yield memoryview(buf)
 
 
 class DeflateIter:
+    """Streaming deflate/gzip compressor.
+
+    level and mem_level are passed to zlib.compressobj(). Compressed
+    output is collected until it reaches min_size bytes, so empty or
+    tiny chunks are never produced. Input pieces of offload_size bytes
+    or more are compressed in executor by feed_async().
+    """
+
+    def __init__(self, encoding='deflate', *,
+                 level=zlib.Z_DEFAULT_COMPRESSION, mem_level=8,
+                 min_size=16384, offload_size=None, executor=None):
+        self.encoding = encoding
+        self.level = level
+        self.mem_level = mem_level
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.executor = executor
+
+        self._zlib = None
+        self._buf = bytearray()
+
+    def copy(self):
+        """New compressor with same settings."""
+        return DeflateIter(
+            self.encoding, level=self.level, mem_level=self.mem_level,
+            min_size=self.min_size, offload_size=self.offload_size,
+            executor=self.executor)
+
+    def _compressobj(self):
+        if self._zlib is None:
+            wbits = (16 + zlib.MAX_WBITS
+                     if self.encoding == 'gzip' else -zlib.MAX_WBITS)
+            self._zlib = zlib.compressobj(
+                self.level, zlib.DEFLATED, wbits, self.mem_level)
+        return self._zlib
+
+    def _output(self, data, force=False):
+        self._buf += data
+        if self._buf and (force or len(self._buf) >= self.min_size):
+            out = bytes(self._buf)
+            self._buf.clear()
+            return out
+        return b''
+
+    def feed(self, data):
+        """Compress data, returns compressed output ready to be sent,
+        empty bytes if output is below min_size yet."""
+        return self._output(self._compressobj().compress(data))
+
+    @tasks.coroutine
+    def feed_async(self, data):
+        """Same as feed(), large data is compressed in executor."""
+        if self.offload_size is None or len(data) < self.offload_size:
+            return self.feed(data)
 
-    def __init__(self, encoding='deflate'):
-        zlib_mode = (16 + zlib.MAX_WBITS
-                     if encoding == 'gzip' else -zlib.MAX_WBITS)
+        compressed = yield from events.get_event_loop().run_in_executor(
+            self.executor, self._compressobj().compress, data)
+        return self._output(compressed)
 
-        self.zlib = zlib.compressobj(wbits=zlib_mode)
+    def flush(self):
+        """Finish compressed stream, returns rest of output.
+        Compressor can be used for next stream after flush."""
+        out = self._output(self._compressobj().flush(), force=True)
+        self._zlib = None
+        return out
 
     def write(self, stream):
-        if isinstance(stream, bytes):
+        if isinstance(stream, (bytes, bytearray, memoryview)):
             stream = (stream,)
-        stream = iter(stream)
 
-        for chunk in stream:
-            yield self.zlib.compress(chunk)
+        for data in stream:
+            out = self.feed(data)
+            if out:
+                yield out
+
+        out = self.flush()
+        if out:
+            yield out
+
+
+class DecompressionError(Exception):
+    """Compressed body is broken or exceeds decompression ratio."""
+
+
+class ContentDecoder:
+    """Incremental decoder of Content-Encoding.
+
+    decompress() returns at most max_length bytes and keeps input
+    that is not decompressed yet for the next call. If decompressed size
+    is over min_size and over max_ratio times compressed size
+    DecompressionError is raised, max_ratio=None disables the check.
+    brotli and zstd decoders have no output limit, they are fed input
+    in slices of DECODE_SLICE_SIZE bytes and the ratio is checked after
+    each slice, output may exceed max_length by output of one slice.
+    """
+
+    def __init__(self, encoding, max_ratio=MAX_DECOMPRESSION_RATIO,
+                 min_size=MIN_RATIO_CHECK_SIZE):
+        self.encoding = encoding = encoding.strip().lower()
+        self.max_ratio = max_ratio
+        self.min_size = min_size
+
+        self._zlib = None
+        self._decompress = None
+        if encoding in ('gzip', 'x-gzip'):
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._zlib = zlib.decompressobj()
+        elif encoding == 'br' and brotli is not None:
+            self._decompress = brotli.Decompressor().process
+        elif encoding == 'zstd' and zstandard is not None:
+            self._decompress = (
+                zstandard.ZstdDecompressor().decompressobj().decompress)
+        else:
+            raise ValueError('Unsupported content encoding: %r' % encoding)
+
+        self._tail = b''
+        self._out = bytearray()
+        # "deflate" input until zlib header is accepted
+        self._head = b'' if encoding == 'deflate' else None
+        self._size_in = 0
+        self._size_out = 0
+
+    @staticmethod
+    def supported(encoding):
+        return encoding.strip().lower() in CONTENT_ENCODINGS + ['x-gzip']
+
+    @property
+    def pending(self):
+        """Decoder has input or output kept from previous call."""
+        return bool(self._tail or self._out)
+
+    def decompress(self, data, max_length=0):
+        self._size_in += len(data)
+        try:
+            if self._zlib is not None:
+                out = self._zlib_decompress(self._tail + data, max_length)
+                self._tail = self._zlib.unconsumed_tail
+                self._check_ratio(len(out))
+                return out
+
+            if self._tail or data:
+                self._decompress_slices(self._tail + data, max_length)
+        except _DECOMPRESS_ERRORS as exc:
+            raise DecompressionError(
+                'Can not decode %s content: %s' % (self.encoding, exc))
+
+        if not max_length or max_length >= len(self._out):
+            out = bytes(self._out)
+            self._out.clear()
+        else:
+            out = bytes(self._out[:max_length])
+            del self._out[:max_length]
+        return out
+
+    def _decompress_slices(self, data, max_length):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view) and (
+                not max_length or len(self._out) < max_length):
+            out = self._decompress(bytes(view[pos:pos + DECODE_SLICE_SIZE]))
+            pos += DECODE_SLICE_SIZE
+            self._out.extend(out)
+            self._check_ratio(len(out), max(len(view) - pos, 0))
+        self._tail = bytes(view[pos:])
+
+    def _zlib_decompress(self, data, max_length):
+        if self._head is None:
+            return self._zlib.decompress(data, max_length)
+
+        self._head += data
+        try:
+            out = self._zlib.decompress(data, max_length)
+        except zlib.error:
+            # "deflate" without zlib header, start over with all input
+            self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+            data, self._head = self._head, None
+            return self._zlib.decompress(data, max_length)
+
+        if len(self._head) >= 2:
+            self._head = None
+        return out
+
+    def flush(self):
+        """Returns rest of decoded data at the end of body."""
+        out = self.decompress(b'')
+        if self._zlib is not None:
+            try:
+                rest = self._zlib.flush()
+            except zlib.error as exc:
+                raise DecompressionError(
+                    'Can not decode %s content: %s' % (self.encoding, exc))
+            self._check_ratio(len(rest))
+            out += rest
+        return out
 
-        yield self.zlib.flush()
+    def _check_ratio(self, size, unconsumed=None):
+        if unconsumed is None:
+            unconsumed = len(self._tail)
+        self._size_out += size
+        if (self.max_ratio is not None and
+                self._size_out > self.min_size and
+                self._size_out >
+                self.max_ratio * (self._size_in - unconsumed)):
+            raise DecompressionError(
+                'Decompression ratio exceeds %s' % self.max_ratio)
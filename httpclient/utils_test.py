@@ -0,0 +1,167 @@
+"""Tests for utils.py"""
+
+import unittest
+import zlib
+
+import tulip
+from tulip import tasks
+
+from . import utils
+from .utils import ChunkedIter, ContentDecoder, DecompressionError
+from .utils import DeflateIter
+
+
+def compress(data, wbits=zlib.MAX_WBITS):
+    obj = zlib.compressobj(wbits=wbits)
+    return obj.compress(data) + obj.flush()
+
+
+class ChunkedIterTests(unittest.TestCase):
+
+    def test_chunks(self):
+        chunks = list(ChunkedIter(4).write([b'ab', b'cdefghij', b'k']))
+        self.assertEqual([b'abcd', b'efgh', b'ijk'],
+                         [bytes(c) for c in chunks])
+
+    def test_no_copy(self):
+        data = b'x' * 100
+        chunks = list(ChunkedIter(10).write(data))
+        self.assertEqual(10, len(chunks))
+        self.assertIs(data, chunks[0].obj)
+
+    def test_no_empty_chunks(self):
+        self.assertEqual([], list(ChunkedIter(4).write([b'', b''])))
+        self.assertEqual(
+            [b'abcd'], [bytes(c) for c in ChunkedIter(4).write(b'abcd')])
+
+
+class DeflateIterTests(unittest.TestCase):
+
+    def test_deflate(self):
+        data = [('data %d ' % i).encode() for i in range(10000)]
+        chunks = list(DeflateIter(min_size=1024).write(data))
+
+        self.assertTrue(all(chunks))
+        self.assertTrue(all(len(c) >= 1024 for c in chunks[:-1]))
+        self.assertEqual(
+            b''.join(data),
+            zlib.decompress(b''.join(chunks), -zlib.MAX_WBITS))
+
+    def test_gzip_level(self):
+        data = b'gzip data ' * 1000
+        compressor = DeflateIter('gzip', level=1, mem_level=9)
+        chunks = list(compressor.write(data))
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(data, zlib.decompress(chunks[0], 31))
+
+        # reusable after flush
+        self.assertEqual(chunks, list(compressor.write(data)))
+
+    def test_feed_async_offload(self):
+        event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(event_loop)
+        self.addCleanup(event_loop.close)
+
+        data = b'offload data ' * 1000
+        compressor = DeflateIter(min_size=1, offload_size=100)
+        out = event_loop.run_until_complete(
+            tasks.Task(compressor.feed_async(data)))
+        out += compressor.flush()
+        self.assertEqual(data, zlib.decompress(out, -zlib.MAX_WBITS))
+
+
+class ContentDecoderTests(unittest.TestCase):
+
+    def decode(self, decoder, data, size=1024):
+        chunks = []
+        for i in range(0, len(data), size):
+            chunk = decoder.decompress(data[i:i + size], size)
+            while chunk:
+                self.assertLessEqual(len(chunk), size)
+                chunks.append(chunk)
+                chunk = decoder.decompress(b'', size)
+        chunks.append(decoder.flush())
+        return b''.join(chunks)
+
+    def test_gzip(self):
+        data = b'gzip data ' * 10000
+        decoder = ContentDecoder('gzip')
+        self.assertEqual(
+            data, self.decode(decoder, compress(data, 16 + zlib.MAX_WBITS)))
+
+    def test_deflate(self):
+        data = b'deflate data ' * 10000
+        self.assertEqual(
+            data, self.decode(ContentDecoder('deflate'), compress(data)))
+
+    def test_raw_deflate(self):
+        data = b'raw deflate data ' * 10000
+        self.assertEqual(
+            data, self.decode(ContentDecoder('Deflate'),
+                              compress(data, -zlib.MAX_WBITS)))
+
+    def test_raw_deflate_bytewise(self):
+        data = b'raw deflate data ' * 100
+        self.assertEqual(
+            data, self.decode(ContentDecoder('deflate'),
+                              compress(data, -zlib.MAX_WBITS), size=1))
+
+    def test_broken(self):
+        decoder = ContentDecoder('gzip')
+        self.assertRaises(
+            DecompressionError, decoder.decompress, b'not gzip data')
+
+    def test_ratio(self):
+        data = compress(bytes(10 * 1024 * 1024))
+        decoder = ContentDecoder('deflate', max_ratio=100)
+        self.assertRaises(DecompressionError, self.decode, decoder, data)
+
+        decoder = ContentDecoder('deflate', max_ratio=None)
+        self.assertEqual(10 * 1024 * 1024, len(self.decode(decoder, data)))
+
+    def fake_decoder(self, expand):
+        # stands for brotli/zstd decoder without output limit
+        decoder = ContentDecoder('deflate')
+        decoder._zlib = None
+        decoder._head = None
+        decoder._decompress = lambda data: data * expand
+        return decoder
+
+    def test_sliced_decoder_max_length(self):
+        decoder = self.fake_decoder(2)
+        data = bytes(range(256)) * 64
+
+        chunk = decoder.decompress(data, 1024)
+        self.assertEqual(1024, len(chunk))
+        self.assertTrue(decoder.pending)
+        self.assertLessEqual(
+            len(decoder._out), 2 * utils.DECODE_SLICE_SIZE)
+
+        out = [chunk]
+        while decoder.pending:
+            out.append(decoder.decompress(b'', 1024))
+        out.append(decoder.flush())
+        self.assertEqual(2 * len(data), len(b''.join(out)))
+
+    def test_sliced_decoder_ratio(self):
+        decoder = self.fake_decoder(1000)
+        decoder.max_ratio = 100
+
+        calls = []
+
+        def decompress(data):
+            calls.append(data)
+            return data * 1000
+        decoder._decompress = decompress
+
+        data = b'x' * (utils.DECODE_SLICE_SIZE * 100)
+        self.assertRaises(DecompressionError, decoder.decompress, data)
+        self.assertLess(len(calls), 100)
+
+    def test_unsupported(self):
+        self.assertFalse(ContentDecoder.supported('compress'))
+        self.assertRaises(ValueError, ContentDecoder, 'compress')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+""" websocket masking micro-benchmark """
+import os
+import sys
+import time
+
+import wsproto
+
+
+def _mask_loop(mask, data):
+    payload = bytearray(data)
+    for i in range(len(payload)):
+        payload[i] = payload[i] ^ mask[i % 4]
+    return payload
+
+
+def bench(name, func, mask, data, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(mask, data)
+    elapsed = time.perf_counter() - start
+
+    mbs = len(data) * repeat / elapsed / (1 << 20)
+    print('%-8s %10d bytes %12.1f MB/s' % (name, len(data), mbs))
+
+
+def main():
+    mask = os.urandom(4)
+    sizes = [int(s) for s in sys.argv[1:]] or [125, 4096, 65536, 1 << 20]
+
+    engines = [('int', wsproto._websocket_mask_int)]
+    if wsproto.numpy is not None:
+        engines.append(('numpy', wsproto._websocket_mask_numpy))
+
+    for size in sizes:
+        data = os.urandom(size)
+        repeat = max(1, (64 << 20) // size)
+
+        assert bytes(_mask_loop(mask, data)) == bytes(
+            wsproto.websocket_mask(mask, data))
+
+        bench('loop', _mask_loop, mask, data, max(1, repeat // 100))
+        for name, func in engines:
+            bench(name, func, mask, data, repeat)
+
+
+if __name__ == '__main__':
+    main()
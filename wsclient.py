@@ -5,7 +5,7 @@ import sys
 
 import tulip
 
-from wsproto import WebSocketProto
+from wsproto import WebSocketProto, PerMessageDeflate
 
 
 @tulip.coroutine
@@ -54,7 +54,7 @@ def main():
     name = input('Please enter your name: ').encode()
 
     url = 'http://localhost:8080'
-    wsclient = WebSocketProto()
+    wsclient = WebSocketProto(deflate=PerMessageDeflate())
 
     loop = tulip.get_event_loop()
     try:
@@ -1,13 +1,30 @@
 import base64
+import collections
 import hashlib
 import os
 import struct
+import sys
+import zlib
 
 import tulip
 import httpclient
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 WS_KEY = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
 
+# buffers smaller than this are joined before write
+WRITE_COALESCE_SIZE = 16 * 1024
+
+# outbound bytes queued for paused transport before peer is dropped
+HIGH_WATER = 1024 * 1024
+
+# max size of decompressed message
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
 BAD_REQUEST = ('400 Bad Request\r\n',
                [(b'Connection: close\r\n'), (b'Content-Length: 0\r\n')])
 
@@ -16,6 +33,258 @@ class WebSocketError(Exception):
     pass
 
 
+class FrameTooLargeException(WebSocketError):
+    pass
+
+
+class MessageTooLargeException(WebSocketError):
+    pass
+
+
+def _websocket_mask_int(mask, data):
+    """Apply 4-byte mask to data with a single big-int xor."""
+    datalen = len(data)
+    if not datalen:
+        return b''
+
+    data = int.from_bytes(data, sys.byteorder)
+    mask = int.from_bytes(
+        mask * (datalen // 4) + mask[:datalen % 4], sys.byteorder)
+    return (data ^ mask).to_bytes(datalen, sys.byteorder)
+
+
+def _websocket_mask_numpy(mask, data):
+    """Apply 4-byte mask to data with numpy uint32 xor."""
+    datalen = len(data)
+    if datalen < 1024:
+        return _websocket_mask_int(mask, data)
+
+    tail = datalen % 4
+    result = numpy.frombuffer(data, dtype=numpy.uint8).copy()
+    words = result[:datalen - tail].view(numpy.uint32)
+    words ^= numpy.frombuffer(mask, dtype=numpy.uint32)[0]
+    for i in range(datalen - tail, datalen):
+        result[i] ^= mask[i % 4]
+    return result.tobytes()
+
+
+if numpy is not None:
+    websocket_mask = _websocket_mask_numpy
+else:
+    websocket_mask = _websocket_mask_int
+
+
+def _frame_header(opcode, length, mask_bit=0, rsv1=False):
+    header = bytes([(0xC0 if rsv1 else 0x80) | opcode])
+
+    if length < 126:
+        header += bytes([mask_bit | length])
+    elif length < (1 << 16):
+        header += bytes([mask_bit | 126]) + struct.pack('!H', length)
+    elif length < (1 << 63):
+        header += bytes([mask_bit | 127]) + struct.pack('!Q', length)
+    else:
+        raise FrameTooLargeException()
+
+    return header
+
+
+def parse_extensions(value):
+    """Parse Sec-WebSocket-Extensions header value to list of
+    (name, {param: value}) tuples, value is None for flag params."""
+    extensions = []
+    for item in value.split(','):
+        name, *params = [p.strip() for p in item.split(';')]
+        if not name:
+            continue
+
+        options = {}
+        for param in params:
+            if not param:
+                continue
+            key, sep, val = param.partition('=')
+            options[key.strip().lower()] = (
+                val.strip().strip('"') if sep else None)
+        extensions.append((name.lower(), options))
+
+    return extensions
+
+
+class PerMessageDeflate:
+    """permessage-deflate extension (RFC 7692).
+
+    window_bits: LZ77 window of own compressor, 9..15
+    context_takeover: keep compressor state between messages
+    min_size: messages shorter than this are sent uncompressed
+    level: zlib compression level
+    max_size: max size of decompressed message, MessageTooLargeException
+      is raised for larger messages, None disables the check
+    """
+
+    name = 'permessage-deflate'
+    TAIL = b'\x00\x00\xff\xff'
+
+    def __init__(self, window_bits=zlib.MAX_WBITS, context_takeover=True,
+                 min_size=64, level=zlib.Z_DEFAULT_COMPRESSION,
+                 max_size=MAX_MESSAGE_SIZE):
+        if not 9 <= window_bits <= zlib.MAX_WBITS:
+            raise ValueError('window_bits must be in 9..15 range')
+
+        self.window_bits = window_bits
+        self.context_takeover = context_takeover
+        self.min_size = min_size
+        self.level = level
+        self.max_size = max_size
+
+        self._compress_bits = window_bits
+        self._compress_takeover = context_takeover
+        self._compressor = None
+        self._decompressor = None
+
+    def offer(self):
+        """Client offer for Sec-WebSocket-Extensions header."""
+        offer = [self.name, 'client_max_window_bits']
+        if self.window_bits < zlib.MAX_WBITS:
+            offer[1] += '=%d' % self.window_bits
+        if not self.context_takeover:
+            offer.append('client_no_context_takeover')
+        return '; '.join(offer)
+
+    def accept(self, params):
+        """Server side, accept client offer. Returns response
+        Sec-WebSocket-Extensions value or None if offer is rejected."""
+        response = [self.name]
+
+        bits = self.window_bits
+        if 'server_max_window_bits' in params:
+            try:
+                bits = min(bits, int(params['server_max_window_bits']))
+            except (TypeError, ValueError):
+                return None
+            if bits < 9:
+                return None
+            response.append('server_max_window_bits=%d' % bits)
+
+        takeover = self.context_takeover
+        if 'server_no_context_takeover' in params:
+            takeover = False
+        if not takeover:
+            response.append('server_no_context_takeover')
+
+        if 'client_no_context_takeover' in params:
+            response.append('client_no_context_takeover')
+
+        self._compress_bits = bits
+        self._compress_takeover = takeover
+        return '; '.join(response)
+
+    def configure(self, params):
+        """Client side, apply server response parameters."""
+        bits = self.window_bits
+        if params.get('client_max_window_bits'):
+            bits = min(bits, int(params['client_max_window_bits']))
+
+        self._compress_bits = bits
+        self._compress_takeover = (
+            self.context_takeover and
+            'client_no_context_takeover' not in params)
+
+    def compress(self, data):
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, -self._compress_bits)
+
+        data = (self._compressor.compress(data) +
+                self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        if data.endswith(self.TAIL):
+            data = data[:-4]
+
+        if not self._compress_takeover:
+            self._compressor = None
+
+        return data
+
+    def decompress(self, data):
+        # window of peer is never larger than max window
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        if self.max_size is None:
+            return self._decompressor.decompress(data + self.TAIL)
+
+        data = self._decompressor.decompress(
+            data + self.TAIL, self.max_size + 1)
+        if len(data) > self.max_size:
+            # decompressor state is broken, connection must be closed
+            self._decompressor = None
+            raise MessageTooLargeException(
+                'Decompressed message exceeds %s bytes' % self.max_size)
+        return data
+
+
+class OutboundQueue:
+    """Write stream of one connection.
+
+    Frames are written to transport directly, while transport is paused
+    (see pause_writing() protocol callback) they are queued.
+    If queued size goes above high_water, slow peer is dropped,
+    or with drop_slow=False new frames are skipped until queue drains.
+    Each write() and writelines() call must carry whole frames, its
+    buffers are queued or skipped together.
+    """
+
+    def __init__(self, transport, high_water=HIGH_WATER, drop_slow=True):
+        self.transport = transport
+        self.high_water = high_water
+        self.drop_slow = drop_slow
+        self.skipped = 0
+        self.paused = False
+        self.dropped = False
+        self.size = 0
+        self._frames = collections.deque()
+
+    def write(self, data):
+        self.writelines((data,))
+
+    def writelines(self, list_of_data):
+        if self.dropped:
+            return
+
+        if not self.paused:
+            for data in list_of_data:
+                self.transport.write(data)
+            return
+
+        list_of_data = list(list_of_data)
+        size = sum(len(data) for data in list_of_data)
+        if self.size + size > self.high_water:
+            if self.drop_slow:
+                self.drop()
+            else:
+                self.skipped += 1
+        else:
+            self._frames.extend(list_of_data)
+            self.size += size
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+        frames = self._frames
+        while frames and not self.paused and not self.dropped:
+            data = frames.popleft()
+            self.size -= len(data)
+            self.transport.write(data)
+
+    def drop(self):
+        self.dropped = True
+        self._frames.clear()
+        self.size = 0
+        self.transport.close()
+
+
 class WebSocketProto:
 
     OPCODE_TEXT = 0x1
@@ -27,7 +296,9 @@ class WebSocketProto:
     _rstream = None
     _wstream = None
 
-    def __init__(self):
+    def __init__(self, deflate=None):
+        self.masking = False  # client must mask frames
+        self.deflate = deflate  # PerMessageDeflate, set if negotiated
         self.close_code = None
         self.close_message = None
         self._reading = False
@@ -54,29 +325,46 @@ class WebSocketProto:
             return BAD_REQUEST
 
         # prepare response
-        return ('101 Switching Protocols\r\n',
-                [(b"Upgrade: websocket\r\n"),
-                 (b"Connection: Upgrade\r\n"),
-                 (b"Transfer-Encoding: chunked\r\n"),
-                 (b"Sec-WebSocket-Accept: " + base64.b64encode(
-                     hashlib.sha1(key.encode() + WS_KEY).digest()) +
-                  b'\r\n')])
+        headers = [(b"Upgrade: websocket\r\n"),
+                   (b"Connection: Upgrade\r\n"),
+                   (b"Transfer-Encoding: chunked\r\n"),
+                   (b"Sec-WebSocket-Accept: " + base64.b64encode(
+                       hashlib.sha1(key.encode() + WS_KEY).digest()) +
+                    b'\r\n')]
+
+        # extensions
+        deflate, self.deflate = self.deflate, None
+        if deflate is not None:
+            offers = parse_extensions(
+                environ.get('SEC-WEBSOCKET-EXTENSIONS', ''))
+            for name, params in offers:
+                if name == deflate.name:
+                    accepted = deflate.accept(params)
+                    if accepted is not None:
+                        self.deflate = deflate
+                        headers.append(
+                            b'Sec-WebSocket-Extensions: ' +
+                            accepted.encode() + b'\r\n')
+                        break
+
+        return ('101 Switching Protocols\r\n', headers)
 
     @tulip.coroutine
     def connect(self, url):
         self.url = url
         self.sec_key = base64.b64encode(os.urandom(16))
 
+        headers = {
+            'UPGRADE': 'WebSocket',
+            'CONNECTION': 'Upgrade',
+            'SEC-WEBSOCKET-VERSION': '13',
+            'SEC-WEBSOCKET-KEY': self.sec_key.decode(),
+        }
+        if self.deflate is not None:
+            headers['SEC-WEBSOCKET-EXTENSIONS'] = self.deflate.offer()
+
         self._wstream, fut = yield from httpclient.stream(
-            'get', self.url,
-            headers={
-                'UPGRADE': 'WebSocket',
-                'CONNECTION': 'Upgrade',
-                'SEC-WEBSOCKET-VERSION': '13',
-                'SEC-WEBSOCKET-KEY': self.sec_key.decode(),
-            },
-            timeout=1.0
-        )
+            'get', self.url, headers=headers, timeout=1.0)
 
         response = yield from fut
         headers = response.headers
@@ -96,8 +384,18 @@ class WebSocketProto:
         if key != match:
             raise ValueError("Handshake error - Invalid challenge response")
 
+        deflate, self.deflate = self.deflate, None
+        for name, params in parse_extensions(
+                headers.get('sec-websocket-extensions', '')):
+            if deflate is None or name != deflate.name:
+                raise ValueError(
+                    "Handshake error - Unexpected extension %r" % name)
+            deflate.configure(params)
+            self.deflate = deflate
+
         self._rstream = response.stream
         self._response = response
+        self.masking = True
 
     def _parse_header(self, data):
         if len(data) != 2:
@@ -118,7 +416,13 @@ class WebSocketProto:
         # frame-rsv1 = %x0 ; 1 bit, MUST be 0 unless negotiated otherwise
         # frame-rsv2 = %x0 ; 1 bit, MUST be 0 unless negotiated otherwise
         # frame-rsv3 = %x0 ; 1 bit, MUST be 0 unless negotiated otherwise
-        if rsv1 or rsv2 or rsv3:
+        # rsv1 marks compressed message (permessage-deflate),
+        # only first frame of data message can have it set
+        bad_rsv1 = rsv1 and (
+            self.deflate is None or
+            opcode not in (self.OPCODE_TEXT, self.OPCODE_BINARY))
+
+        if bad_rsv1 or rsv2 or rsv3:
             self.close(1002)
             raise WebSocketError(
                 'Received frame with non-zero reserved bits: %r' % str(data))
@@ -151,7 +455,7 @@ class WebSocketProto:
                 "Control frame payload cannot be larger than 125 "
                 "bytes: %r" % str(data))
 
-        return fin, opcode, has_mask, length
+        return fin, opcode, has_mask, length, rsv1
 
     def _receive_frame(self):
         """Return the next frame from the socket."""
@@ -161,7 +465,7 @@ class WebSocketProto:
         if not data0:
             return
 
-        fin, opcode, has_mask, length = self._parse_header(data0)
+        fin, opcode, has_mask, length, rsv1 = self._parse_header(data0)
 
         if not has_mask:
             mask = None
@@ -196,8 +500,6 @@ class WebSocketProto:
                     'Incomplete read while reading mask: %r' % (
                         data0 + data1 + mask))
 
-            mask = struct.unpack('!BBBB', mask)
-
         if length:
             payload = yield from stream.read(length)
             if len(payload) != length:
@@ -208,18 +510,15 @@ class WebSocketProto:
         else:
             payload = b''
 
-        if payload:
-            payload = bytearray(payload)
-
-            if mask:
-                for i in range(len(payload)):
-                    payload[i] = payload[i] ^ mask[i % 4]
+        if payload and mask:
+            payload = websocket_mask(mask, payload)
 
-        return fin, opcode, payload
+        return fin, opcode, payload, rsv1
 
     def _receive(self):
         """Return the next text or binary message from the socket."""
         opcode = None
+        compressed = False
         result = bytearray()
 
         while True:
@@ -235,11 +534,12 @@ class WebSocketProto:
                     raise WebSocketError('Peer closed connection unexpectedly')
                 return
 
-            f_fin, f_opcode, f_payload = frame
+            f_fin, f_opcode, f_payload, f_rsv1 = frame
 
             if f_opcode in (self.OPCODE_TEXT, self.OPCODE_BINARY):
                 if opcode is None:
                     opcode = f_opcode
+                    compressed = f_rsv1
                 else:
                     raise WebSocketError(
                         'The opcode in non-fin frame is expected '
@@ -283,6 +583,16 @@ class WebSocketProto:
             if f_fin:
                 break
 
+        if compressed:
+            try:
+                result = self.deflate.decompress(bytes(result))
+            except zlib.error as exc:
+                self.close(1007)
+                raise WebSocketError('Invalid compressed message: %s' % exc)
+            except MessageTooLargeException:
+                self.close(1009)
+                raise
+
         if opcode == self.OPCODE_TEXT:
             return result, False
         elif opcode == self.OPCODE_BINARY:
@@ -307,21 +617,55 @@ class WebSocketProto:
                 self.close(1007)
                 raise
 
-    def _send_frame(self, message, opcode):
-        """Send a frame over the websocket with message as its payload"""
-        header = bytes([0x80 | opcode])
-        msg_length = len(message)
-
-        if msg_length < 126:
-            header += bytes([msg_length])
-        elif msg_length < (1 << 16):
-            header += bytes([126]) + struct.pack('!H', msg_length)
-        elif msg_length < (1 << 63):
-            header += bytes([127]) + struct.pack('!Q', msg_length)
+    def _build_frame(self, message, opcode):
+        """Return frame as (header, payload) buffers"""
+        rsv1 = False
+        if (self.deflate is not None and opcode < 0x8 and
+                len(message) >= self.deflate.min_size):
+            message = self.deflate.compress(message)
+            rsv1 = True
+
+        mask_bit = 0x80 if self.masking else 0
+        header = _frame_header(opcode, len(message), mask_bit, rsv1)
+
+        if self.masking:
+            mask = os.urandom(4)
+            header += mask
+            message = websocket_mask(mask, message)
+
+        return header, message
+
+    def _write(self, buffers):
+        """Write buffers, small buffers are joined to one write,
+        large payloads are written as is without copying."""
+        out = []
+        small = []
+
+        for buf in buffers:
+            if len(buf) < WRITE_COALESCE_SIZE:
+                small.append(buf)
+            else:
+                if small:
+                    out.append(b''.join(small))
+                    small = []
+                out.append(buf)
+
+        if small:
+            out.append(b''.join(small))
+
+        if len(out) == 1:
+            self._wstream.write(out[0])
         else:
-            raise FrameTooLargeException()
+            writelines = getattr(self._wstream, 'writelines', None)
+            if writelines is not None:
+                writelines(out)
+            else:
+                for buf in out:
+                    self._wstream.write(buf)
 
-        self._wstream.write(header + message)
+    def _send_frame(self, message, opcode):
+        """Send a frame over the websocket with message as its payload"""
+        self._write(self._build_frame(message, opcode))
 
     def send(self, message, binary=False):
         """Send a frame over the websocket with message as its payload"""
@@ -330,6 +674,31 @@ class WebSocketProto:
         else:
             return self._send_frame(message, self.OPCODE_TEXT)
 
+    @classmethod
+    def encode_frame(cls, message, binary=False):
+        """Build unmasked frame once, for send_frame() to many
+        server side connections"""
+        opcode = cls.OPCODE_BINARY if binary else cls.OPCODE_TEXT
+        return _frame_header(opcode, len(message)) + message
+
+    def send_frame(self, frame):
+        """Send frame built by encode_frame()"""
+        if self.masking:
+            raise WebSocketError('Client frames must be masked')
+        self._wstream.write(frame)
+
+    def send_many(self, messages, binary=False):
+        """Send a frame for each message, small frames are written
+        to transport together"""
+        opcode = self.OPCODE_BINARY if binary else self.OPCODE_TEXT
+
+        buffers = []
+        for message in messages:
+            buffers.extend(self._build_frame(message, opcode))
+
+        if buffers:
+            self._write(buffers)
+
     def close(self, code=1000, message=b''):
         """Close the websocket, sending the specified code and message"""
         if not self._closed:
@@ -0,0 +1,377 @@
+"""Tests for wsproto.py"""
+
+import base64
+import struct
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import tasks
+
+import wsproto
+from wsproto import OutboundQueue, PerMessageDeflate, WebSocketProto
+from wsproto import MessageTooLargeException, WebSocketError
+
+
+def mask_bytewise(mask, data):
+    return bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+class MaskTests(unittest.TestCase):
+
+    mask = b'\x01\x7f\x80\xff'
+
+    def check(self, func):
+        for size in (0, 1, 3, 4, 5, 1023, 1024, 1025, 1027, 4096):
+            data = bytes(i % 251 for i in range(size))
+            self.assertEqual(
+                mask_bytewise(self.mask, data), func(self.mask, data), size)
+
+    def test_mask_int(self):
+        self.check(wsproto._websocket_mask_int)
+
+    @unittest.skipIf(wsproto.numpy is None, 'numpy is not installed')
+    def test_mask_numpy(self):
+        self.check(wsproto._websocket_mask_numpy)
+
+    def test_mask_roundtrip(self):
+        data = b'x' * 2000
+        self.assertEqual(data, wsproto.websocket_mask(
+            self.mask, wsproto.websocket_mask(self.mask, data)))
+
+    def test_mask_bytearray(self):
+        data = bytearray(b'abcdef')
+        self.assertEqual(mask_bytewise(self.mask, data),
+                         wsproto.websocket_mask(self.mask, data))
+
+
+class WriteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = unittest.mock.Mock()
+        self.ws = WebSocketProto()
+        self.ws._wstream = self.stream
+
+    def test_send_small(self):
+        self.ws.send(b'data', binary=True)
+        self.stream.write.assert_called_once_with(b'\x82\x04data')
+        self.assertFalse(self.stream.writelines.called)
+
+    def test_send_large(self):
+        payload = b'x' * wsproto.WRITE_COALESCE_SIZE
+        self.ws.send(payload, binary=True)
+        header, data = self.stream.writelines.call_args[0][0]
+        self.assertEqual(b'\x82\x7e' + struct.pack('!H', len(payload)),
+                         header)
+        self.assertIs(payload, data)
+
+    def test_send_many_coalesced(self):
+        self.ws.send_many([b'a', b'bc', b'def'])
+        self.stream.write.assert_called_once_with(
+            b'\x81\x01a\x81\x02bc\x81\x03def')
+        self.assertFalse(self.stream.writelines.called)
+
+    def test_send_many_large(self):
+        payload = b'x' * wsproto.WRITE_COALESCE_SIZE
+        self.ws.send_many([b'a', payload, b'b'], binary=True)
+
+        header = b'\x82\x7e' + struct.pack('!H', len(payload))
+        buffers = self.stream.writelines.call_args[0][0]
+        self.assertEqual([b'\x82\x01a' + header, payload, b'\x82\x01b'],
+                         buffers)
+        self.assertIs(payload, buffers[1])
+
+    def test_send_many_empty(self):
+        self.ws.send_many([])
+        self.assertFalse(self.stream.write.called)
+        self.assertFalse(self.stream.writelines.called)
+
+    def test_send_many_masked(self):
+        self.ws.masking = True
+        self.ws.send_many([b'a', b'bc'])
+
+        data = self.stream.write.call_args[0][0]
+        self.assertEqual(2 + 4 + 1 + 2 + 4 + 2, len(data))
+        self.assertEqual(b'\x81\x81', data[:2])
+        self.assertEqual(b'a', wsproto.websocket_mask(data[2:6], data[6:7]))
+        self.assertEqual(b'\x81\x82', data[7:9])
+        self.assertEqual(b'bc', wsproto.websocket_mask(data[9:13], data[13:]))
+
+    def test_write_without_writelines(self):
+        stream = self.ws._wstream = unittest.mock.Mock(spec=['write'])
+        payload = b'x' * wsproto.WRITE_COALESCE_SIZE
+        self.ws.send_many([b'a', payload])
+        self.assertEqual(2, stream.write.call_count)
+
+
+class PerMessageDeflateTests(unittest.TestCase):
+
+    def test_offer(self):
+        self.assertEqual('permessage-deflate; client_max_window_bits',
+                         PerMessageDeflate().offer())
+        self.assertEqual(
+            'permessage-deflate; client_max_window_bits=10; '
+            'client_no_context_takeover',
+            PerMessageDeflate(10, context_takeover=False).offer())
+
+    def test_window_bits(self):
+        self.assertRaises(ValueError, PerMessageDeflate, 8)
+        self.assertRaises(ValueError, PerMessageDeflate, 16)
+
+    def test_accept(self):
+        deflate = PerMessageDeflate()
+        self.assertEqual('permessage-deflate', deflate.accept({}))
+
+        params = wsproto.parse_extensions(
+            'permessage-deflate; server_max_window_bits=10; '
+            'client_no_context_takeover')[0][1]
+        self.assertEqual(
+            'permessage-deflate; server_max_window_bits=10; '
+            'client_no_context_takeover', deflate.accept(params))
+        self.assertEqual(10, deflate._compress_bits)
+
+        deflate.accept({'server_no_context_takeover': None})
+        self.assertFalse(deflate._compress_takeover)
+
+    def test_accept_rejected(self):
+        deflate = PerMessageDeflate()
+        self.assertIsNone(deflate.accept({'server_max_window_bits': '8'}))
+        self.assertIsNone(deflate.accept({'server_max_window_bits': 'x'}))
+        self.assertIsNone(deflate.accept({'server_max_window_bits': None}))
+
+    def test_configure(self):
+        deflate = PerMessageDeflate()
+        deflate.configure({'client_max_window_bits': '9',
+                           'client_no_context_takeover': None})
+        self.assertEqual(9, deflate._compress_bits)
+        self.assertFalse(deflate._compress_takeover)
+
+        deflate.configure({})
+        self.assertEqual(15, deflate._compress_bits)
+        self.assertTrue(deflate._compress_takeover)
+
+    def test_roundtrip(self):
+        server, client = PerMessageDeflate(), PerMessageDeflate()
+        messages = [b'hello world' * 10, b'', b'hello world' * 10,
+                    bytes(range(256)) * 100]
+
+        sizes = []
+        for message in messages:
+            data = server.compress(message)
+            self.assertFalse(data.endswith(PerMessageDeflate.TAIL))
+            self.assertEqual(message, client.decompress(data))
+            sizes.append(len(data))
+
+        # repeated message refers to previous one
+        self.assertLess(sizes[2], sizes[0])
+
+    def test_roundtrip_no_context_takeover(self):
+        server, client = PerMessageDeflate(), PerMessageDeflate()
+        server.accept({'server_no_context_takeover': None})
+
+        first = server.compress(b'hello world' * 10)
+        second = server.compress(b'hello world' * 10)
+        self.assertEqual(first, second)
+        self.assertEqual(b'hello world' * 10, client.decompress(first))
+        self.assertEqual(b'hello world' * 10, client.decompress(second))
+
+    def test_roundtrip_window_bits(self):
+        client, server = PerMessageDeflate(9), PerMessageDeflate()
+        client.configure({'client_max_window_bits': '9'})
+
+        message = bytes(range(256)) * 10
+        self.assertEqual(message, server.decompress(client.compress(message)))
+
+    def test_decompress_max_size(self):
+        data = PerMessageDeflate().compress(b'x' * 1001)
+
+        self.assertEqual(
+            b'x' * 1001, PerMessageDeflate(max_size=1001).decompress(data))
+        self.assertEqual(
+            b'x' * 1001, PerMessageDeflate(max_size=None).decompress(data))
+
+        deflate = PerMessageDeflate(max_size=1000)
+        self.assertRaises(MessageTooLargeException, deflate.decompress, data)
+
+
+class ServeTests(unittest.TestCase):
+
+    def environ(self, **kwargs):
+        environ = {'UPGRADE': 'websocket',
+                   'CONNECTION': 'Upgrade',
+                   'SEC-WEBSOCKET-VERSION': '13',
+                   'SEC-WEBSOCKET-KEY': base64.b64encode(
+                       b'x' * 16).decode()}
+        environ.update(kwargs)
+        return environ
+
+    def serve(self, environ):
+        ws = WebSocketProto(deflate=PerMessageDeflate())
+        status, headers = ws.serve(environ, None, None)
+        return ws, headers
+
+    def test_deflate_negotiated(self):
+        ws, headers = self.serve(self.environ(**{
+            'SEC-WEBSOCKET-EXTENSIONS':
+            'x-foo, permessage-deflate; client_max_window_bits'}))
+        self.assertIsNotNone(ws.deflate)
+        self.assertIn(b'Sec-WebSocket-Extensions: permessage-deflate\r\n',
+                      headers)
+
+    def test_deflate_not_offered(self):
+        ws, headers = self.serve(self.environ())
+        self.assertIsNone(ws.deflate)
+        self.assertFalse(
+            [h for h in headers if h.startswith(b'Sec-WebSocket-Ext')])
+
+    def test_deflate_offer_rejected(self):
+        ws, headers = self.serve(self.environ(**{
+            'SEC-WEBSOCKET-EXTENSIONS':
+            'permessage-deflate; server_max_window_bits=8'}))
+        self.assertIsNone(ws.deflate)
+
+
+class ReceiveTests(unittest.TestCase):
+    """protocol errors close connection and receive() returns None"""
+
+    def setUp(self):
+        self.event_loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.event_loop)
+
+        self.written = []
+        self.ws = WebSocketProto(deflate=PerMessageDeflate())
+        self.ws._rstream = tulip.StreamReader()
+        self.ws._wstream = unittest.mock.Mock()
+        self.ws._wstream.write.side_effect = self.written.append
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def feed(self, *frames):
+        for frame in frames:
+            self.ws._rstream.feed_data(frame)
+        self.ws._rstream.feed_eof()
+
+    def receive(self):
+        return self.event_loop.run_until_complete(
+            tasks.Task(self.ws.receive()))
+
+    def close_code(self):
+        frame = self.written[-1]
+        self.assertEqual(0x88, frame[0])
+        return struct.unpack('!H', frame[2:4])[0]
+
+    def test_compressed(self):
+        message = b'hello world' * 10
+        data = PerMessageDeflate().compress(message)
+        self.feed(wsproto._frame_header(0x2, len(data), rsv1=True) + data)
+        self.assertEqual(message, self.receive())
+
+    def test_compressed_fragmented(self):
+        data = PerMessageDeflate().compress(b'hello world' * 10)
+        self.feed(b'\x41\x05' + data[:5],
+                  b'\x80' + bytes([len(data) - 5]) + data[5:])
+        self.assertEqual('hello world' * 10, self.receive())
+
+    def test_uncompressed(self):
+        self.feed(wsproto._frame_header(0x1, 5) + b'hello')
+        self.assertEqual('hello', self.receive())
+
+    def test_rsv1_not_negotiated(self):
+        self.ws.deflate = None
+        self.feed(wsproto._frame_header(0x1, 5, rsv1=True) + b'hello')
+        self.assertIsNone(self.receive())
+        self.assertEqual(1002, self.close_code())
+
+    def test_rsv1_control_frame(self):
+        self.feed(wsproto._frame_header(0x9, 0, rsv1=True))
+        self.assertIsNone(self.receive())
+        self.assertEqual(1002, self.close_code())
+
+    def test_rsv1_continuation_frame(self):
+        # rsv1 is allowed on first frame of message only
+        self.feed(b'\x01\x02he', b'\xc0\x03llo')
+        self.assertIsNone(self.receive())
+        self.assertEqual(1002, self.close_code())
+
+    def test_rsv2_rsv3(self):
+        for first in (0xA1, 0x91):
+            self.setUp()
+            self.feed(bytes([first, 0]))
+            self.assertIsNone(self.receive())
+            self.assertEqual(1002, self.close_code())
+            self.tearDown()
+
+    def test_invalid_compressed_data(self):
+        self.feed(wsproto._frame_header(0x2, 4, rsv1=True) + b'\xff' * 4)
+        self.assertRaises(WebSocketError, self.receive)
+        self.assertEqual(1007, self.close_code())
+
+    def test_message_too_big(self):
+        self.ws.deflate.max_size = 1000
+        data = PerMessageDeflate().compress(b'x' * 1001)
+        self.feed(wsproto._frame_header(0x2, len(data), rsv1=True) + data)
+        self.assertRaises(MessageTooLargeException, self.receive)
+        self.assertEqual(1009, self.close_code())
+
+
+class OutboundQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = unittest.mock.Mock()
+        self.written = []
+        self.transport.write.side_effect = self.written.append
+
+    def test_write_through(self):
+        queue = OutboundQueue(self.transport)
+        queue.writelines([b'ab', b'cd'])
+        self.assertEqual([b'ab', b'cd'], self.written)
+
+    def test_queue_while_paused(self):
+        queue = OutboundQueue(self.transport)
+        queue.pause()
+        queue.writelines([b'ab', b'cd'])
+        self.assertEqual([], self.written)
+        self.assertEqual(4, queue.size)
+
+        queue.resume()
+        self.assertEqual([b'ab', b'cd'], self.written)
+        self.assertEqual(0, queue.size)
+
+    def test_drop_slow(self):
+        queue = OutboundQueue(self.transport, high_water=3)
+        queue.pause()
+        queue.writelines([b'ab', b'cd'])
+        self.assertTrue(queue.dropped)
+        self.assertTrue(self.transport.close.called)
+
+    def test_skip_whole_frame(self):
+        queue = OutboundQueue(self.transport, high_water=10, drop_slow=False)
+        queue.pause()
+
+        # header fits, payload does not: neither is queued
+        queue.writelines([b'hh', b'p' * 10])
+        self.assertEqual(1, queue.skipped)
+        self.assertEqual(0, queue.size)
+
+        queue.writelines([b'hh', b'pppp'])
+        queue.resume()
+        self.assertEqual([b'hh', b'pppp'], self.written)
+
+    def test_send_large_frame_skipped(self):
+        queue = OutboundQueue(
+            self.transport, high_water=1000, drop_slow=False)
+        queue.pause()
+
+        ws = WebSocketProto()
+        ws._wstream = queue
+        ws.send(b'x' * (wsproto.WRITE_COALESCE_SIZE + 1), binary=True)
+        ws.send(b'small', binary=True)
+        self.assertEqual(1, queue.skipped)
+
+        queue.resume()
+        self.assertEqual([b'\x82\x05small'], self.written)
+
+
+if __name__ == '__main__':
+    unittest.main()
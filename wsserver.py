@@ -5,12 +5,28 @@ import http.client
 import tulip
 from httpclient import ServerHttpProtocol
 
-from wsproto import WebSocketProto
+from wsproto import WebSocketProto, OutboundQueue, PerMessageDeflate
 
 
 class HttpServer(ServerHttpProtocol):
 
     _connections = []
+    _queue = None
+
+    def pause_writing(self):
+        if self._queue is not None:
+            self._queue.pause()
+
+    def resume_writing(self):
+        if self._queue is not None:
+            self._queue.resume()
+
+    def broadcast(self, message, exclude=None):
+        """Send message to all connections, frame is built once"""
+        frame = WebSocketProto.encode_frame(message)
+        for wsc in self._connections:
+            if wsc is not exclude:
+                wsc.send_frame(frame)
 
     @tulip.coroutine
     def handle_one_request(self, rline, message):
@@ -23,9 +39,10 @@ class HttpServer(ServerHttpProtocol):
 
         if 'websocket' in headers.get('UPGRADE', '').lower():
             # init ws
-            wsclient = WebSocketProto()
+            wsclient = WebSocketProto(deflate=PerMessageDeflate())
+            self._queue = OutboundQueue(self.transport)
             status, headers = wsclient.serve(
-                headers, self.transport, self.rstream)
+                headers, self._queue, self.rstream)
 
             write = self.transport.write
             write(b'HTTP/1.1 ' + status.encode())
@@ -48,13 +65,10 @@ class HttpServer(ServerHttpProtocol):
 
                         data = data.strip()
                         print(data)
-                        for wsc in self._connections:
-                            if wsc is not wsclient:
-                                wsc.send(data.encode())
+                        self.broadcast(data.encode(), exclude=wsclient)
 
                 print('Someone joined.')
-                for wsc in self._connections:
-                    wsc.send(b'Someone joined.')
+                self.broadcast(b'Someone joined.')
 
                 self._connections.append(wsclient)
                 t = tulip.Task(rstream())
@@ -64,8 +78,7 @@ class HttpServer(ServerHttpProtocol):
                 self._connections.remove(wsclient)
 
                 print('Someone disconnected.')
-                for wsc in self._connections:
-                    wsc.send(b'Someone disconnected.')
+                self.broadcast(b'Someone disconnected.')
         else:
             write = self.transport.write
             write(b'HTTP/1.0 200 Ok\r\n')